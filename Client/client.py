@@ -1,13 +1,16 @@
 import hashlib
+import itertools
 import json
 import socket
 import threading
 import time
+from concurrent.futures import Future, TimeoutError
 
 from lobby import Lobby
 
 from Client.Components.Notification import NotificationInterface
 from Client.lobby import Message
+from Server import Codec, Compression, Encryption, Protocol, Transport
 
 from dotenv import dotenv_values
 
@@ -15,27 +18,18 @@ from dotenv import dotenv_values
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
 
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-
 
 class ClientSocket:
+    # the tls connector of the process, it keeps the session of the last connection so a reconnect resumes it.
+    tls_connector: Transport.Connector = None
+
+    # the time in seconds the server has to answer the hello, the server's own handshake timeout.
+    HELLO_TIMEOUT = 10
+
     def __init__(self, application):
         """
         The client socket side, interact with the server to get and post data to the server.
         """
-
-        # Create a pair of public and private keys
-        # Generate RSA keys
-        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-        public_key = self.private_key.public_key()
-
-        # Serialize public key to send to client
-        public_pem = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-
         self.application = application
 
         self.config = dotenv_values(".env")
@@ -43,6 +37,14 @@ class ClientSocket:
         self.server_address = self.config["SERVER_ADDRESS"]
         self.server_port = int(self.config["SERVER_PORT"])
 
+        # the rsa key exchange (custom) or tls, must be the transport of the server.
+        self.transport = self.config.get("TRANSPORT", Transport.CUSTOM)
+
+        # a legacy server doesn't answer the hello, the legacy framing (aes-256-cfb with a checksum) is only used
+        # when it's asked for, never because the hello wasn't answered, so a busy server or a dropped hello
+        # can't downgrade the connection.
+        self.legacy_framing = self.config.get("LEGACY_FRAMING", "false").lower() == "true"
+
         # auth token
         self.token = None
 
@@ -56,70 +58,170 @@ class ClientSocket:
         # notifications
         self.notifications = []
 
-        self.requests_id_counter = 0
-        self.responses = {}
+        # the ids of the requests, next() on it is atomic.
+        self.requests_id_counter = itertools.count()
+
+        # request id: the future of its response, the responses may arrive in any order.
+        self.pending_requests = {}
+
+        # the framing version, the codec and the compression the server agreed on.
+        self.framing = Protocol.LEGACY_VERSION
+        self.codec = Codec.JSON
+        self.compression = Compression.NONE
+
+        # the preallocated receive buffer of the connection.
+        self.receive_buffer = None
+
+        # the messages must be sent in the order they were encrypted.
+        self.send_lock = threading.Lock()
 
         try:
-            self.socket = socket.socket()
-            self.socket.connect((self.server_address, self.server_port))
-            print("Connected to the server.")
+            aes_key, nonce = self.connect()
+
+            # negotiate the framing and the cipher of the messages.
+            if self.legacy_framing and self.transport != Transport.TLS:
+                hello = {}
+            else:
+                hello = self.send_hello()
 
-            print("Sending public key to the server.")
+            self.framing = Protocol.negotiate_version(hello)
+            self.codec = hello.get("Codec", Codec.JSON)
+            self.compression = hello.get("Compression", Compression.NONE)
+            cipher = hello.get("Cipher", Encryption.LEGACY_CIPHER)
 
-            self.socket.sendall(public_pem)
+            # create the channel, one for the whole connection.
+            if cipher == Encryption.TLS_CIPHER:
+                self.channel = Encryption.PlainChannel()
 
-            print("Waiting for aes key from the server.")
+                # the session ticket arrives after the handshake, it was read together with the hello.
+                self.tls_connector.save_session(self.socket, (self.server_address, self.server_port))
+            elif cipher in Encryption.CIPHERS:
+                self.channel = Encryption.SecureChannel(cipher, aes_key, nonce, False)
+            else:
+                self.channel = Encryption.LegacyChannel(aes_key, nonce)
 
-            # Receive aes key from the server
-            aes_key = self.socket.recv(1024)
+            print(f"Using framing version {self.framing} with {self.channel.name}, {self.codec} codec and {self.compression} compression.")
 
-            print("Received aes key from the server.")
+            self.receive_buffer = Protocol.ReceiveBuffer(self.socket)
 
-            # Decrypt the aes key using the private key
-            aes_key = self.private_key.decrypt(
-                aes_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            threading.Thread(target=self.listener, daemon=True).start()
 
-            # send confirmation to the server
-            self.socket.send("AES key received".encode('utf-8'))
+        except Exception as e:
+            print(e)
+
+    def connect(self) -> (bytes, bytes):
+        """
+        Connect to the server on the transport of the client.
+        :return: the aes key and the nonce of the rsa key exchange, None and None on tls.
+        """
+        if self.transport == Transport.TLS:
+            self.socket = self.connect_tls()
+            return None, None
+
+        self.socket = socket.socket()
+        self.socket.connect((self.server_address, self.server_port))
+        print("Connected to the server.")
+
+        return self.exchange_keys()
+
+    def send_hello(self) -> dict or None:
+        """
+        Send the hello of the client and read the hello of the server, waiting HELLO_TIMEOUT seconds at most.
+        :return: the hello of the server.
+        """
+        self.socket.sendall(Protocol.create_hello({"Version": Protocol.FRAMING_VERSION, "Ciphers": list(Encryption.CIPHERS), "Codecs": [Codec.BINARY],
+                                                   "Compression": list(Compression.METHODS), "Heartbeat": True}))
+
+        self.socket.settimeout(self.HELLO_TIMEOUT)
+
+        try:
+            hello = Protocol.read_hello(self.socket)
+        except socket.timeout:
+            self.socket.close()
+            raise ConnectionError(f"The server didn't answer the hello in {self.HELLO_TIMEOUT} seconds, "
+                                  f"set LEGACY_FRAMING=true in .env to connect to a legacy server.")
 
-            print("Decrypted aes key.")
+        self.socket.settimeout(None)
 
-            # get the nonce key from the server
+        return hello
 
-            nonce = self.socket.recv(1024)
+    def connect_tls(self):
+        """
+        Connect to the server over tls, resuming the session of the last connection if there is one.
+        :return: the tls connection.
+        """
+        if ClientSocket.tls_connector is None:
+            # TLS_CAFILE is the certificate of a server with a self-signed certificate.
+            ClientSocket.tls_connector = Transport.Connector(Transport.client_context(self.config.get("TLS_CAFILE")))
+
+        connection = self.tls_connector.connect((self.server_address, self.server_port), self.config.get("TLS_SERVER_NAME"))
+
+        print(f"Connected to the server with {connection.version()}{' (resumed)' if connection.session_reused else ''}.")
 
-            # Decrypt the nonce key using the private key
-            nonce = self.private_key.decrypt(
-                nonce,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
+        return connection
+
+    def exchange_keys(self) -> (bytes, bytes):
+        """
+        The rsa key exchange of the custom transport.
+        :return: the aes key and the nonce the server chose.
+        """
+        # Create a pair of public and private keys
+        # Generate RSA keys
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_key = self.private_key.public_key()
+
+        # Serialize public key to send to client
+        public_pem = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+        print("Sending public key to the server.")
+
+        self.socket.sendall(public_pem)
+
+        print("Waiting for aes key from the server.")
+
+        # Receive aes key from the server
+        aes_key = self.socket.recv(1024)
+
+        print("Received aes key from the server.")
+
+        # Decrypt the aes key using the private key
+        aes_key = self.private_key.decrypt(
+            aes_key,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
             )
+        )
+
+        # send confirmation to the server
+        self.socket.send("AES key received".encode('utf-8'))
+
+        print("Decrypted aes key.")
 
-            # send confirmation to the server
-            self.socket.send("Nonce key received".encode('utf-8'))
+        # get the nonce key from the server
 
-            print("Decrypted nonce key.")
+        nonce = self.socket.recv(1024)
 
-            # create a cipher
-            self.cipher = Cipher(
-                algorithms.AES(aes_key),
-                modes.CFB(nonce),
-                backend=default_backend()
+        # Decrypt the nonce key using the private key
+        nonce = self.private_key.decrypt(
+            nonce,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
             )
+        )
 
-            threading.Thread(target=self.listener, daemon=True).start()
+        # send confirmation to the server
+        self.socket.send("Nonce key received".encode('utf-8'))
 
-        except Exception as e:
-            print(e)
+        print("Decrypted nonce key.")
+
+        return aes_key, nonce
 
     def get_data(self, name: str):
         """
@@ -143,86 +245,120 @@ class ClientSocket:
 
     def encrypt(self, data: bytes) -> bytes:
         """
-        Encrypt the data using the aes encryptor.
+        Encrypt the data using the connection channel.
         :param data: the data to encrypt.
         :return: the encrypted data.
         """
-        # create the aes encryptor.
-        aes_encryptor = self.cipher.encryptor()
-
-        # encrypt the data using the aes encryptor.
-        return aes_encryptor.update(data) + aes_encryptor.finalize()
+        return self.channel.encrypt(data)
 
     def decrypt(self, data: bytes) -> bytes:
         """
-        Decrypt the data using the aes encryptor.
+        Decrypt the data using the connection channel.
         :param data: the data to decrypt.
         :return: the decrypted data.
         """
-        # create the aes decryptor.
-        aes_decryptor = self.cipher.decryptor()
-
-        # decrypt the data using the aes decryptor.
-        return aes_decryptor.update(data) + aes_decryptor.finalize()
+        return self.channel.decrypt(data)
 
     def send_request(self, command: str, data: dict, timeout=5) -> dict:
         """
-        Send request to the server.
+        Send request to the server and wait for its response.
         :param command:
         :param data:
         :param timeout: timeout of response in seconds.
-        :return: response of the server.
+        :return: response of the server, None if it didn't arrive in time.
+        """
+        future = self.submit_request(command, data)
+
+        if future is None:
+            return None
+
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            self.pending_requests.pop(future.rid, None)
+            print(f"Request {future.rid} ({command}) timed out.")
+
+    def submit_request(self, command: str, data: dict) -> Future or None:
+        """
+        Send request to the server without waiting for its response, so several requests may be in flight.
+        The server keeps the order of the requests of the same kind (the lobby and game requests, the friend requests),
+        the other responses may arrive in any order.
+        :param command:
+        :param data:
+        :return: the future of the response of the server (future.rid is the request id), None if sending failed.
         """
         # group all the response (except the checksum) into a json to calc the checksum.
-        rid = self.requests_id_counter
+        rid = next(self.requests_id_counter)
         request = {
             "Id": rid,
             "Command": command,
             "Data": data,
         }
 
-        self.requests_id_counter += 1
-
         if self.token is not None:
             request["Token"] = self.token
 
-        # calc the checksum, md5 to hex.
-        checksum = self.create_checksum(request)
+        # hot requests are sent in the binary form if the server agreed on it.
+        binary = Codec.encode(request) if self.codec == Codec.BINARY else None
+
+        # a cipher without a tag needs the md5 checksum.
+        if not self.channel.authenticated:
+            request["Checksum"] = self.create_checksum(request)
 
-        # add the checksum to the response
-        request["Checksum"] = checksum
+        future = Future()
+        future.rid = rid
+        future.add_done_callback(self.notify_error)
+
+        # registered before sending, the response may arrive before sendall returns.
+        self.pending_requests[rid] = future
 
         try:
             # stringify the json format and encode to bytes.
-            stringify_response = json.dumps(request).encode('utf-8')
+            if binary is not None:
+                stringify_response, flags = binary, Protocol.FLAG_BINARY
+            else:
+                stringify_response, flags = json.dumps(request).encode('utf-8'), 0
 
-            # encrypt the response using the aes encryptor.
-            encrypted_response = self.encrypt(stringify_response)
+            if self.framing != Protocol.LEGACY_VERSION:
+                # encrypt and send the request to the server in one write.
+                self.send_frame(Protocol.REQUEST, stringify_response, flags)
+                return future
 
-            # send the response to the client.
-            self.socket.sendall(encrypted_response)
+            with self.send_lock:
+                # encrypt the response using the connection channel.
+                encrypted_response = self.encrypt(stringify_response)
 
-            # send ending to server
-            self.socket.send("-- End Request --".encode('utf-8'))
+                # send the request to the server.
+                self.socket.sendall(encrypted_response)
 
-            start = time.time()
-            end_time = time.time()
+                # send ending to server
+                self.socket.send(Protocol.LEGACY_DELIMITER)
 
-            response = {}
+            return future
+        except Exception as e:
+            self.pending_requests.pop(rid, None)
+            print(e)
 
-            while rid not in self.responses and end_time - start < timeout:
-                end_time = time.time()
+    def send_frame(self, message_type: int, message: bytes, flags: int = 0) -> None:
+        """
+        Encrypt and send one frame, the frames are sent in the order they were encrypted.
+        :param message_type: the type of the message (REQUEST or PONG).
+        :param message: the plain message.
+        :param flags: the flags of the frame.
+        """
+        with self.send_lock:
+            self.socket.sendall(Protocol.seal_frame(self.channel, message_type, message, flags))
 
-            if rid in self.responses:
-                response = self.responses[rid]
+    def notify_error(self, future: Future) -> None:
+        """
+        Add a notification for an error response, called when the response arrives.
+        :param future: the future of the response.
+        """
+        response = future.result()
 
-            if response["StatusCode"] != 200 and response["StatusCode"] != 201:
-                # add notification with the status and message
-                self.notifications.append(NotificationInterface(response["Status"], response["Data"]["Msg"], span_color=(234, 68, 68)))
-
-            return response
-        except Exception as e:
-            print(e)
+        if response["StatusCode"] != 200 and response["StatusCode"] != 201:
+            # add notification with the status and message
+            self.notifications.append(NotificationInterface(response["Status"], response["Data"]["Msg"], span_color=(234, 68, 68)))
 
     def listener(self):
         """
@@ -230,43 +366,48 @@ class ClientSocket:
         """
         while True:
             try:
-                response = b""
-
-                # wait for the request to arrive.
-                while True:
-                    # receive the request from the server.
-                    piece = self.socket.recv(1024)
+                flags = 0
 
-                    # check if the request is the end of request signal.
-                    if piece == b"-- End Request --":
-                        break
-                    else:
-                        response += piece
+                # wait for the message to arrive and decrypt it.
+                if self.framing != Protocol.LEGACY_VERSION:
+                    message_type, flags, payload = self.receive_buffer.read_frame()
 
-                # decrypt the response using the aes encryptor.
-                response = self.decrypt(response)
+                    # the aead tag covers the header and the payload.
+                    response = Protocol.open_frame(self.channel, message_type, flags, payload)
 
-                # convert to json object.
-                response = json.loads(response)
-
-                # save the checksum.
-                recv_checksum = response["Checksum"]
+                    # the server checks the connection is alive, answer with the same payload.
+                    if message_type == Protocol.PING:
+                        self.send_frame(Protocol.PONG, response)
+                        continue
+                else:
+                    response = self.decrypt(self.receive_buffer.read_legacy_message())
 
-                # delete the checksum from the original request.
-                del response["Checksum"]
+                # the server compresses large messages, the requests are small and carry the token so they aren't.
+                if flags & Protocol.FLAG_COMPRESSED:
+                    response = Compression.decompress(self.compression, response, Protocol.MAX_MESSAGE_SIZE)
 
-                # generate a new checksum for the request.
-                current_checksum = self.create_checksum(response)
+                # convert to json object.
+                if flags & Protocol.FLAG_BINARY:
+                    response = Codec.decode(response)
+                else:
+                    response = json.loads(response)
 
-                # check if the checksums match, if not send an error response.
-                if current_checksum == recv_checksum:
+                # the aead tag already verified the message, otherwise check the md5 checksum.
+                if self.channel.authenticated or self.verify_checksum(response):
                     if self.check_response_protocol(response):
-                        self.responses[response["Id"]] = response
+                        # a response of a request that timed out (or an unknown id) is dropped.
+                        future = self.pending_requests.pop(response["Id"], None)
+                        if future is not None:
+                            future.set_result(response)
                         continue
                     elif self.check_push_notification_protocol(response):
                         # push server notifications.
                         self.handle_server_notification(response)
                         continue
+            except OSError as e:
+                # the server closed the connection (or didn't hear from the client for too long).
+                print(e)
+                return
             except Exception as e:
                 print(e)
 
@@ -442,6 +583,18 @@ class ClientSocket:
         """
         self.token = token
 
+    def verify_checksum(self, response: dict) -> bool:
+        """
+        Check the md5 checksum of a message on a cipher without a tag.
+        :param response: the message, the checksum is removed from it.
+        :return: True if the checksum match, otherwise False.
+        """
+        # save the checksum.
+        recv_checksum = response.pop("Checksum", None)
+
+        # generate a new checksum for the request and compare.
+        return self.create_checksum(response) == recv_checksum
+
     @staticmethod
     def create_checksum(subject: dict) -> str:
         """
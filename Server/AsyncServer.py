@@ -0,0 +1,347 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Compression
+import Encryption
+import Protocol
+import Transport
+import utils
+from ClientInterface import Client
+from Database.Backends import COMMIT_WINDOW, JSON, MAX_BATCH
+from Heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from Pipeline import MAX_IN_FLIGHT, SerialExecutor
+from Router import LANE_ACCOUNT
+from ServerSocket import ServerSocket
+from Writer import Writer
+from cryptography.hazmat.primitives import serialization
+
+# the end of the client public key.
+PUBLIC_KEY_END = b"-----END PUBLIC KEY-----"
+
+# the stream reader buffer limit, a legacy message (and its delimiter) must fit in it.
+STREAM_LIMIT = Protocol.MAX_MESSAGE_SIZE + len(Protocol.LEGACY_DELIMITER)
+
+
+class StreamConnection:
+    def __init__(self, loop: asyncio.AbstractEventLoop, writer: asyncio.StreamWriter):
+        """
+        The connection of a client served by the event loop, used by the Client interface instead of a socket.
+        The messages are sent by the AsyncWriter, this is only used for the hello and for closing the connection,
+        which may be done from any thread, so the calls are handed to the event loop.
+        :param loop: the event loop that serves the connection.
+        :param writer: the stream writer of the connection.
+        """
+        self.loop = loop
+        self.writer = writer
+
+    def sendall(self, data: bytes) -> None:
+        """
+        Write the data to the connection, the write never blocks the caller.
+        :param data: the data to send.
+        """
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+
+    def shutdown(self, how: int) -> None:
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+
+class AsyncWriter(Writer):
+    def __init__(self, loop: asyncio.AbstractEventLoop, stream: asyncio.StreamWriter, deadline: float = 0):
+        """
+        The writer of a connection served by the event loop, a coroutine instead of a thread.
+        The queue and its limits are the same as the thread writer, the stream drain is the backpressure.
+        :param loop: the event loop that serves the connection.
+        :param stream: the stream writer of the connection.
+        :param deadline: the time in seconds a push notification may wait to be sent with the next messages.
+        """
+        super().__init__(deadline)
+        self.loop = loop
+        self.stream = stream
+        self.wake = asyncio.Event()
+
+    def start(self, client) -> None:
+        """
+        Start writing to the client, called on the event loop.
+        """
+        self.client = client
+        self.loop.create_task(self.worker())
+
+    def notify(self) -> None:
+        self.loop.call_soon_threadsafe(self.wake.set)
+
+    async def worker(self) -> None:
+        """
+        Wait for queued messages and write them to the stream.
+        """
+        while True:
+            # clear before taking, a message queued after the take sets it again.
+            self.wake.clear()
+
+            with self.condition:
+                messages, wait = self.take()
+
+                if self.closed:
+                    return
+
+            if not messages:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            try:
+                for parts in self.client.seal_messages(messages):
+                    self.stream.writelines(parts)
+
+                # wait while the client doesn't read, meanwhile the queue grows and may go over the limit.
+                await self.stream.drain()
+
+                self.sent()
+
+            except Exception as e:
+                utils.server_print("Writer", f"Client {self.client.address} write failed: {e}")
+                self.close()
+                self.client.abort()
+                return
+
+
+class AsyncServerSocket(ServerSocket):
+    """
+    The asyncio engine of the server, every connection is a coroutine on one event loop.
+    The requests are handled by the same command handlers on an executor, so a blocking handler
+    (bcrypt, the database or the puzzle generation) never blocks the other connections,
+    and like the thread engine several requests of a connection may be in flight (see Pipeline.py).
+    """
+
+    def __init__(self, address, port, db_profile, flush_deadline=0.005, metrics_interval=60,
+                 compression_threshold=Compression.DEFAULT_THRESHOLD, workers=32, tls_context=None, hashing_workers=None,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT, db_backend=JSON,
+                 commit_window=COMMIT_WINDOW, max_batch=MAX_BATCH):
+        super().__init__(address, port, db_profile, flush_deadline, metrics_interval, compression_threshold, tls_context,
+                         hashing_workers, heartbeat_interval, heartbeat_timeout, db_backend, commit_window, max_batch)
+
+        # the amount of requests that may be handled at the same time, unlike MAX_CLIENTS it doesn't limit the connections.
+        self.workers = workers
+
+        self.loop = None
+        self.server = None
+        self.executor = None
+        self.handshake_slots = None
+
+    def run(self) -> None:
+        """
+        Main loop of the server socket, runs the event loop until the server is stopped.
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:
+        """
+        Serve the connections on the listening socket until the server is stopped.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="Handler")
+
+        # the key exchanges that run at the same time, the other connections wait for a slot.
+        self.handshake_slots = asyncio.Semaphore(self.MAX_PENDING_HANDSHAKES)
+        # on the tls transport the event loop completes the tls handshake before handle_connection.
+        self.server = await asyncio.start_server(self.handle_connection, sock=self.server_socket, limit=STREAM_LIMIT,
+                                                 ssl=self.tls_context,
+                                                 ssl_handshake_timeout=self.HANDSHAKE_TIMEOUT if self.tls_context else None)
+
+        utils.server_print("Status", f"Serving with the asyncio engine and {self.workers} handler threads.")
+
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def stop(self) -> None:
+        if self.server is not None:
+            # the listening socket belongs to the event loop, let it close the socket.
+            self.loop.call_soon_threadsafe(self.server.close)
+
+        super().stop()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Handle each client individually, the key exchange, the negotiation and then the requests.
+        :param reader: the stream reader of the connection.
+        :param writer: the stream writer of the connection.
+        """
+        client_address = writer.get_extra_info("peername")
+        utils.server_print("Connection", "Client " + str(client_address) + " connection request accepted.")
+
+        self.metrics.increment("connections_accepted")
+        self.metrics.add("handshakes_pending", 1)
+        accepted_time = time.monotonic()
+
+        Transport.set_keepalive(writer.get_extra_info("socket"))
+
+        async with self.handshake_slots:
+            self.metrics.add("handshakes_pending", -1)
+
+            start_time = time.monotonic()
+            self.metrics.observe("handshake_wait", start_time - accepted_time)
+
+            try:
+                if self.tls_context is not None:
+                    channel = Encryption.PlainChannel()
+
+                    if writer.get_extra_info("ssl_object").session_reused:
+                        self.metrics.increment("tls_sessions_resumed")
+                else:
+                    # a client that doesn't finish the key exchange in time is disconnected.
+                    channel = await asyncio.wait_for(self.exchange_keys(reader, writer), self.HANDSHAKE_TIMEOUT)
+
+            except asyncio.TimeoutError:
+                self.metrics.increment("handshakes_timed_out")
+                utils.server_print("Error", f"Client {client_address} key exchange timed out.")
+                writer.close()
+                return
+
+            except Exception as e:
+                self.metrics.increment("handshakes_failed")
+                utils.server_print("Error", str(e))
+                writer.close()
+                return
+
+        self.metrics.observe("handshake_duration", time.monotonic() - start_time)
+
+        # create object for the client.
+        client = Client(client_address, StreamConnection(self.loop, writer), channel,
+                        AsyncWriter(self.loop, writer, self.flush_deadline))
+        client.compression_threshold = self.compression_threshold
+        client.heartbeat_interval = self.reaper.interval
+        client.metrics = self.metrics
+        self.sessions.connect(client)
+
+        utils.server_print("Handler", "Starting to handle " + str(client.address) + ".")
+
+        # the requests are read ahead and handled on the executor, in the lanes of their commands.
+        # a slot is taken for every request in flight, the executor gives it back when the request was handled.
+        slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        lanes = SerialExecutor(self.executor, lambda: self.loop.call_soon_threadsafe(slots.release))
+
+        try:
+            # agree on the framing before reading any request.
+            pending = await self.negotiate(client, reader)
+
+            while client.running:
+                flags, request = await self.receive_message(client, reader, pending)
+                pending = b""
+
+                if request == b"":
+                    continue
+
+                request = client.parse_request(flags, request)
+
+                # a rejected request was already answered, the next one is read.
+                if request is None:
+                    continue
+
+                route = self.router.find(request["Command"])
+
+                # too many requests in flight, stop reading until one is handled.
+                await slots.acquire()
+                lanes.submit(route.lane if route is not None else LANE_ACCOUNT, self.handle_request, client, request, route)
+
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            utils.server_print("Handler", f"Client {client.address} closed the connection.")
+        except Exception as e:
+            utils.server_print("Error", str(e))
+
+        # the requests in flight finish before the logout.
+        for _ in range(MAX_IN_FLIGHT):
+            await slots.acquire()
+
+        # the logout writes to the database.
+        await self.loop.run_in_executor(self.executor, self.disconnect_user, client)
+        writer.close()
+
+    async def exchange_keys(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Encryption.LegacyChannel:
+        """
+        The key exchange of ServerSocket.exchange_keys, without holding a thread while waiting for the client.
+        :return: the legacy channel from the key and nonce, the client may negotiate an aead cipher later.
+        """
+        # receive and load the client public key.
+        try:
+            public_pem = await reader.readuntil(PUBLIC_KEY_END)
+        except asyncio.LimitOverrunError:
+            raise Exception("Client public key is too long.")
+
+        if len(public_pem) > self.MAX_PUBLIC_KEY_SIZE:
+            raise Exception("Client public key is too long.")
+
+        client_public_key = serialization.load_pem_public_key(public_pem + b"\n")
+
+        # create aes key
+        aes_key = os.urandom(32)
+        nonce = os.urandom(16)
+
+        # encrypt the aes key using the client public key and send it.
+        writer.write(self.encrypt_with_public_key(client_public_key, aes_key))
+
+        # get confirmation from the client, the end of line of the public key may come before it.
+        confirmation = await reader.readuntil(b"AES key received")
+        if confirmation.strip() != b"AES key received":
+            raise Exception("Client didn't receive the AES key.")
+
+        # encrypt the nonce using the client public key and send it.
+        writer.write(self.encrypt_with_public_key(client_public_key, nonce))
+
+        # get confirmation from the client, read exactly the confirmation since a hello may follow it.
+        confirmation = await reader.readexactly(len("Nonce key received"))
+        if confirmation != b"Nonce key received":
+            raise Exception("Client didn't receive the nonce.")
+
+        utils.server_print("Encryption", f"Key exchange with {writer.get_extra_info('peername')} completed.")
+
+        return Encryption.LegacyChannel(aes_key, nonce)
+
+    @staticmethod
+    async def negotiate(client: Client, reader: asyncio.StreamReader) -> bytes:
+        """
+        Negotiate the wire protocol with the client, clients without a hello stay on the legacy framing.
+        :return: the bytes that were read but aren't a hello, the start of the first legacy request.
+        """
+        head = await reader.readexactly(len(Protocol.HELLO_MAGIC))
+
+        if head != Protocol.HELLO_MAGIC:
+            utils.server_print("Handler", f"Client {client.address} is using the legacy framing.")
+            return head
+
+        length, = Protocol.HELLO_LENGTH.unpack(await reader.readexactly(Protocol.HELLO_LENGTH.size))
+        capabilities = json.loads(await reader.readexactly(length))
+
+        client.connection.sendall(client.accept_hello(capabilities))
+
+        return b""
+
+    @staticmethod
+    async def receive_message(client: Client, reader: asyncio.StreamReader, pending: bytes) -> (int, bytes):
+        """
+        Wait for the next message from the client.
+        :param pending: bytes of the message that were already read.
+        :return: the flags of the message and the decrypted message.
+        """
+        if client.framing == Protocol.LEGACY_VERSION:
+            message = pending + await reader.readuntil(Protocol.LEGACY_DELIMITER)
+
+            return client.open_message(Protocol.REQUEST, 0, message[:-len(Protocol.LEGACY_DELIMITER)])
+
+        length, message_type, flags = Protocol.HEADER.unpack(await reader.readexactly(Protocol.HEADER.size))
+
+        if length > Protocol.MAX_MESSAGE_SIZE:
+            raise Protocol.ProtocolError(f"Message of {length} bytes is over the limit of {Protocol.MAX_MESSAGE_SIZE} bytes.")
+
+        return client.open_message(message_type, flags, await reader.readexactly(length))
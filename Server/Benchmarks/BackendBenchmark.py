@@ -0,0 +1,130 @@
+"""
+The json and the SQLite backends under the workloads of the server, through the methods the handlers call:
+login (the user, the login data and the friend list), friend (a request, its acceptance and the friend list) and
+stats (the increments of a game ending), with 1 and 8 callers.
+Run from the repository root: python Server/Benchmarks/BackendBenchmark.py
+"""
+import gc
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import Server.Methods.LatestVersion as api
+from Benchmarks.DatabaseBenchmark import create_users
+from Benchmarks.JournalBenchmark import percentile
+from Server.Database.Backends import BACKENDS, SQLITE, open_database
+
+USERS = 100_000
+
+CALLERS = [1, 8]
+
+# the workloads every caller runs.
+OPERATIONS = 1000
+
+
+def login(database, index: int) -> None:
+    username = f"user{index % USERS}"
+    api.account.get(username, database)
+    api.account.update_login_data(("127.0.0.1", 50000), username, database)
+    api.friend.get_friend_list(username, set(), database)
+
+
+def friend(database, index: int) -> None:
+    # every pair of users once, user2k requests user2k+1.
+    username, requested = f"user{index * 2 % USERS}", f"user{(index * 2 + 1) % USERS}"
+    api.friend.add_friend(username, requested, database)
+    api.friend.accept_friend(username, requested, database)
+    api.friend.get_friend_list(requested, set(), database)
+
+
+def stats(database, index: int) -> None:
+    api.account.update_playtime(f"user{index % USERS}", index % 2 == 0, 5, 120.0, database)
+
+
+WORKLOADS = [login, friend, stats]
+
+
+def run(database, workload, callers: int, counter) -> tuple[float, list]:
+    """
+    :return: the workloads per second of all the callers, and the latency of every workload in microseconds.
+    """
+    latencies = [[] for _ in range(callers)]
+
+    def caller(index):
+        for _ in range(OPERATIONS):
+            number = next(counter)
+            start = time.perf_counter()
+            workload(database, number)
+            latencies[index].append((time.perf_counter() - start) * 1_000_000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return callers * OPERATIONS / elapsed, [latency for caller_latencies in latencies for latency in caller_latencies]
+
+
+def main():
+    cwd = os.getcwd()
+    results = {}
+
+    for backend in BACKENDS:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            os.makedirs(os.path.join("Database", "Tests"))
+
+            users = create_users(USERS)
+
+            with open(os.path.join("Database", "Tests", "Users.json"), "w") as f:
+                f.write(json.dumps(users))
+
+            database = open_database(0, backend)
+
+            if backend == SQLITE:
+                database.submit_update("Users", users)
+            else:
+                database.submit_read("Users")
+
+            del users
+            gc.collect()
+
+            for workload in WORKLOADS:
+                # a fresh pair of users for every friend workload.
+                counter = itertools.count()
+
+                for callers in CALLERS:
+                    results[backend, workload.__name__, callers] = run(database, workload, callers, counter)
+
+            database.shutdown()
+            del database
+            gc.collect()
+
+            os.chdir(cwd)
+
+    print(f"{USERS} users, {OPERATIONS} workloads per caller\n")
+    print(f"{'workload':>8} {'callers':>7} | " + " | ".join(f"{backend:>6}: {'per second':>10} {'p50':>8} {'p99':>8}" for backend in BACKENDS))
+
+    for workload in WORKLOADS:
+        for callers in CALLERS:
+            row = []
+
+            for backend in BACKENDS:
+                throughput, latencies = results[backend, workload.__name__, callers]
+                row.append(f"{throughput:>18.0f} {percentile(latencies, 0.5):6.0f}us {percentile(latencies, 0.99):6.0f}us")
+
+            print(f"{workload.__name__:>8} {callers:>7} | " + " | ".join(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Cpu time per recipient of a lobby push notification, push_notification for every recipient
+against Client.broadcast, which serializes the message once and only encrypts and frames it per recipient.
+Run from the repository root: python Server/Benchmarks/BroadcastBenchmark.py
+"""
+import os
+import sys
+import time
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Codec
+import Encryption
+import Protocol
+from ClientInterface import Client
+
+LOBBY_SIZES = (6, 500)
+
+# the amount of recipients notified in every measurement.
+RECIPIENTS = 30000
+
+CHAT_MESSAGE = {"Username": "player0", "Message": "good luck everyone, see you on the leaderboard!", "Time": "12:00"}
+
+
+class DiscardConnection:
+    """
+    A connection that drops everything, so only the cpu time of the server side is measured.
+    """
+
+    def sendall(self, data: bytes) -> None:
+        pass
+
+    def send(self, data: bytes) -> int:
+        return len(data)
+
+    def sendmsg(self, parts: list) -> int:
+        return sum(len(part) for part in parts)
+
+
+def create_lobby(size: int, cipher: str) -> list:
+    """
+    :return: size framed clients on the cipher.
+    """
+    key = os.urandom(32)
+    nonce = os.urandom(16)
+    clients = []
+
+    for i in range(size):
+        client = Client(("player", i), DiscardConnection(), Encryption.LegacyChannel(key, nonce))
+        client.framing = Protocol.FRAMING_VERSION
+
+        if cipher != Encryption.LEGACY_CIPHER:
+            client.codec = Codec.BINARY
+            client.channel = Encryption.SecureChannel(cipher, key, nonce, True)
+
+        clients.append(client)
+
+    return clients
+
+
+def push_each(clients: list, update: str, data: dict) -> None:
+    for client in clients:
+        client.push_notification(update, data)
+
+
+def push_broadcast(clients: list, update: str, data: dict) -> None:
+    Client.broadcast(clients, update, data)
+
+
+def measure(fan_out, clients: list, update: str, data: dict) -> float:
+    """
+    :return: cpu microseconds per recipient.
+    """
+    rounds = RECIPIENTS // len(clients)
+
+    start = time.process_time()
+    for _ in range(rounds):
+        fan_out(clients, update, data)
+
+    return (time.process_time() - start) / (rounds * len(clients)) * 1e6
+
+
+def main():
+    warnings.simplefilter("ignore")
+
+    for cipher in (Encryption.LEGACY_CIPHER, "aes-256-gcm"):
+        for size in LOBBY_SIZES:
+            leaderboard = {"Leaderboard": [[f"player{i}", i * 6] for i in range(min(size, 6))]}
+
+            for update, data in (("Chat_Message", CHAT_MESSAGE), ("Leaderboard", leaderboard)):
+                clients = create_lobby(size, cipher)
+                each = measure(push_each, clients, update, data)
+                once = measure(push_broadcast, clients, update, data)
+
+                print(f"{cipher:>17} {size:4} members {update:>13}: "
+                      f"push_notification {each:5.1f} us, broadcast {once:5.1f} us per recipient ({each / once:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
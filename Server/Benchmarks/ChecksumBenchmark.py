@@ -0,0 +1,96 @@
+"""
+Per message cpu time of a game_move round trip (request and response),
+the md5 checksum over AES-CFB against the aead tag over the frame.
+Run from the repository root: python Server/Benchmarks/ChecksumBenchmark.py
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Encryption
+import Protocol
+
+MESSAGES = 50000
+
+REQUEST = {"Id": 42, "Command": "game_move", "Data": {"Move": {"row": 4, "column": 7, "value": 9}}, "Token": "a" * 32}
+RESPONSE = {"Id": 42, "StatusCode": 200, "Status": "OK", "Data": {"Msg": "Move accepted."}}
+
+
+def create_checksum(subject: dict) -> str:
+    return hashlib.md5(json.dumps(subject).encode('utf-8')).hexdigest()
+
+
+def checksum_round_trip(client: Encryption.LegacyChannel, server: Encryption.LegacyChannel) -> None:
+    # client send_request
+    request = dict(REQUEST)
+    request["Checksum"] = create_checksum(request)
+    encrypted = client.encrypt(json.dumps(request).encode('utf-8'))
+
+    # server get_request, parsed twice and serialized again for the checksum
+    plain = server.decrypt(encrypted)
+    lower_request = plain.lower()
+    request = json.loads(plain)
+    json.loads(lower_request)
+    recv_checksum = request.pop("Checksum")
+    assert create_checksum(request) == recv_checksum
+
+    # server send_response
+    response = dict(RESPONSE)
+    response["Checksum"] = create_checksum(response)
+    encrypted = server.encrypt(json.dumps(response).encode('utf-8'))
+
+    # client listener
+    response = json.loads(client.decrypt(encrypted))
+    recv_checksum = response.pop("Checksum")
+    assert create_checksum(response) == recv_checksum
+
+
+def aead_round_trip(client: Encryption.SecureChannel, server: Encryption.SecureChannel) -> None:
+    # client send_request
+    frame = Protocol.seal_frame(client, Protocol.REQUEST, json.dumps(REQUEST).encode('utf-8'))
+
+    # server get_request
+    length, message_type, flags = Protocol.HEADER.unpack_from(frame)
+    json.loads(Protocol.open_frame(server, message_type, flags, memoryview(frame)[Protocol.HEADER.size:]))
+
+    # server send_response
+    frame = Protocol.seal_frame(server, Protocol.RESPONSE, json.dumps(RESPONSE).encode('utf-8'))
+
+    # client listener
+    length, message_type, flags = Protocol.HEADER.unpack_from(frame)
+    json.loads(Protocol.open_frame(client, message_type, flags, memoryview(frame)[Protocol.HEADER.size:]))
+
+
+def measure(round_trip, client, server) -> float:
+    """
+    :return: cpu microseconds per round trip.
+    """
+    start = time.process_time()
+    for _ in range(MESSAGES):
+        round_trip(client, server)
+
+    return (time.process_time() - start) / MESSAGES * 1e6
+
+
+def main():
+    warnings.simplefilter("ignore")
+
+    key = os.urandom(32)
+    nonce = os.urandom(16)
+
+    old = measure(checksum_round_trip, Encryption.LegacyChannel(key, nonce), Encryption.LegacyChannel(key, nonce))
+    new = measure(aead_round_trip, Encryption.SecureChannel("aes-256-gcm", key, nonce, False),
+                  Encryption.SecureChannel("aes-256-gcm", key, nonce, True))
+
+    print(f"md5 checksum + aes-256-cfb: {old:6.1f} us per game_move round trip")
+    print(f"aead tag (aes-256-gcm):     {new:6.1f} us per game_move round trip")
+    print(f"saved:                      {old - new:6.1f} us ({(old - new) / old * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Messages per second on one core, a new AES-CFB encryptor per message against one aead channel per connection.
+Run from the repository root: python Server/Benchmarks/CipherBenchmark.py
+"""
+import os
+import sys
+import time
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Encryption
+
+MESSAGES = 50000
+SIZES = [128, 1024, 8 * 1024]
+
+
+def run(channel_factory, size: int) -> float:
+    """
+    Encrypt and decrypt MESSAGES messages of the given size.
+    :return: messages (encrypted and decrypted) per cpu second.
+    """
+    key = os.urandom(32)
+    nonce = os.urandom(16)
+    sender, receiver = channel_factory(key, nonce)
+    message = os.urandom(size)
+
+    start = time.process_time()
+    for _ in range(MESSAGES):
+        receiver.decrypt(sender.encrypt(message))
+
+    return MESSAGES / (time.process_time() - start)
+
+
+def legacy(key: bytes, nonce: bytes):
+    return Encryption.LegacyChannel(key, nonce), Encryption.LegacyChannel(key, nonce)
+
+
+def aead(name: str):
+    def factory(key: bytes, nonce: bytes):
+        return Encryption.SecureChannel(name, key, nonce, True), Encryption.SecureChannel(name, key, nonce, False)
+
+    return factory
+
+
+def main():
+    warnings.simplefilter("ignore")
+
+    variants = [(Encryption.LEGACY_CIPHER + " per message", legacy)] + [(name, aead(name)) for name in Encryption.CIPHERS]
+
+    print(f"{'cipher':>26} | " + " | ".join(f"{str(size) + ' B msg/s':>14}" for size in SIZES))
+    for name, factory in variants:
+        print(f"{name:>26} | " + " | ".join(f"{run(factory, size):>14,.0f}" for size in SIZES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Writes per second and push latency of a synthetic 6 players game, every push notification sent right away
+against the outbound queue flushed once the flush deadline is reached.
+Every game_move pushes the leaderboard to all the players and answers the player that moved.
+Run from the repository root: python Server/Benchmarks/CoalescingBenchmark.py [moves per second]
+"""
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Codec
+import Encryption
+import Protocol
+from ClientInterface import Client
+from Writer import Writer
+
+PLAYERS = 6
+
+# the average amount of moves per second in the whole lobby, the moves arrive in random bursts.
+MOVES_PER_SECOND = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+DURATION = 5
+
+DEADLINES = (0, 0.002, 0.005, 0.010)
+
+
+class CountingSocket:
+    def __init__(self, connection: socket.socket):
+        """
+        Count the writes (send syscalls) of the server side of the connection.
+        """
+        self.connection = connection
+        self.writes = 0
+
+    def sendall(self, data: bytes) -> None:
+        self.writes += 1
+        self.connection.sendall(data)
+
+    def send(self, data: bytes) -> int:
+        self.writes += 1
+        return self.connection.send(data)
+
+    def recv_into(self, buffer) -> int:
+        return self.connection.recv_into(buffer)
+
+
+def reader(connection: socket.socket, channel: Encryption.SecureChannel, sent: dict, latencies: list) -> None:
+    """
+    Read the frames of one player and record the latency of every push notification.
+    A queued leaderboard is replaced by a newer one, so the leaderboards are matched by their total score.
+    """
+    receive_buffer = Protocol.ReceiveBuffer(connection)
+
+    while True:
+        try:
+            message_type, flags, payload = receive_buffer.read_frame()
+        except (ConnectionResetError, OSError):
+            return
+
+        message = Protocol.open_frame(channel, message_type, flags, payload)
+
+        if message_type == Protocol.PUSH_NOTIFICATION:
+            message = Codec.decode(message)
+            total = sum(score for _, score in message["Data"]["Leaderboard"])
+            latencies.append(time.perf_counter() - sent.pop(total))
+
+
+def play(deadline: float) -> (float, float, float):
+    """
+    Play the synthetic game with the flush deadline, 0 sends every message right away.
+    :return: writes per second, p50 and p99 push latency in microseconds and the part of the pushes that were superseded.
+    """
+    key = os.urandom(32)
+    nonce = os.urandom(16)
+
+    clients, sockets, sent, latencies, threads = [], [], [], [], []
+
+    for i in range(PLAYERS):
+        server_side, client_side = socket.socketpair()
+        counting = CountingSocket(server_side)
+
+        client = Client(("player", i), counting, None, Writer(deadline))
+        client.framing = Protocol.FRAMING_VERSION
+        client.codec = Codec.BINARY
+        client.channel = Encryption.SecureChannel("aes-256-gcm", key, nonce, True)
+
+        player_sent = {}
+        thread = threading.Thread(target=reader, daemon=True, args=(
+            client_side, Encryption.SecureChannel("aes-256-gcm", key, nonce, False), player_sent, latencies))
+        thread.start()
+
+        clients.append(client)
+        sockets.append((server_side, client_side, counting))
+        sent.append(player_sent)
+        threads.append(thread)
+
+    leaderboard = [[f"player{i}", 0] for i in range(PLAYERS)]
+    random.seed(0)
+
+    start = time.perf_counter()
+    next_move = start
+    moves = 0
+
+    while next_move - start < DURATION:
+        # wait for the next move, like the handler thread waits for the next request.
+        delay = next_move - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        mover = random.randrange(PLAYERS)
+        leaderboard[mover][1] += 6
+
+        # Lobby.update_leaderboard, then the game_move response.
+        for i, client in enumerate(clients):
+            sent[i][moves * 6 + 6] = time.perf_counter()
+            client.push_notification("Leaderboard", {"Leaderboard": leaderboard})
+
+        clients[mover].send_response(moves, 200, "OK", {"Msg": "Move accepted."})
+
+        moves += 1
+        next_move += random.expovariate(MOVES_PER_SECOND)
+
+    # let the writers send the last queued messages.
+    time.sleep(deadline + 0.05)
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.stop()
+
+    for server_side, client_side, counting in sockets:
+        server_side.close()
+
+    for thread in threads:
+        thread.join()
+
+    for server_side, client_side, counting in sockets:
+        client_side.close()
+
+    writes = sum(counting.writes for _, _, counting in sockets)
+    latencies.sort()
+
+    return (writes / elapsed, latencies[len(latencies) // 2] * 1e6, latencies[int(len(latencies) * 0.99)] * 1e6,
+            1 - len(latencies) / (moves * PLAYERS))
+
+
+def main():
+    print(f"{PLAYERS} players, ~{MOVES_PER_SECOND} moves per second, {DURATION} seconds")
+    print(f"{'flush deadline':>16} {'writes/s':>10} {'p50 push':>12} {'p99 push':>12} {'superseded':>11}")
+
+    for deadline in DEADLINES:
+        writes, p50, p99, superseded = play(deadline)
+        name = "none" if deadline == 0 else f"{deadline * 1000:.0f} ms"
+        print(f"{name:>16} {writes:10.0f} {p50:9.0f} us {p99:9.0f} us {superseded * 100:10.1f}%")
+
+
+if __name__ == '__main__':
+    main()
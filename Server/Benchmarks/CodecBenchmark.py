@@ -0,0 +1,74 @@
+"""
+Encode / decode speed of the binary codec against json, and the bytes on the wire of one synthetic game.
+Run from the repository root: python Server/Benchmarks/CodecBenchmark.py
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Codec
+import Encryption
+import Protocol
+
+ITERATIONS = 50000
+
+PLAYERS = 6
+MOVES_PER_PLAYER = 50
+
+LEADERBOARD = [(f"player_{i}", random.randint(0, 100)) for i in range(PLAYERS)]
+
+MESSAGES = {
+    "game_move": {"Id": 1234, "Command": "game_move", "Data": {"Move": {"row": 4, "column": 7, "value": 9}}, "Token": "0123456789abcdef" * 2},
+    "Leaderboard": {"Update": "Leaderboard", "Data": {"Leaderboard": LEADERBOARD}},
+    "Game_Started": {"Update": "Game_Started", "Data": {"Board": [[random.randint(0, 9) for _ in range(9)] for _ in range(9)], "Leaderboard": LEADERBOARD, "Ending_Time": "2025-05-20 02:42:53"}},
+}
+
+
+def per_call(function, argument) -> float:
+    """
+    :return: microseconds per call.
+    """
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        function(argument)
+
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def wire_size(payload: bytes) -> int:
+    # header and aead tag around every message.
+    return Protocol.HEADER.size + len(payload) + Encryption.TAG_SIZE
+
+
+def main():
+    print(f"{'message':>13} | {'json B':>6} | {'binary B':>8} | {'json enc us':>11} | {'bin enc us':>10} | {'json dec us':>11} | {'bin dec us':>10}")
+
+    sizes = {}
+    for name, message in MESSAGES.items():
+        as_json = json.dumps(message).encode('utf-8')
+        as_binary = Codec.encode(message)
+        sizes[name] = (wire_size(as_json), wire_size(as_binary))
+
+        print(f"{name:>13} | {len(as_json):>6} | {len(as_binary):>8} | "
+              f"{per_call(lambda m: json.dumps(m).encode('utf-8'), message):>11.2f} | {per_call(Codec.encode, message):>10.2f} | "
+              f"{per_call(json.loads, as_json):>11.2f} | {per_call(Codec.decode, as_binary):>10.2f}")
+
+    # one game: every member gets the board, every move is a request and a leaderboard push to every member.
+    moves = PLAYERS * MOVES_PER_PLAYER
+    counts = {"Game_Started": PLAYERS, "game_move": moves, "Leaderboard": moves * PLAYERS}
+
+    json_total = sum(sizes[name][0] * count for name, count in counts.items())
+    binary_total = sum(sizes[name][1] * count for name, count in counts.items())
+
+    print()
+    print(f"one game ({PLAYERS} players, {moves} moves), hot messages on the wire:")
+    print(f"  json:   {json_total:>9,} bytes")
+    print(f"  binary: {binary_total:>9,} bytes ({binary_total / json_total * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
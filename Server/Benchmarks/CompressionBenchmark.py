@@ -0,0 +1,91 @@
+"""
+Bandwidth and cpu per message of the compression methods, on messages of different sizes,
+to pick the compression threshold (messages smaller than it are sent as they are).
+Run from the repository root: python Server/Benchmarks/CompressionBenchmark.py
+"""
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Compression
+import Protocol
+
+MESSAGES = 5000
+
+
+def random_name() -> str:
+    return "".join(random.choice(string.ascii_letters + string.digits) for _ in range(random.randint(4, 14)))
+
+
+def friend_list(size: int) -> dict:
+    friends = [{"username": random_name(), "last_login": f"2025-{random.randint(1, 12):02}-{random.randint(1, 28):02} 1{random.randint(0, 9)}:{random.randint(10, 59)}:{random.randint(10, 59)}",
+                "playtime": random.randint(0, 5000), "games_played": random.randint(0, 300), "games_won": random.randint(0, 100),
+                "account_level": random.randint(1, 40), "status": random.choice(["Online", "Offline"])} for _ in range(size)]
+
+    return {"Id": 7, "StatusCode": 200, "Status": "OK", "Data": {"Friends": [friends, [random_name() for _ in range(size // 5)]]}}
+
+
+def lobby_info(players: int) -> dict:
+    lobby = {"code": "".join(random.choice(string.ascii_uppercase) for _ in range(6)), "owner": random_name(), "started": False,
+             "max_players": 6, "players": [random_name() for _ in range(players)], "spectators": 3,
+             "players_colors": ["#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#FF00FF", "#00FFFF"]}
+
+    return {"Id": 3, "StatusCode": 200, "Status": "OK", "Data": {"Lobby_Info": lobby}}
+
+
+def game_over(players: int) -> dict:
+    leaderboard = sorted(([random_name(), random.randint(-50, 100)] for _ in range(players)), key=lambda entry: -entry[1])
+
+    return {"Update": "Game_Over", "Data": {"Winner": leaderboard[0][0], "Leaderboard": leaderboard}}
+
+
+def measure(method: str, message: bytes) -> (int, float, float):
+    """
+    :return: the compressed size, and the cpu microseconds to compress and to decompress the message.
+    """
+    start = time.process_time()
+    for _ in range(MESSAGES):
+        compressed = Compression.compress(method, message)
+    compress_time = (time.process_time() - start) / MESSAGES * 1e6
+
+    start = time.process_time()
+    for _ in range(MESSAGES):
+        Compression.decompress(method, compressed, Protocol.MAX_MESSAGE_SIZE)
+    decompress_time = (time.process_time() - start) / MESSAGES * 1e6
+
+    return len(compressed), compress_time, decompress_time
+
+
+def main():
+    random.seed(0)
+
+    messages = [
+        ("Leaderboard push, 6 players", {"Update": "Leaderboard", "Data": {"Leaderboard": game_over(6)["Data"]["Leaderboard"]}}),
+        ("Lobby_Info, 6 players", lobby_info(6)),
+        ("Game_Over, 6 players", game_over(6)),
+        ("friend list, 3 friends", friend_list(3)),
+        ("friend list, 10 friends", friend_list(10)),
+        ("Game_Over, 50 players", game_over(50)),
+        ("friend list, 50 friends", friend_list(50)),
+    ]
+
+    print(f"{'message':>26} {'json':>6} | {'zlib':>17} {'cpu':>14} | {Compression.ZLIB_DICTIONARY:>17} {'cpu':>14}")
+
+    for name, message in messages:
+        data = json.dumps(message).encode('utf-8')
+        line = f"{name:>26} {len(data):6}"
+
+        for method in (Compression.ZLIB, Compression.ZLIB_DICTIONARY):
+            size, compress_time, decompress_time = measure(method, data)
+            line += f" | {size:6} B ({size / len(data) * 100:3.0f}%) {compress_time:5.1f} + {decompress_time:4.1f} us"
+
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Latency of reading and updating the Users collection with 10k, 100k and 1M users, the way every read and update
+worked before the collections stayed in memory (the whole file loaded, the whole file written) against the
+resident collections (submit_read / submit_update), the record operations (get / increment) and the background
+flush that writes them.
+Run from the repository root: python Server/Benchmarks/DatabaseBenchmark.py
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Database.Database import Database
+
+USERS = [10_000, 100_000, 1_000_000]
+
+# the reads and updates of the resident collections per size.
+OPERATIONS = 1000
+
+
+def create_users(count: int) -> dict:
+    """
+    :return: a Users collection with count users, the records of UserSystem.register.
+    """
+    return {f"user{i}": {
+        "username": f"user{i}",
+        "password": "24" * 30,
+        "last_login": "2024-01-01 12:00:00",
+        "last_login_address": ["127.0.0.1", 50000],
+        "friends": [f"user{(i + 1) % count}"],
+        "friend_requests": [],
+        "lifetime": 0,
+        "account_level": 1,
+        "account_experience": 0,
+        "playtime": 0,
+        "games_played": 0,
+        "games_won": 0,
+    } for i in range(count)}
+
+
+def measure(operation, repeat: int) -> float:
+    """
+    :return: the milliseconds of one operation.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        operation()
+
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    print(f"{'users':>9} | {'file read':>10} {'file write':>10} | {'load':>8} {'read':>9} {'update':>9} "
+          f"{'get':>9} {'increment':>9} {'flush':>9}")
+
+    cwd = os.getcwd()
+
+    for count in USERS:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+
+            path = Database.path("Tests", "Users")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            users = create_users(count)
+            with open(path, "w") as f:
+                f.write(json.dumps(users, indent=4))
+
+            # before: every read loaded the file and every update wrote all of it.
+            repeat = max(1, 100_000 // count)
+
+            def file_read():
+                with open(path, "r") as f:
+                    json.load(f)
+
+            def file_write():
+                with open(path, "w") as f:
+                    f.write(json.dumps(users, indent=4))
+
+            file_read_time = measure(file_read, repeat)
+            file_write_time = measure(file_write, repeat)
+            del users
+            gc.collect()
+
+            # the resident collection, the flusher is off so the flush is measured on its own.
+            database = Database(0, flush_interval=0)
+
+            load_time = measure(lambda: database.submit_read("Users"), 1)
+            read_time = measure(lambda: database.submit_read("Users"), OPERATIONS)
+
+            def update():
+                users = database.submit_read("Users")
+                users["user0"]["games_played"] += 1
+                database.submit_update("Users", users)
+
+            update_time = measure(update, OPERATIONS)
+            get_time = measure(lambda: database.get("Users", "user1"), OPERATIONS)
+            increment_time = measure(lambda: database.increment("Users", "user1", {"games_played": 1}), OPERATIONS)
+            flush_time = measure(database.flush, 1)
+
+            print(f"{count:>9} | {file_read_time:8.1f}ms {file_write_time:8.1f}ms | {load_time:6.0f}ms "
+                  f"{read_time * 1000:7.1f}us {update_time * 1000:7.1f}us {get_time * 1000:7.1f}us "
+                  f"{increment_time * 1000:7.1f}us {flush_time:7.0f}ms")
+
+            database.shutdown()
+            del database
+            gc.collect()
+
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+The database worker before and after the blocking, future-based queue: the cpu the idle worker burns, and the
+updates per second with 1 to 32 callers blocking on their results (and one caller keeping many futures in flight).
+The collection is resident in both, so only the hand-off to the worker is measured.
+Run from the repository root: python Server/Benchmarks/DatabaseWorkerBenchmark.py
+"""
+import os
+import sys
+import threading
+import time
+from queue import Queue
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Database.Database import Database
+
+CALLERS = [1, 2, 4, 8, 16, 32]
+
+# the time in seconds of every measure.
+DURATION = 1
+
+# the futures the pipelined caller keeps in flight.
+IN_FLIGHT = 64
+
+
+class SpinningWorker:
+    def __init__(self):
+        """
+        The worker before the blocking queue: a list popped in a loop, and the callers polling their result queues.
+        """
+        self.collections = {"Users": {}}
+        self.task_queue = []
+        self.shutdown_event = threading.Event()
+
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def worker(self):
+        while not self.shutdown_event.is_set():
+            try:
+                obj = self.task_queue.pop(0)
+
+                try:
+                    result = obj[0](*obj[2])
+
+                    if obj[1]:
+                        obj[1].put(result)
+
+                except Exception as e:
+                    print(e)
+            finally:
+                continue
+
+    def update(self, collection: str, data: dict) -> bool:
+        self.collections[collection] = data
+        return True
+
+    def submit_update(self, collection: str, data: dict) -> bool:
+        result_queue = Queue()
+
+        self.task_queue.append((self.update, result_queue, [collection, data]))
+
+        while result_queue.empty():
+            continue
+
+        return result_queue.get()
+
+    def shutdown(self):
+        self.shutdown_event.set()
+
+
+def idle_cpu(database) -> float:
+    """
+    :return: the cpu of the process (in percent of one core) while nobody uses the database.
+    """
+    time.sleep(0.2)
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    time.sleep(DURATION)
+
+    return (time.process_time() - start_cpu) / (time.perf_counter() - start_wall) * 100
+
+
+def blocking_throughput(database, callers: int) -> float:
+    """
+    :return: the updates per second of all the callers, every caller waits for the result of its update.
+    """
+    users = {}
+    counts = [0] * callers
+    deadline = time.perf_counter() + DURATION
+
+    def caller(index):
+        while time.perf_counter() < deadline:
+            database.submit_update("Users", users)
+            counts[index] += 1
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return sum(counts) / DURATION
+
+
+def pipelined_throughput(database: Database) -> float:
+    """
+    :return: the updates per second of one caller that keeps IN_FLIGHT futures in flight.
+    """
+    users = {}
+    count = 0
+    futures = []
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < DURATION:
+        futures.append(database.update_future("Users", users))
+
+        if len(futures) >= IN_FLIGHT:
+            futures.pop(0).result()
+            count += 1
+
+    for future in futures:
+        future.result()
+
+    return (count + len(futures)) / (time.perf_counter() - start)
+
+
+def main():
+    spinning = SpinningWorker()
+    print(f"spinning worker: idle cpu {idle_cpu(spinning):5.1f}%")
+    spinning_results = [blocking_throughput(spinning, callers) for callers in CALLERS]
+    spinning.shutdown()
+
+    database = Database(0, flush_interval=0)
+    database.submit_update("Users", {})
+    print(f"blocking worker: idle cpu {idle_cpu(database):5.1f}%\n")
+
+    print("updates per second, every caller blocks on its update:")
+    for callers, spinning_result in zip(CALLERS, spinning_results):
+        print(f"{callers:>3} callers: spinning {spinning_result:8.0f}, blocking {blocking_throughput(database, callers):8.0f}")
+
+    print(f"\n1 caller with {IN_FLIGHT} futures in flight: {pipelined_throughput(database):8.0f}")
+
+    # the resident collection was never written to a file, there's nothing to flush.
+    database.dirty.clear()
+    database.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput benchmark of the legacy delimiter framing against the length-prefixed framing.
+Run from the repository root: python Server/Benchmarks/FramingBenchmark.py
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Protocol
+
+MESSAGES = 20000
+SIZES = [128, 1024, 16 * 1024]
+
+
+def send_legacy(connection: socket.socket, payload: bytes) -> None:
+    # the old writer, message and delimiter in two writes.
+    connection.sendall(payload)
+    connection.send(Protocol.LEGACY_DELIMITER)
+
+
+def send_framed(connection: socket.socket, payload: bytes) -> None:
+    connection.sendall(Protocol.pack_frame(Protocol.RESPONSE, payload))
+
+
+def run(framed: bool, size: int) -> float:
+    """
+    Send MESSAGES messages of the given size over a socket pair.
+    :return: messages per second.
+    """
+    writer, reader = socket.socketpair()
+    payload = os.urandom(size).replace(b"-", b"+")
+
+    def consume():
+        buffer = Protocol.ReceiveBuffer(reader)
+        for _ in range(MESSAGES):
+            if framed:
+                buffer.read_frame()
+            else:
+                buffer.read_legacy_message()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        if framed:
+            send_framed(writer, payload)
+        else:
+            send_legacy(writer, payload)
+    consumer.join()
+    elapsed = time.perf_counter() - start
+
+    writer.close()
+    reader.close()
+
+    return MESSAGES / elapsed
+
+
+def main():
+    print(f"{'size':>8} | {'legacy msg/s':>14} | {'framed msg/s':>14} | {'speedup':>7} | writes per message")
+    for size in SIZES:
+        legacy = run(False, size)
+        framed = run(True, size)
+        print(f"{size:>8} | {legacy:>14,.0f} | {framed:>14,.0f} | {framed / legacy:>6.2f}x | 2 -> 1")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Group commit of the json database under 1,000 games ending at the same time, every game updates the stats of its
+players on the lobby threads (Lobby.end_game), and every update returns once it's synced to the journal.
+Without group commit (a batch of one change) every update is its own sync, with it the updates of a commit window
+share a sync.
+Run from the repository root: python Server/Benchmarks/GroupCommitBenchmark.py
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import Server.Methods.LatestVersion as api
+from Benchmarks.DatabaseBenchmark import create_users
+from Benchmarks.JournalBenchmark import percentile
+from Database.Database import Database
+from Lobby import LOBBY_WORKERS
+from ThreadPool import ThreadPool
+
+USERS = 10_000
+
+GAMES = 1000
+
+PLAYERS = 4
+
+# (commit window in seconds, max batch, the players of a game updated together), the first is without group commit.
+CONFIGURATIONS = [
+    (0, 1, False),
+    (0, 256, False),
+    (0, 256, True),
+    (0.001, 256, True),
+    (0.002, 256, True),
+    (0.005, 256, True),
+    (0.002, 16, True),
+]
+
+
+def end_game(database: Database, game: int, together: bool, latencies: list, done) -> None:
+    """
+    Update the stats of the players of a game, like Lobby.end_game, one by one or together.
+    """
+    players = [(f"user{(game * PLAYERS + i) % USERS}", i == 0, 5, 120.0) for i in range(PLAYERS)]
+    start = time.perf_counter()
+
+    if together:
+        # the lobby doesn't wait for the commit, the benchmark does, so the latency is of the durable write.
+        for future in api.account.update_playtimes(players, database):
+            future.result()
+    else:
+        for player in players:
+            api.account.update_playtime(*player, database)
+
+    latencies.append((time.perf_counter() - start) * 1000)
+    done.release()
+
+
+def main():
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+
+        path = Database.path("Tests", "Users")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as f:
+            f.write(json.dumps(create_users(USERS)))
+
+        executor = ThreadPool(LOBBY_WORKERS)
+
+        print(f"{GAMES} games of {PLAYERS} players ending at once, on {LOBBY_WORKERS} lobby threads\n")
+        print(f"{'window':>7} {'batch':>5} {'players':>9} | {'time':>7} {'syncs':>6} {'syncs/s':>8} {'per sync':>8} | "
+              f"{'write p50':>9} {'write p99':>9}")
+
+        for window, max_batch, together in CONFIGURATIONS:
+            database = Database(0, flush_interval=0, commit_window=window, max_batch=max_batch)
+            database.submit_read("Users")
+
+            latencies = []
+            done = threading.Semaphore(0)
+            syncs = database.syncs
+
+            start = time.perf_counter()
+            for game in range(GAMES):
+                executor.submit(end_game, database, game, together, latencies, done)
+            for _ in range(GAMES):
+                done.acquire()
+            elapsed = time.perf_counter() - start
+
+            syncs = database.syncs - syncs
+            print(f"{window * 1000:5.0f}ms {max_batch:>5} {'together' if together else 'one by one':>9} | "
+                  f"{elapsed:6.2f}s {syncs:>6} {syncs / elapsed:8.0f} {GAMES * PLAYERS / syncs:8.1f} | "
+                  f"{percentile(latencies, 0.5):7.1f}ms {percentile(latencies, 0.99):7.1f}ms")
+
+            database.shutdown()
+            del database
+            gc.collect()
+
+        os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Connections per second of the transports, from connect until the hello reply arrived (ready for the first request):
+the custom rsa key exchange, a full tls handshake and a tls handshake that resumes the session of the last connection.
+The connections are made one after the other on localhost, with a self-signed certificate created for the run,
+so the time is the cpu cost of the handshakes, on a real network every round trip is added on top.
+The server cpu per connection is what limits the connections per second a server core can accept.
+Run from the repository root: python Server/Benchmarks/HandshakeBenchmark.py
+"""
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Protocol
+import Transport
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+# the time in seconds every transport is measured.
+DURATION = 3
+
+OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+
+HELLO = {"Version": Protocol.FRAMING_VERSION, "Ciphers": ["aes-256-gcm"]}
+
+
+def serve_custom(connection: socket.socket) -> None:
+    """
+    The server side of the rsa key exchange, as ServerSocket.exchange_keys does it.
+    """
+    public_pem = b""
+    while b"-----END PUBLIC KEY-----" not in public_pem:
+        public_pem += connection.recv(1024)
+
+    client_public_key = serialization.load_pem_public_key(public_pem)
+
+    connection.sendall(client_public_key.encrypt(os.urandom(32), OAEP))
+    Protocol.recv_exact(connection, len("AES key received"))
+
+    connection.sendall(client_public_key.encrypt(os.urandom(16), OAEP))
+    Protocol.recv_exact(connection, len("Nonce key received"))
+
+
+def connect_custom(address: tuple) -> socket.socket:
+    """
+    The client side of the rsa key exchange, as ClientSocket.exchange_keys does it.
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = private_key.public_key().public_bytes(encoding=serialization.Encoding.PEM,
+                                                       format=serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    connection = socket.create_connection(address)
+    connection.sendall(public_pem)
+
+    private_key.decrypt(bytes(Protocol.recv_exact(connection, 256)), OAEP)
+    connection.sendall(b"AES key received")
+
+    private_key.decrypt(bytes(Protocol.recv_exact(connection, 256)), OAEP)
+    connection.sendall(b"Nonce key received")
+
+    return connection
+
+
+def run_server(listener: socket.socket, tls_context, server_cpu: list) -> None:
+    """
+    Accept the connections one by one, do the handshake and answer the hello.
+    :param server_cpu: the cpu seconds of the server thread are added to server_cpu[0].
+    """
+    while True:
+        try:
+            connection, _ = listener.accept()
+        except OSError:
+            return
+
+        start = time.thread_time()
+
+        try:
+            if tls_context is not None:
+                Transport.set_no_delay(connection)
+                connection = tls_context.wrap_socket(connection, server_side=True)
+            else:
+                serve_custom(connection)
+
+            Protocol.read_hello(connection)
+            connection.sendall(Protocol.create_hello({"Version": Protocol.FRAMING_VERSION, "Cipher": "aes-256-gcm"}))
+            server_cpu[0] += time.thread_time() - start
+
+            # wait for the client to close, so the server side isn't left in time wait.
+            connection.recv(1)
+        except (OSError, Protocol.ProtocolError):
+            pass
+        finally:
+            connection.close()
+
+
+def measure(connect, server_cpu: list) -> (int, float, float):
+    """
+    Open connections for DURATION seconds.
+    :param connect: opens one connection and returns the socket after the hello reply.
+    :param server_cpu: the cpu seconds of the server thread.
+    :return: the amount of connections, the ms per connection and the server cpu ms per connection.
+    """
+    connections = 0
+    start = time.perf_counter()
+    start_cpu = server_cpu[0]
+
+    while time.perf_counter() - start < DURATION:
+        connect().close()
+        connections += 1
+
+    elapsed = time.perf_counter() - start
+
+    # the last connection may still be counted by the server.
+    time.sleep(0.1)
+
+    return connections, elapsed / connections * 1000, (server_cpu[0] - start_cpu) / connections * 1000
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    Transport.create_certificate(certfile, keyfile)
+
+    server_context = Transport.server_context(certfile, keyfile)
+    client_context = Transport.client_context(certfile)
+
+    for name, tls_context in (("custom rsa", None), ("tls", server_context)):
+        listener = socket.create_server(("127.0.0.1", 0))
+        address = listener.getsockname()
+        server_cpu = [0.0]
+        threading.Thread(target=run_server, args=(listener, tls_context, server_cpu), daemon=True).start()
+
+        def hello(connection):
+            connection.sendall(Protocol.create_hello(HELLO))
+            Protocol.read_hello(connection)
+            return connection
+
+        if tls_context is None:
+            cases = [(name, lambda: hello(connect_custom(address)))]
+        else:
+            connector = Transport.Connector(client_context)
+
+            def resume():
+                offered = address in connector.sessions
+                connection = hello(connector.connect(address))
+                connector.save_session(connection, address)
+
+                if offered and not connection.session_reused:
+                    resume.misses += 1
+
+                return connection
+
+            resume.misses = 0
+
+            cases = [("full tls", lambda: hello(Transport.Connector(client_context).connect(address))),
+                     ("resumed tls", resume)]
+
+        for case, connect in cases:
+            count, each, cpu = measure(connect, server_cpu)
+            print(f"{case:>12}: {1000 / each:7.1f} connections/s ({each:6.2f} ms each), "
+                  f"server cpu {cpu:5.2f} ms per connection ({1000 / cpu:6.0f} per core per second), {count} connections")
+
+        if tls_context is not None and resume.misses:
+            print(f"{'':>12}  {resume.misses} connections didn't resume.")
+
+        listener.close()
+
+
+if __name__ == '__main__':
+    main()
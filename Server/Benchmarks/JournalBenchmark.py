@@ -0,0 +1,152 @@
+"""
+Write latency and recovery time of the Users collection with 1M users and the journal.
+Before the journal a change was durable only once the whole collection was written (json.dumps with indent=4 of
+every user), the journal makes it durable with one appended line, synced with the other changes of its batch.
+Recovery is the load of the snapshot plus the replay of the journal, measured with journals of different lengths,
+and again after the compaction.
+Run from the repository root: python Server/Benchmarks/JournalBenchmark.py
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Benchmarks.DatabaseBenchmark import create_users
+from Database.Database import Database
+
+USERS = 1_000_000
+
+CALLERS = [1, 8]
+
+# the increments of every caller.
+OPERATIONS = 5000
+
+# the lengths of the journal replayed at startup.
+JOURNALS = [0, 100_000, 1_000_000]
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    """
+    :return: the latency (in the unit of the list) at the fraction of the sorted latencies.
+    """
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def write_latency(database: Database, callers: int) -> None:
+    """
+    Print the latency of the increments of the callers, every caller increments its own users.
+    """
+    latencies = [[] for _ in range(callers)]
+    syncs = database.syncs
+
+    def caller(index):
+        for i in range(OPERATIONS):
+            start = time.perf_counter()
+            database.increment("Users", f"user{(i * callers + index) % USERS}", {"games_played": 1})
+            latencies[index].append((time.perf_counter() - start) * 1_000_000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    database.write_journal()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for caller_latencies in latencies for latency in caller_latencies]
+    print(f"{callers:>3} callers: {len(latencies) / elapsed:8.0f} increments/s, p50 {percentile(latencies, 0.5):6.0f}us "
+          f"p99 {percentile(latencies, 0.99):6.0f}us, {(database.syncs - syncs) / elapsed:6.0f} syncs/s, "
+          f"{len(latencies) / max(1, database.syncs - syncs):5.1f} changes per sync")
+
+
+def fill_journal(path: str, count: int) -> None:
+    """
+    Append count changes to the journal, the lines the increments write.
+    """
+    user = create_users(1)["user0"]
+
+    with open(path, "a") as f:
+        for i in range(count):
+            user["username"] = f"user{i % USERS}"
+            f.write(json.dumps({"Key": user["username"], "Record": user}) + "\n")
+
+
+def recovery(count: int) -> float:
+    """
+    :return: the seconds to load the collection with its journal.
+    """
+    gc.collect()
+    database = Database(0, flush_interval=0)
+
+    start = time.perf_counter()
+    database.submit_read("Users")
+    elapsed = time.perf_counter() - start
+
+    database.shutdown()
+    del database
+    gc.collect()
+
+    return elapsed
+
+
+def main():
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+
+        path = Database.path("Tests", "Users")
+        journal_path = Database.journal_path("Tests", "Users")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        users = create_users(USERS)
+
+        # before: every change wrote the whole file.
+        start = time.perf_counter()
+        with open(path, "w") as f:
+            f.write(json.dumps(users, indent=4))
+        print(f"{USERS} users, one change before the journal (the whole file written): "
+              f"{(time.perf_counter() - start) * 1000:.0f}ms\n")
+
+        with open(path, "w") as f:
+            f.write(json.dumps(users))
+        del users
+        gc.collect()
+
+        database = Database(0, flush_interval=0)
+        database.submit_read("Users")
+
+        print("increments with the journal:")
+        for callers in CALLERS:
+            write_latency(database, callers)
+
+        start = time.perf_counter()
+        database.compact("Users")
+        print(f"\ncompaction: {(time.perf_counter() - start) * 1000:.0f}ms\n")
+
+        database.shutdown()
+        del database
+
+        print("recovery (snapshot load + journal replay):")
+        for count in JOURNALS:
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+
+            fill_journal(journal_path, count)
+            print(f"{count:>9} changes in the journal ({os.path.getsize(journal_path) / 1024 / 1024:5.0f}MB): "
+                  f"{recovery(count):6.2f}s")
+
+        os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
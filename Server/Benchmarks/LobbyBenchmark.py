@@ -0,0 +1,132 @@
+"""
+Throughput of game moves (the move, the leaderboard update and its broadcast to the lobby) with 1 to 8 lobbies
+played at the same time, every move on the mailbox of its lobby, against every move under one global lock.
+The clients are real client interfaces on socket pairs (aead channel, binary codec), the other ends are drained.
+Run from the repository root: python Server/Benchmarks/LobbyBenchmark.py
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import Codec
+import Encryption
+import Protocol
+from ClientInterface import Client
+from Lobby import LOBBY_WORKERS, Lobby
+from ThreadPool import ThreadPool
+from Writer import Writer
+
+PLAYERS = 4
+
+# the moves of every player.
+MOVES = 500
+
+LOBBIES = [1, 2, 4, 8]
+
+
+def drain(connection: socket.socket) -> None:
+    while connection.recv(1 << 16):
+        pass
+
+
+def connect(name: str) -> Client:
+    """
+    :return: a client interface on a socket pair, the other end is drained by a thread.
+    """
+    server_side, client_side = socket.socketpair()
+    threading.Thread(target=drain, args=(client_side,), daemon=True).start()
+
+    channel = Encryption.SecureChannel("aes-256-gcm", os.urandom(32), os.urandom(16), True)
+    client = Client(("127.0.0.1", 0), server_side, channel, Writer(0.005), username=name)
+    client.framing = Protocol.FRAMING_VERSION
+    client.codec = Codec.BINARY
+
+    return client
+
+
+def move(lobby: Lobby, player: Client, row: int, column: int) -> None:
+    """
+    A correct move, like the game move handler.
+    """
+    lobby.player_move(player, row, column, lobby.solution[row][column])
+    lobby.update_leaderboard()
+
+
+def create_lobbies(count: int, executor: ThreadPool) -> list:
+    lobbies = []
+
+    for i in range(count):
+        players = [connect(f"player{i}_{j}") for j in range(PLAYERS)]
+        lobby = Lobby(players[0], str(i), None, executor)
+
+        for player in players[1:]:
+            lobby.register_client(player)
+
+        lobby.start_game()
+        cells = [(row, column) for row in range(9) for column in range(9) if lobby.puzzle[row][column] == 0]
+        lobbies.append((lobby, players, cells))
+
+    return lobbies
+
+
+def play(lobbies: list, run_move) -> float:
+    """
+    Every player plays its moves on its own thread.
+    :return: the moves per second of all the lobbies.
+    """
+    def player_thread(lobby, player, cells):
+        for i in range(MOVES):
+            row, column = cells[i % len(cells)]
+            run_move(lobby, player, row, column)
+
+    threads = [threading.Thread(target=player_thread, args=(lobby, player, cells))
+               for lobby, players, cells in lobbies for player in players]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return len(threads) * MOVES / (time.perf_counter() - start)
+
+
+def stop(lobbies: list) -> None:
+    for lobby, players, cells in lobbies:
+        lobby.timer.cancel()
+
+        for player in players:
+            player.stop()
+            player.connection.close()
+
+
+def main():
+    executor = ThreadPool(LOBBY_WORKERS)
+    global_lock = threading.Lock()
+
+    def on_mailbox(lobby, player, row, column):
+        lobby.call(move, lobby, player, row, column)
+
+    def under_lock(lobby, player, row, column):
+        with global_lock:
+            move(lobby, player, row, column)
+
+    print(f"{PLAYERS} players per lobby, {MOVES} moves each, moves per second:")
+    for count in LOBBIES:
+        results = []
+
+        for run_move in (on_mailbox, under_lock):
+            lobbies = create_lobbies(count, executor)
+            results.append(play(lobbies, run_move))
+            stop(lobbies)
+
+        print(f"{count} lobbies: mailbox {results[0]:7.0f}, global lock {results[1]:7.0f}")
+
+
+if __name__ == '__main__':
+    main()
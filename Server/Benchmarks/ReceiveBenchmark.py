@@ -0,0 +1,77 @@
+"""
+Microbenchmark of the old receive loop (recv(1024) and bytes +=) against the preallocated receive buffer.
+Run from the repository root: python Server/Benchmarks/ReceiveBenchmark.py
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Protocol
+
+# message size -> amount of messages.
+SIZES = {1024: 20000, 64 * 1024: 2000, 1024 * 1024: 100}
+
+
+def read_concatenating(connection: socket.socket) -> bytes:
+    # the old way of building a message, chunk by chunk.
+    header = b""
+    while len(header) < Protocol.HEADER.size:
+        header += connection.recv(Protocol.HEADER.size - len(header))
+
+    length, message_type, flags = Protocol.HEADER.unpack(header)
+
+    message = b""
+    while len(message) < length:
+        message += connection.recv(min(1024, length - len(message)))
+
+    return message
+
+
+def run(size: int, count: int, buffered: bool) -> float:
+    """
+    Receive count frames of the given size.
+    :return: megabytes per second.
+    """
+    writer, reader = socket.socketpair()
+    frame = Protocol.pack_frame(Protocol.REQUEST, os.urandom(size))
+
+    def produce():
+        for _ in range(count):
+            writer.sendall(frame)
+
+    producer = threading.Thread(target=produce)
+
+    start = time.perf_counter()
+    producer.start()
+
+    if buffered:
+        buffer = Protocol.ReceiveBuffer(reader, max_message_size=2 * 1024 * 1024)
+        for _ in range(count):
+            buffer.read_frame()
+    else:
+        for _ in range(count):
+            read_concatenating(reader)
+
+    elapsed = time.perf_counter() - start
+    producer.join()
+
+    writer.close()
+    reader.close()
+
+    return size * count / elapsed / (1024 * 1024)
+
+
+def main():
+    print(f"{'size':>10} | {'bytes += MB/s':>14} | {'recv_into MB/s':>14} | {'speedup':>7}")
+    for size, count in SIZES.items():
+        old = run(size, count, False)
+        new = run(size, count, True)
+        print(f"{size:>10} | {old:>14,.1f} | {new:>14,.1f} | {new / old:>6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
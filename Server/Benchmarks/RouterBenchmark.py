@@ -0,0 +1,74 @@
+"""
+Cost of finding the handler of a command, the if/elif chain the server had (lower() on every comparison)
+against the Router, for the first and the last command of the chain.
+Run from the repository root: python Server/Benchmarks/RouterBenchmark.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+from Metrics import Metrics
+from Router import Router
+
+COMMANDS = ["register", "login", "create_lobby", "join_lobby", "leave_lobby", "get_lobby", "become_lobby_spectator",
+            "become_lobby_player", "make_lobby_spectator", "kick_user_lobby", "ban_user_lobby", "start_game",
+            "game_move", "chat_message", "add_friend", "accept_friend", "reject_friend", "get_friend_list",
+            "invite_friend", "accept_friend_invitation", "reject_friend_invitation", "get_friend_information"]
+
+REQUESTS = 200000
+
+
+class FakeClient:
+    address = ("127.0.0.1", 0)
+
+
+def handler(client, request, rid, request_id) -> None:
+    pass
+
+
+def chain(client, request: dict, request_id: int) -> None:
+    """
+    The if/elif dispatch of the server before the router, the handlers do nothing.
+    """
+    rid = request["Id"]
+
+    for command in COMMANDS:
+        if request["Command"].lower() == command:
+            handler(client, request, rid, request_id)
+            return
+
+
+def measure(dispatch, command: str) -> float:
+    """
+    :return: the microseconds of dispatching one request of the command.
+    """
+    client = FakeClient()
+    request = {"Id": 1, "Command": command.upper(), "Data": {}}
+
+    start = time.perf_counter()
+    for request_id in range(REQUESTS):
+        dispatch(client, request, request_id)
+
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+def main():
+    # the router logs every request, the log isn't what is measured.
+    utils.server_print = lambda *args: None
+
+    router = Router(Metrics())
+    for command in COMMANDS:
+        router.route(command, handler)
+
+    print(f"{len(COMMANDS)} commands, per request (the router also times the command):")
+    for command in (COMMANDS[0], COMMANDS[-1]):
+        chain_time = measure(chain, command)
+        router_time = measure(router.dispatch, command)
+        print(f"{command:>24}: chain {chain_time:5.2f} us, router {router_time:5.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Cost of validating the data of a valid request of every command with its compiled schema,
+and of the game move against the checks its handler did by hand before the schemas.
+Run from the repository root: python Server/Benchmarks/SchemaBenchmark.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Schemas import SCHEMAS, compile_schema
+
+VALIDATIONS = 200000
+
+# a valid data of every spec type.
+SAMPLES = {str: "player1", int: 4}
+
+
+def sample(schema: dict) -> dict:
+    """
+    :return: a valid data of the schema.
+    """
+    data = {}
+
+    for name, spec in schema.items():
+        if type(spec) is dict:
+            data[name] = sample(spec)
+        elif type(spec) is tuple:
+            data[name] = spec[1]
+        else:
+            data[name] = SAMPLES[spec]
+
+    return data
+
+
+def hand_checked_move(data: dict) -> str or None:
+    """
+    The checks of the game move handler before the schemas (without the range, it had none).
+    """
+    if "Move" not in data or type(data["Move"]) is not dict:
+        return "Not move provided."
+
+    if "row" not in data["Move"] or "column" not in data["Move"] or "value" not in data[
+        "Move"] or type(data["Move"]["row"]) is not int or type(
+            data["Move"]["column"]) is not int or type(data["Move"]["value"]) is not int:
+        return "Invalid move provided."
+
+    return None
+
+
+def measure(validate, data: dict) -> float:
+    """
+    :return: the nanoseconds of one validation.
+    """
+    start = time.perf_counter()
+    for _ in range(VALIDATIONS):
+        validate(data)
+
+    return (time.perf_counter() - start) / VALIDATIONS * 1e9
+
+
+def main():
+    start = time.perf_counter()
+    validators = {command: compile_schema(schema) for command, schema in SCHEMAS.items()}
+    print(f"compiled {len(validators)} schemas in {(time.perf_counter() - start) * 1000:.2f} ms\n")
+
+    print("per validation of a valid request:")
+    for command, validate in validators.items():
+        data = sample(SCHEMAS[command])
+        assert validate(data) is None
+        print(f"{command:>24}: {measure(validate, data):6.0f} ns")
+
+    move = sample(SCHEMAS["game_move"])
+    print(f"\n{'game_move by hand':>24}: {measure(hand_checked_move, move):6.0f} ns")
+
+    invalid = {"Move": {"row": 4, "column": 4, "value": True}}
+    print(f"{'invalid game_move':>24}: {measure(validators['game_move'], invalid):6.0f} ns "
+          f"({validators['game_move'](invalid)})")
+
+
+if __name__ == '__main__':
+    main()
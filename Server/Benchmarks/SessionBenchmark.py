@@ -0,0 +1,154 @@
+"""
+Cost of the session operations with many logged in users, the lists the server kept before
+(tokens, clients and the logged_clients dict) against the indexed SessionRegistry.
+Run from the repository root: python Server/Benchmarks/SessionBenchmark.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Sessions import SessionRegistry
+
+SESSIONS = 100000
+
+# the operations measured on the lists, every one scans them.
+LIST_OPERATIONS = 200
+
+# the operations measured on the registry.
+REGISTRY_OPERATIONS = 100000
+
+
+class ListSessions:
+    """
+    The session bookkeeping of the server before the registry.
+    """
+
+    def __init__(self):
+        self.clients = []
+        self.tokens = []
+        self.logged_clients = {}
+
+    def generate_auth_token(self) -> str:
+        token = "".join([random.choice(string.hexdigits) for _ in range(32)])
+
+        while token in self.tokens:
+            token = "".join([random.choice(string.hexdigits) for _ in range(32)])
+
+        return token
+
+    def connect(self, client) -> None:
+        self.clients.append(client)
+
+    def login(self, client, username: str) -> str:
+        token = self.generate_auth_token()
+        self.tokens.append(token)
+        client.token = token
+        self.logged_clients[username] = client
+
+        return token
+
+    def authenticate(self, client, token: str) -> bool:
+        return token == client.token
+
+    def disconnect(self, client) -> None:
+        self.clients.remove(client)
+        self.tokens.remove(client.token)
+
+
+class FakeClient:
+    __slots__ = ("token",)
+
+    def __init__(self):
+        self.token = None
+
+
+def fill(sessions, size: int) -> list:
+    """
+    :return: the (client, username, token) of size logged in clients.
+    """
+    users = []
+
+    for i in range(size):
+        client = FakeClient()
+        sessions.connect(client)
+        users.append((client, f"player{i}", sessions.login(client, f"player{i}")))
+
+    return users
+
+
+def fill_lists(sessions: ListSessions, size: int) -> list:
+    """
+    fill, without the token collision check of the lists, it makes filling them quadratic.
+    :return: the (client, username, token) of size logged in clients.
+    """
+    users = []
+
+    for i in range(size):
+        client = FakeClient()
+        client.token = "".join([random.choice(string.hexdigits) for _ in range(32)])
+        sessions.clients.append(client)
+        sessions.tokens.append(client.token)
+        sessions.logged_clients[f"player{i}"] = client
+        users.append((client, f"player{i}", client.token))
+
+    return users
+
+
+def measure(sessions, users: list, operations: int) -> dict:
+    """
+    :return: the microseconds of every operation, each one on a random logged in client.
+    """
+    results = {}
+    sample = random.sample(users, operations)
+
+    start = time.perf_counter()
+    for client, username, token in sample:
+        sessions.authenticate(client, token)
+    results["authenticate"] = (time.perf_counter() - start) / operations * 1e6
+
+    start = time.perf_counter()
+    for client, username, token in sample:
+        sessions.disconnect(client)
+    results["disconnect"] = (time.perf_counter() - start) / operations * 1e6
+
+    start = time.perf_counter()
+    for client, username, token in sample:
+        sessions.connect(client)
+        sessions.login(client, username)
+    results["connect + login"] = (time.perf_counter() - start) / operations * 1e6
+
+    return results
+
+
+def main():
+    random.seed(0)
+
+    lists = ListSessions()
+    list_users = fill_lists(lists, SESSIONS)
+
+    start = time.perf_counter()
+    registry = SessionRegistry()
+    registry_users = fill(registry, SESSIONS)
+    print(f"registry: {SESSIONS} logins in {time.perf_counter() - start:.1f} s")
+
+    list_results = measure(lists, list_users, LIST_OPERATIONS)
+    registry_results = measure(registry, registry_users, REGISTRY_OPERATIONS)
+
+    start = time.perf_counter()
+    registry.expire()
+    expire_time = (time.perf_counter() - start) * 1000
+
+    print(f"\nwith {SESSIONS} sessions, per operation:")
+    for name in list_results:
+        print(f"{name:>16}: lists {list_results[name]:9.1f} us, registry {registry_results[name]:5.2f} us "
+              f"({list_results[name] / registry_results[name]:.1f}x)")
+
+    print(f"\nregistry expire scan of {len(registry)} sessions: {expire_time:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
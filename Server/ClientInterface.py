@@ -1,24 +1,68 @@
 import socket
 import json
 import hashlib
+import time
 
 import utils
+import Codec
+import Compression
+import Encryption
+import Protocol
+from Writer import DRAIN_TIMEOUT, Writer
 
 
 class Client:
-    def __init__(self, address: tuple, con: socket.socket, cipher, **data):
+    def __init__(self, address: tuple, con: socket.socket, channel: Encryption.LegacyChannel, writer: Writer = None, **data):
         """
         Client interface for organized collection of the client data with the connection.
         :param address: the address of the client
         :param con: the socket connection with the client
+        :param channel: the encryption of the connection, replaced if the client negotiates a cipher.
+        :param writer: the writer of the connection, by default every message is sent right away.
         :param data: other data that connected to the client, the data will be saved in the data collection.
         """
         self.connection = con
         self.address = address
-        self.aes_cipher = cipher
+        self.channel = channel
         self.running = True
         self.data = data
 
+        # the negotiated framing version, legacy until the client sends a hello.
+        self.framing = Protocol.LEGACY_VERSION
+
+        # the negotiated codec of the hot messages.
+        self.codec = Codec.JSON
+
+        # the negotiated compression, messages from the threshold up are compressed.
+        self.compression = Compression.NONE
+        self.compression_threshold = Compression.DEFAULT_THRESHOLD
+
+        # the preallocated receive buffer of the connection.
+        self.receive_buffer = Protocol.ReceiveBuffer(con)
+
+        # the time in seconds between the pings the server offers, 0 for no heartbeat.
+        self.heartbeat_interval = 0
+
+        # the client negotiated the heartbeat, it answers the pings.
+        self.heartbeat = False
+
+        # the time (time.monotonic) of the last message from the client, a request or a pong.
+        self.last_seen = time.monotonic()
+
+        # the sequence number of the last ping and the time it was sent, None once its pong arrived.
+        self.pings = 0
+        self.ping_sent = None
+
+        # the round trip time in seconds of the last answered ping, None before the first pong.
+        self.rtt = None
+
+        # the server metrics, for the round trip times.
+        self.metrics = None
+
+        # responses and push notifications are queued from different threads, only the writer sends them.
+        self.writer = writer if writer is not None else Writer()
+        self.writer.start(self)
+
     def get_data(self, name: str):
         """
         Get a specific key from the data collection.
@@ -39,52 +83,274 @@ class Client:
         """
         self.data[name] = value
 
+    def negotiate(self) -> None:
+        """
+        Negotiate the wire protocol with the client, clients without a hello stay on the legacy framing.
+        """
+        # tls clients always send a hello, and a tls connection can't be peeked.
+        if self.channel.name != Encryption.TLS_CIPHER and not Protocol.peek_hello(self.connection):
+            utils.server_print("Handler", f"Client {self.address} is using the legacy framing.")
+            return
+
+        self.connection.sendall(self.accept_hello(Protocol.read_hello(self.connection)))
+
+    def accept_hello(self, capabilities: dict) -> bytes:
+        """
+        Choose the framing, the cipher and the codec of the connection from the client hello.
+        :param capabilities: the capabilities from the client hello.
+        :return: the hello reply, it must be sent before any other message.
+        """
+        self.framing = Protocol.negotiate_version(capabilities)
+
+        if self.channel.name == Encryption.TLS_CIPHER:
+            # the tls connection is already encrypted, the messages are sent as they are.
+            cipher = Encryption.TLS_CIPHER
+        else:
+            cipher = Encryption.choose_cipher(capabilities.get("Ciphers"))
+
+        # binary messages need the frame flags and have no checksum, so they're only sent on framed aead (or tls) connections.
+        if self.framing != Protocol.LEGACY_VERSION and cipher != Encryption.LEGACY_CIPHER:
+            self.codec = Codec.choose_codec(capabilities.get("Codecs"))
+
+        # the compressed flag needs the frame flags.
+        if self.framing != Protocol.LEGACY_VERSION:
+            self.compression = Compression.choose_compression(capabilities.get("Compression"))
+
+        # pings are frames, legacy clients only get the tcp keepalive.
+        self.heartbeat = self.framing != Protocol.LEGACY_VERSION and self.heartbeat_interval > 0 and capabilities.get("Heartbeat") is True
+
+        reply = {"Version": self.framing, "Cipher": cipher, "Codec": self.codec, "Compression": self.compression}
+
+        if self.heartbeat:
+            reply["Heartbeat"] = self.heartbeat_interval
+
+        reply = Protocol.create_hello(reply)
+
+        if cipher in Encryption.CIPHERS:
+            # one channel for the whole connection, the key and nonce are the ones from the key exchange.
+            self.channel = Encryption.SecureChannel(cipher, self.channel.key, self.channel.nonce, True)
+
+        utils.server_print("Handler", f"Client {self.address} negotiated framing version {self.framing} with {cipher}, {self.codec} codec and {self.compression} compression.")
+
+        return reply
+
+    def receive_message(self) -> (int, bytes):
+        """
+        Wait for the next message from the client.
+        :return: the flags of the message and the decrypted message.
+        """
+        if self.framing == Protocol.LEGACY_VERSION:
+            return self.open_message(Protocol.REQUEST, 0, self.receive_buffer.read_legacy_message())
+
+        return self.open_message(*self.receive_buffer.read_frame())
+
+    def open_message(self, message_type: int, flags: int, payload) -> (int, bytes):
+        """
+        Decrypt a message that was read from the client.
+        :param message_type: the type of the message from the frame header.
+        :param flags: the flags from the frame header.
+        :param payload: the encrypted message.
+        :return: the flags of the message and the decrypted message, an empty message for a ping or a pong.
+        """
+        self.last_seen = time.monotonic()
+
+        if self.framing == Protocol.LEGACY_VERSION:
+            return 0, self.decrypt(payload)
+
+        if message_type == Protocol.PING or message_type == Protocol.PONG:
+            # decrypted even if it isn't needed, the nonce counter of the channel must move on.
+            self.receive_heartbeat(message_type, Protocol.open_frame(self.channel, message_type, flags, payload))
+            return 0, b""
+
+        if message_type != Protocol.REQUEST:
+            raise Protocol.ProtocolError(f"Unexpected message type {message_type}.")
+
+        # the aead tag covers the header and the payload.
+        return flags, Protocol.open_frame(self.channel, message_type, flags, payload)
+
+    def ping(self) -> bool:
+        """
+        Send a ping to the client, its pong measures the round trip time.
+        :return: the success of the operation.
+        """
+        self.pings += 1
+        self.ping_sent = time.monotonic()
+
+        return self.send_message(Protocol.PING, Protocol.PING_PAYLOAD.pack(self.pings))
+
+    def receive_heartbeat(self, message_type: int, payload: bytes) -> None:
+        """
+        Answer a ping of the client, or measure the round trip time from the pong of the last ping.
+        :param message_type: PING or PONG.
+        :param payload: the decrypted payload.
+        """
+        if message_type == Protocol.PING:
+            self.send_message(Protocol.PONG, payload)
+            return
+
+        # the pong of an older ping (its round trip included a newer ping) is only a sign of life.
+        if self.ping_sent is None or len(payload) != Protocol.PING_PAYLOAD.size or Protocol.PING_PAYLOAD.unpack(payload)[0] != self.pings:
+            return
+
+        self.rtt = self.last_seen - self.ping_sent
+        self.ping_sent = None
+
+        if self.metrics is not None:
+            self.metrics.observe("heartbeat_rtt", self.rtt)
+
+    def send_message(self, message_type: int, message: bytes, flags: int = 0, urgent: bool = True, update: str = None) -> bool:
+        """
+        Queue a message to the client, the writer of the connection encrypts and sends it.
+        Never blocks on the connection, so the game thread can't be stalled by a slow client.
+        :param message_type: the type of the message (RESPONSE or PUSH_NOTIFICATION).
+        :param message: the plain message.
+        :param flags: the flags of the frame.
+        :param urgent: send the queue now (responses), instead of waiting for the flush deadline.
+        :param update: the update type of a push notification, a stale queued one may be replaced.
+        :return: the success of the operation.
+        """
+        return self.writer.put(message_type, message, flags, urgent, update)
+
+    def seal_messages(self, messages: list) -> list:
+        """
+        Encrypt and frame queued messages, only called by the writer so the messages are sent in the order of their nonces.
+        :param messages: the messages (message type, message, flags).
+        :return: the writes, each write is a list of buffers.
+        """
+        if self.framing != Protocol.LEGACY_VERSION:
+            # all the frames are sent in one write.
+            parts = []
+            for message_type, message, flags in messages:
+                parts.extend(Protocol.seal_frame_parts(self.channel, message_type, message, flags))
+
+            return [parts]
+
+        writes = []
+        for message_type, message, flags in messages:
+            # legacy clients expect the end of request signal on its own.
+            writes.append([self.encrypt(message)])
+            writes.append([Protocol.LEGACY_DELIMITER])
+
+        return writes
+
+    def write(self, parts: list) -> None:
+        """
+        Send one write to the client, blocks until it's sent.
+        :param parts: the buffers of the write.
+        """
+        Protocol.send_parts(self.connection, parts)
+
+    def encode_message(self, message: dict) -> (bytes, int):
+        """
+        Serialize a message, messages on a cipher without a tag carry an md5 checksum.
+        :param message: the message (without the checksum).
+        :return: the message as json or binary bytes, and the flags of the frame.
+        """
+        if self.codec == Codec.BINARY:
+            binary = Codec.encode(message)
+
+            if binary is not None:
+                return binary, Protocol.FLAG_BINARY
+
+        # a secret isn't compressed with other data, the compressed size could leak it.
+        secret = type(message.get("Data")) is dict and "Token" in message["Data"]
+
+        if not self.channel.authenticated:
+            # calc the checksum, md5 to hex. the message may be shared with other clients (broadcast), so it's copied.
+            message = {**message, "Checksum": self.create_checksum(message)}
+
+        # stringify the json format and encode to bytes.
+        message = json.dumps(message).encode('utf-8')
+
+        if self.compression == Compression.NONE or secret or len(message) < self.compression_threshold:
+            return message, 0
+
+        compressed = Compression.compress(self.compression, message)
+
+        if len(compressed) >= len(message):
+            return message, 0
+
+        return compressed, Protocol.FLAG_COMPRESSED
+
     def get_request(self) -> dict or None:
         """
         Wait for the client to send a request to the server.
-        :return: the request after formation.
+        A closed connection, or a message that can't be read (the rest of the stream can't be read either),
+        stops the client.
+        :return: the request after formation, None if the request was rejected (and answered) or the client stopped.
         """
-        rid = -1
-        try:
-            # wait for the request to arrive.
-            encrypted_request = b""
+        # empty messages (and pings and pongs) are skipped, in a loop since an idle client answers many pings.
+        request = b""
 
-            while True:
-                piece = self.connection.recv(1024)
-                if piece == b"-- End Request --":
-                    break
-                else:
-                    encrypted_request += piece
+        while request == b"":
+            try:
+                # wait for the request to arrive, the message is decrypted (and verified on an aead channel).
+                flags, request = self.receive_message()
 
-            # decrypt the request using the aes decryptor.
-            request = self.decrypt(encrypted_request)
+            except ConnectionResetError:
+                # if the connection is reset, return None.
+                self.running = False
+                return None
+
+            except Exception as e:
+                # print the exception
+                utils.server_print("Handler | get_request", str(e))
 
-            lower_request = request.lower()
+                # send an error response
+                self.send_response(-1, 400, "Bad Request")
+                self.running = False
+
+                return None
 
-            if request == "":
-                return self.get_request()
+        return self.parse_request(flags, request)
+
+    def parse_request(self, flags: int, request: bytes) -> dict or None:
+        """
+        Parse a decrypted request and check the format requirements.
+        :param flags: the flags of the message.
+        :param request: the decrypted request.
+        :return: the request after formation, None if the request is invalid.
+        """
+        rid = -1
+        try:
+            if flags & Protocol.FLAG_COMPRESSED:
+                request = Compression.decompress(self.compression, request, Protocol.MAX_MESSAGE_SIZE)
 
             # convert to json object.
-            request = json.loads(request)
-            lower_request = json.loads(lower_request)
+            if flags & Protocol.FLAG_BINARY and self.codec == Codec.BINARY:
+                request = Codec.decode(request)
+            else:
+                request = json.loads(request)
 
-            # --- check the format requirements (see CommsProtocol.md) ---
+            # --- check the format requirements (see CommsProtocol.md), the data is checked by its schema ---
 
-            if "id" not in lower_request:
+            if "Id" not in request:
                 self.send_response(rid, 400, "Bad Request", {"Msg": "Missing Request Id attribute."})
                 return None
 
-            rid = lower_request["id"]
+            rid = request["Id"]
 
-            if "command" not in lower_request:
+            if "Command" not in request:
                 self.send_response(rid, 400, "Bad Request", {"Msg": "Missing Command attribute."})
                 return None
 
-            if "data" not in lower_request:
+            if type(request["Command"]) is not str:
+                self.send_response(rid, 400, "Bad Request", {"Msg": "Invalid Command attribute, expected a string."})
+                return None
+
+            if "Data" not in request:
                 self.send_response(rid, 400, "Bad Request", {"Msg": "Missing Data attribute."})
                 return None
 
-            if "checksum" not in lower_request:
+            if "Token" in request and type(request["Token"]) is not str:
+                self.send_response(rid, 400, "Bad Request", {"Msg": "Invalid Token attribute, expected a string."})
+                return None
+
+            # the aead tag already verified the message.
+            if self.channel.authenticated:
+                return request
+
+            if "Checksum" not in request:
                 self.send_response(rid, 400, "Bad Request", {"Msg": "Missing Checksum attribute."})
                 return None
 
@@ -104,13 +370,9 @@ class Client:
 
             return request
 
-        except ConnectionResetError:
-            # if the connection is reset, return None.
-            return None
-
         except Exception as e:
             # print the exception
-            utils.server_print("Handler | get_request", str(e))
+            utils.server_print("Handler | parse_request", str(e))
 
             # send an error response
             self.send_response(rid, 400, "Bad Request")
@@ -119,27 +381,19 @@ class Client:
 
     def encrypt(self, data: bytes) -> bytes:
         """
-        Encrypt the data using the aes encryptor.
+        Encrypt the data using the connection channel.
         :param data: the data to encrypt.
         :return: the encrypted data.
         """
-        # create the aes encryptor.
-        aes_encryptor = self.aes_cipher.encryptor()
-
-        # encrypt the data using the aes encryptor.
-        return aes_encryptor.update(data) + aes_encryptor.finalize()
+        return self.channel.encrypt(data)
 
     def decrypt(self, data: bytes) -> bytes:
         """
-        Decrypt the data using the aes encryptor.
+        Decrypt the data using the connection channel.
         :param data: the data to decrypt.
         :return: the decrypted data.
         """
-        # create the aes decryptor.
-        aes_decryptor = self.aes_cipher.decryptor()
-
-        # decrypt the data using the aes decryptor.
-        return aes_decryptor.update(data) + aes_decryptor.finalize()
+        return self.channel.decrypt(data)
 
     def send_response(self, rid, status_code: int, status: str, data = None) -> bool:
         """
@@ -151,7 +405,6 @@ class Client:
         :return: the success of the operation.
         """
         try:
-            # group all the response (except the checksum) into a json to calc the checksum.
             response = {
                 "Id": rid,
                 "StatusCode": status_code,
@@ -162,29 +415,8 @@ class Client:
             if data is not None:
                 response["Data"] = data
 
-            # calc the checksum, md5 to hex.
-            checksum = self.create_checksum(response)
-
-            # add the checksum to the response
-            response["Checksum"] = checksum
-
-            # stringify the json format and encode to bytes.
-            stringify_response = json.dumps(response).encode('utf-8')
-
-            # encrypt the response using the aes encryptor.
-            encrypted_response = self.encrypt(stringify_response)
-
-            # send the response to the client.
-            sent = self.connection.send(encrypted_response)
-
-            # check if the sent response length is the same the original stringify response.
-            status = sent == len(encrypted_response)
-
-            if status:
-                # send the end of request signal to the client.
-                self.connection.send(b"-- End Request --")
-
-            return status
+            # encrypt and send the response to the client.
+            return self.send_message(Protocol.RESPONSE, *self.encode_message(response))
 
         except Exception as e:
             # print the exception to the console
@@ -200,7 +432,6 @@ class Client:
         :return:
         """
         try:
-            # group all the response (except the checksum) into a json to calc the checksum.
             response = {
                 "Update": update,
             }
@@ -209,35 +440,52 @@ class Client:
             if data is not None:
                 response["Data"] = data
 
-            # calc the checksum, md5 to hex.
-            checksum = self.create_checksum(response)
+            # queue the push notification, it's sent with the other messages of this flush.
+            return self.send_message(Protocol.PUSH_NOTIFICATION, *self.encode_message(response), urgent=False, update=update)
 
-            # add the checksum to the response
-            response["Checksum"] = checksum
+        except Exception as e:
+            # print the exception to the console
+            utils.server_print("Handler | send_response", str(e))
+
+            return False
 
-            # stringify the json format and encode to bytes.
-            stringify_response = json.dumps(response).encode('utf-8')
+    @staticmethod
+    def broadcast(clients: list, update: str, data: dict = None, exclude=None) -> None:
+        """
+        Send the same push notification to many clients.
+        The message is built and serialized once for every encoding (codec, checksum and compression) in use,
+        only the encryption and the framing are done for each client.
+        :param clients: the clients to notify.
+        :param update: the update type of the push notification.
+        :param data: the data of the push notification.
+        :param exclude: a client that shouldn't be notified (usually the one that caused the update).
+        """
+        response = {
+            "Update": update,
+        }
 
-            # encrypt the response using the aes encryptor.
-            encrypted_response = self.encrypt(stringify_response)
+        # add the data if exists.
+        if data is not None:
+            response["Data"] = data
 
-            # send the response to the client.
-            sent = self.connection.send(encrypted_response)
+        # (codec, authenticated, compression, threshold) -> (message, flags)
+        encoded = {}
 
-            # check if the sent response length is the same the original stringify response.
-            status = sent == len(encrypted_response)
+        for client in clients:
+            if client is exclude:
+                continue
 
-            if status:
-                # send the end of request signal to the client.
-                self.connection.send(b"-- End Request --")
+            try:
+                encoding = (client.codec, client.channel.authenticated, client.compression, client.compression_threshold)
 
-            return status
+                if encoding not in encoded:
+                    encoded[encoding] = client.encode_message(response)
 
-        except Exception as e:
-            # print the exception to the console
-            utils.server_print("Handler | send_response", str(e))
+                client.send_message(Protocol.PUSH_NOTIFICATION, *encoded[encoding], urgent=False, update=update)
 
-            return False
+            except Exception as e:
+                # one broken connection shouldn't stop the others from getting the notification.
+                utils.server_print("Handler | broadcast", str(e))
 
     @staticmethod
     def create_checksum(subject: dict) -> str:
@@ -249,5 +497,22 @@ class Client:
 
         return hashlib.md5(json.dumps(subject).encode('utf-8')).hexdigest()
 
+    def abort(self) -> None:
+        """
+        Close the connection without a goodbye, the handler sees the connection closed and disconnects the client.
+        The queued messages are dropped.
+        """
+        self.running = False
+        self.writer.close()
+
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
     def stop(self):
+        """
+        Stop the client, the queued messages (the response to its last request) are sent first.
+        """
         self.running = False
+        self.writer.close(DRAIN_TIMEOUT)
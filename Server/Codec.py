@@ -0,0 +1,215 @@
+"""
+The compact binary codec of the hot messages (game moves, leaderboards and the started game board).
+All the other messages stay json. The codec is agreed on in the hello (see CommsProtocol.md).
+"""
+import struct
+
+JSON = "json"
+BINARY = "binary"
+
+# the first byte of every binary message.
+OP_GAME_MOVE = 1
+OP_LEADERBOARD = 2
+OP_GAME_STARTED = 3
+
+# opcode, request id, row, column, value, token length.
+GAME_MOVE = struct.Struct("!BIBBBB")
+
+# the amount of leaderboard entries.
+ENTRY_COUNT = struct.Struct("!H")
+
+# username length, then the username and the score.
+ENTRY_NAME = struct.Struct("!B")
+ENTRY_SCORE = struct.Struct("!i")
+
+# opcode, then 81 board cells, the ending time length and the leaderboard.
+GAME_STARTED = struct.Struct("!B81sB")
+
+BOARD_SIZE = 9
+
+
+class CodecError(Exception):
+    """
+    Raised when a binary message can't be decoded.
+    """
+    pass
+
+
+def choose_codec(offered: list) -> str:
+    """
+    Choose the codec of the connection from the codecs the client offered.
+    :param offered: the codec names from the client hello.
+    :return: BINARY if the client supports it, otherwise JSON.
+    """
+    if type(offered) is list and BINARY in offered:
+        return BINARY
+
+    return JSON
+
+
+def is_byte(value) -> bool:
+    return type(value) is int and 0 <= value <= 255
+
+
+def encode(message: dict) -> bytes or None:
+    """
+    Encode a hot message in the binary form.
+    :param message: the message, as it would be sent in json (without a checksum).
+    :return: the binary message, or None if the message should be sent as json.
+    """
+    if "Command" in message:
+        if type(message["Command"]) is str and message["Command"].lower() == "game_move":
+            return encode_game_move(message)
+
+        return None
+
+    if message.get("Update") == "Leaderboard" and message.keys() == {"Update", "Data"}:
+        if type(message["Data"]) is dict and message["Data"].keys() == {"Leaderboard"}:
+            leaderboard = encode_leaderboard(message["Data"]["Leaderboard"])
+
+            if leaderboard is not None:
+                return bytes([OP_LEADERBOARD]) + leaderboard
+
+    if message.get("Update") == "Game_Started" and message.keys() == {"Update", "Data"}:
+        return encode_game_started(message["Data"])
+
+    return None
+
+
+def encode_game_move(request: dict) -> bytes or None:
+    """
+    Encode a game_move request, 9 bytes and the token.
+    """
+    if not request.keys() <= {"Id", "Command", "Data", "Token"} or type(request.get("Data")) is not dict:
+        return None
+
+    move = request["Data"].get("Move")
+
+    if request["Data"].keys() != {"Move"} or type(move) is not dict or move.keys() != {"row", "column", "value"}:
+        return None
+
+    if not all(is_byte(move[key]) for key in ("row", "column", "value")):
+        return None
+
+    rid = request.get("Id")
+    if type(rid) is not int or not 0 <= rid < 2 ** 32:
+        return None
+
+    token = request.get("Token", "")
+    if type(token) is not str or not token.isascii() or len(token) > 255:
+        return None
+
+    return GAME_MOVE.pack(OP_GAME_MOVE, rid, move["row"], move["column"], move["value"], len(token)) + token.encode('ascii')
+
+
+def encode_leaderboard(leaderboard: list) -> bytes or None:
+    """
+    Encode a leaderboard, the amount of entries and then the username and the score of each entry.
+    """
+    if type(leaderboard) is not list or len(leaderboard) > 0xffff:
+        return None
+
+    parts = [ENTRY_COUNT.pack(len(leaderboard))]
+
+    for entry in leaderboard:
+        if type(entry) not in (list, tuple) or len(entry) != 2 or type(entry[0]) is not str or type(entry[1]) is not int:
+            return None
+
+        username = entry[0].encode('utf-8')
+
+        if len(username) > 255 or not -2 ** 31 <= entry[1] < 2 ** 31:
+            return None
+
+        parts.append(ENTRY_NAME.pack(len(username)) + username + ENTRY_SCORE.pack(entry[1]))
+
+    return b"".join(parts)
+
+
+def encode_game_started(data: dict) -> bytes or None:
+    """
+    Encode the Game_Started push notification, the board is sent as 81 bytes.
+    """
+    if type(data) is not dict or data.keys() != {"Board", "Leaderboard", "Ending_Time"}:
+        return None
+
+    board = data["Board"]
+
+    if type(board) is not list or len(board) != BOARD_SIZE:
+        return None
+
+    cells = bytearray()
+    for row in board:
+        if type(row) is not list or len(row) != BOARD_SIZE or not all(type(cell) is int and 0 <= cell <= 9 for cell in row):
+            return None
+
+        cells += bytes(row)
+
+    ending_time = data["Ending_Time"]
+    if type(ending_time) is not str or not ending_time.isascii() or len(ending_time) > 255:
+        return None
+
+    leaderboard = encode_leaderboard(data["Leaderboard"])
+    if leaderboard is None:
+        return None
+
+    return GAME_STARTED.pack(OP_GAME_STARTED, bytes(cells), len(ending_time)) + ending_time.encode('ascii') + leaderboard
+
+
+def decode(payload) -> dict:
+    """
+    Decode a binary message back to the json form.
+    :param payload: the binary message.
+    :return: the message, the same as the json message would be.
+    """
+    try:
+        opcode = payload[0]
+
+        if opcode == OP_GAME_MOVE:
+            _, rid, row, column, value, token_length = GAME_MOVE.unpack_from(payload)
+            request = {"Id": rid, "Command": "game_move", "Data": {"Move": {"row": row, "column": column, "value": value}}}
+
+            if token_length:
+                request["Token"] = bytes(payload[GAME_MOVE.size:GAME_MOVE.size + token_length]).decode('ascii')
+
+            return request
+
+        if opcode == OP_LEADERBOARD:
+            leaderboard, _ = decode_leaderboard(payload, 1)
+            return {"Update": "Leaderboard", "Data": {"Leaderboard": leaderboard}}
+
+        if opcode == OP_GAME_STARTED:
+            _, cells, time_length = GAME_STARTED.unpack_from(payload)
+            offset = GAME_STARTED.size
+            ending_time = bytes(payload[offset:offset + time_length]).decode('ascii')
+            leaderboard, _ = decode_leaderboard(payload, offset + time_length)
+            board = [list(cells[row * BOARD_SIZE:(row + 1) * BOARD_SIZE]) for row in range(BOARD_SIZE)]
+
+            return {"Update": "Game_Started", "Data": {"Board": board, "Leaderboard": leaderboard, "Ending_Time": ending_time}}
+
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise CodecError(f"Invalid binary message: {e}")
+
+    raise CodecError(f"Unknown binary opcode {opcode}.")
+
+
+def decode_leaderboard(payload, offset: int) -> (list, int):
+    """
+    Decode a leaderboard that starts at the offset.
+    :return: the leaderboard and the offset after it.
+    """
+    count, = ENTRY_COUNT.unpack_from(payload, offset)
+    offset += ENTRY_COUNT.size
+
+    leaderboard = []
+    for _ in range(count):
+        length, = ENTRY_NAME.unpack_from(payload, offset)
+        offset += ENTRY_NAME.size
+        username = bytes(payload[offset:offset + length]).decode('utf-8')
+        offset += length
+        score, = ENTRY_SCORE.unpack_from(payload, offset)
+        offset += ENTRY_SCORE.size
+
+        # the json form of a tuple is a list.
+        leaderboard.append([username, score])
+
+    return leaderboard, offset
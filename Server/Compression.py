@@ -0,0 +1,154 @@
+"""
+The per message compression of large payloads, agreed on in the hello (see CommsProtocol.md).
+Every message is compressed on its own (raw deflate), so a dropped or reordered message doesn't break the others,
+the dictionary gives the small messages the repeated field names without a shared stream.
+"""
+import collections
+import json
+import re
+import zlib
+
+NONE = "none"
+ZLIB = "zlib"
+
+# the dictionary is part of the name, both sides must use exactly the same bytes.
+ZLIB_DICTIONARY = "zlib-dict-1"
+
+# messages smaller than this are sent as they are, see Benchmarks/CompressionBenchmark.py to pick it.
+DEFAULT_THRESHOLD = 512
+
+LEVEL = 6
+
+# a smaller hash table than the default (8), the messages are small and allocating it is most of the cost.
+MEM_LEVEL = 4
+
+# raw deflate, no zlib header and checksum, the aead tag already covers the message.
+WBITS = -15
+
+DICTIONARY_SIZE = 4 * 1024
+
+# a json string (with its colon if it's a key), a number or a single character.
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"\s*:?\s*|-?\d+(?:\.\d+)?|\S')
+
+
+class CompressionError(Exception):
+    """
+    Raised when a compressed message can't be decompressed.
+    """
+    pass
+
+
+def train_dictionary(samples: list, size: int = DICTIONARY_SIZE) -> bytes:
+    """
+    Create a deflate dictionary from typical messages.
+    The tokens that repeat across the samples are kept, the most common ones at the end of the dictionary,
+    since deflate finds the close matches with the shortest codes.
+    :param samples: the typical messages (bytes).
+    :param size: the largest size of the dictionary.
+    :return: the dictionary.
+    """
+    counts = collections.Counter()
+
+    for sample in samples:
+        counts.update(TOKEN.findall(sample))
+
+    tokens = sorted((token for token, count in counts.items() if count > 1 and len(token) > 2),
+                    key=lambda token: (counts[token] * len(token), token))
+
+    return b"".join(tokens)[-size:]
+
+
+def typical_messages() -> list:
+    """
+    :return: the typical large messages of the server, the samples of the shipped dictionary.
+    """
+    friends = [{"username": f"player{i}", "last_login": "2025-05-20 02:42:53", "playtime": i * 7, "games_played": i * 3,
+                "games_won": i, "account_level": i % 10 + 1, "status": "Online" if i % 2 else "Offline"} for i in range(8)]
+    leaderboard = [[f"player{i}", 100 - i * 8] for i in range(6)]
+    lobby = {"code": "ABC123", "owner": "player0", "started": False, "max_players": 6,
+             "players": [f"player{i}" for i in range(6)], "spectators": 2,
+             "players_colors": ["#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#FF00FF", "#00FFFF"]}
+
+    messages = [
+        {"Id": 1, "StatusCode": 200, "Status": "OK", "Data": {"Friends": [friends, ["player9"]]}},
+        {"Id": 2, "StatusCode": 200, "Status": "OK", "Data": {"Msg": "Friend request accepted.", "Friends": [friends[:4], []]}},
+        {"Id": 3, "StatusCode": 201, "Status": "Created", "Data": {"Msg": "Lobby created successfully.", "Lobby_Info": lobby}},
+        {"Id": 4, "StatusCode": 200, "Status": "OK", "Data": {"Msg": "Successfully joining lobby.", "Lobby_Info": lobby, "Role": "players"}},
+        {"Id": 5, "StatusCode": 200, "Status": "OK", "Data": {"Lobby_Info": lobby}},
+        {"Update": "Game_Over", "Data": {"Winner": "player0", "Leaderboard": leaderboard}},
+        {"Update": "Leaderboard", "Data": {"Leaderboard": leaderboard}},
+        {"Update": "Friend_Request_Accepted", "Data": {"Username": "player1", "New_Friend_List": [friends, []]}},
+    ]
+
+    return [json.dumps(message).encode('utf-8') for message in messages]
+
+
+DICTIONARY = train_dictionary(typical_messages())
+
+# the dictionary of every method.
+METHODS = {
+    ZLIB_DICTIONARY: DICTIONARY,
+    ZLIB: b"",
+}
+
+
+def choose_compression(offered: list) -> str:
+    """
+    Choose the compression of the connection from the methods the client offered.
+    :param offered: the compression names from the client hello.
+    :return: the first supported method the client offered, otherwise NONE.
+    """
+    if type(offered) is not list:
+        return NONE
+
+    for name in offered:
+        if name in METHODS:
+            return name
+
+    return NONE
+
+
+def compress(method: str, data: bytes) -> bytes:
+    """
+    Compress one message.
+    :param method: the negotiated method (see METHODS).
+    :param data: the serialized message.
+    :return: the compressed message.
+    """
+    if METHODS[method]:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS, MEM_LEVEL, zdict=METHODS[method])
+    else:
+        compressor = zlib.compressobj(LEVEL, zlib.DEFLATED, WBITS, MEM_LEVEL)
+
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(method: str, data, max_size: int) -> bytes:
+    """
+    Decompress one message, bounded so a small message can't expand without a limit.
+    :param method: the negotiated method (see METHODS).
+    :param data: the compressed message.
+    :param max_size: the largest size of the decompressed message.
+    :return: the decompressed message.
+    """
+    if method not in METHODS:
+        raise CompressionError("Compression wasn't negotiated.")
+
+    try:
+        if METHODS[method]:
+            decompressor = zlib.decompressobj(WBITS, zdict=METHODS[method])
+        else:
+            decompressor = zlib.decompressobj(WBITS)
+
+        message = decompressor.decompress(data, max_size)
+
+    except zlib.error as e:
+        raise CompressionError(f"Invalid compressed message: {e}")
+
+    if decompressor.unconsumed_tail:
+        raise CompressionError(f"Decompressed message is over the limit of {max_size} bytes.")
+
+    if not decompressor.eof:
+        raise CompressionError("Compressed message is incomplete.")
+
+    return message
@@ -0,0 +1,45 @@
+"""
+The storage backends of the database, selected with server.database.type of project.json.
+Both have the record operations (get, insert, patch, increment, append, remove), flush and shutdown.
+"""
+import json
+import os
+
+from Server.Database.Database import COMMIT_WINDOW, MAX_BATCH, Database
+from Server.Database.SqliteDatabase import SqliteDatabase
+
+JSON = "json"
+SQLITE = "sqlite"
+BACKENDS = [JSON, SQLITE]
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "project.json")
+
+
+def configured_backend(path: str = CONFIG_PATH) -> str:
+    """
+    :param path: the project config.
+    :return: the backend of the config, json if it has none.
+    """
+    try:
+        with open(path, "r") as f:
+            backend = json.load(f)["server"]["database"]["type"]
+    except (OSError, ValueError, KeyError):
+        return JSON
+
+    return backend if backend in BACKENDS else JSON
+
+
+def open_database(profile: int, backend: str = JSON, commit_window: float = COMMIT_WINDOW,
+                  max_batch: int = MAX_BATCH) -> Database or SqliteDatabase:
+    """
+    :param profile: database profile id, 0 - tests, 1 - official.
+    :param backend: one of BACKENDS.
+    :param commit_window: the group commit window of the json database, in seconds.
+    :param max_batch: the most changes the json database syncs together.
+    :return: the database of the profile on the backend.
+    """
+    # every statement of SQLite is its own commit, and in WAL mode with synchronous=NORMAL a commit isn't synced.
+    if backend == SQLITE:
+        return SqliteDatabase(profile)
+
+    return Database(profile, commit_window=commit_window, max_batch=max_batch)
@@ -1,81 +1,271 @@
+import atexit
+import copy
 import json
 import os
 import threading
-from queue import Queue
+import time
+from concurrent.futures import Future
+from queue import Empty, Queue
 
 import Server.utils as utils
 
+# the time in seconds between the flushes: the journal is synced and the collections that need a new snapshot
+# are compacted.
+FLUSH_INTERVAL = 5
+
+# the time in seconds the worker waits for more changes after the first change of a batch, the changes of the window
+# are synced together (group commit). With 0 the batch is the changes queued while the previous batch was synced,
+# which is enough when a sync is fast, a slow disk may sync less with a window of a few ms.
+COMMIT_WINDOW = 0
+
+# the most changes synced together.
+MAX_BATCH = 256
+
+# the size in bytes of a journal that is compacted into a new snapshot of its collection.
+COMPACT_SIZE = 64 * 1024 * 1024
+
+# the time in seconds a blocking call waits for the worker before it raises a TimeoutError.
+TIMEOUT = 30
+
+
 class Database:
-    def __init__(self, profile: int):
+    def __init__(self, profile: int, flush_interval: float = FLUSH_INTERVAL, commit_window: float = COMMIT_WINDOW,
+                 max_batch: int = MAX_BATCH):
         """
         Manage the database to prevent overriding and problems, also for easy use.
         Simple implementations.
         Profile is a temp solution for the config and run system.
+        The collections stay in memory once they were read, reads and updates are served from memory.
+        Every record change is appended to the journal of its collection (the new record, one JSON line), and
+        replayed over the snapshot (the collection file) when the collection is loaded.
+        The changes are committed in groups: the changes submitted within commit_window seconds of the first change
+        of a batch (or until max_batch changes) are written and synced together, and every change resolves its
+        future once its batch is synced, so the result of a change means it's durable. A change whose journal
+        couldn't be written raises an OSError, but it stays in memory and is written with the next batch, so it may
+        still persist (at least once).
+        A journal over COMPACT_SIZE, and a collection replaced as a whole (update), is compacted in the background:
+        a fresh snapshot is written through a temporary file and a rename, and the journal it covers is removed.
+        The tasks run one at a time on the worker thread, every submitted task returns a concurrent.futures.Future,
+        so a caller may block on it with a timeout (future.result(timeout)), register a callback
+        (future.add_done_callback) or await it on an event loop (await asyncio.wrap_future(future)).
         :param profile: database profile id, 0 - tests, 1 - official.
+        :param flush_interval: the time in seconds between the flushes, 0 to flush only on flush() and shutdown().
+        :param commit_window: the time in seconds a batch of changes waits for more changes before it's synced.
+        :param max_batch: the most changes synced together.
         """
         # set the default profile to be 0 in case of unrecognized profile.
         self.profile = "Tests" if profile not in [0, 1] else "Tests" if profile == 0 else "Official"
 
-        # the Queue.Queue is thread-safe, so multiple threads can access it concurrently.
-        self.task_queue = []
-        self.shutdown_event = threading.Event()
+        # collection: its data, loaded from the file on the first read.
+        self.collections = {}
+
+        # the collections replaced as a whole since their snapshot, their journal doesn't cover it.
+        self.dirty = set()
+
+        # guards the collections and the dirty set.
+        self.lock = threading.Lock()
+
+        # only one flush compacts at a time (the interval flush and the shutdown flush).
+        self.flush_lock = threading.Lock()
+
+        # collection: the journal lines not written yet.
+        self.pending = {}
+
+        # the collections the running task added journal lines to, a task that added lines waits for their sync.
+        self.journaled = set()
+
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+
+        # collection: its open journal file, and the bytes in it.
+        self.journals = {}
+        self.journal_sizes = {}
+
+        # the syncs of the journals, for the benchmarks.
+        self.syncs = 0
 
-        # create the thread
-        thread = threading.Thread(target=self.worker)
+        # guards the pending lines and the journal files, taken inside the lock and never the other way.
+        self.journal_lock = threading.Lock()
 
-        # ensures threads exit when the main program exits
-        thread.daemon = True
+        self.flush_interval = flush_interval
+        self.flusher_stopped = threading.Event()
 
-        # start running the thread on the worker function
-        thread.start()
+        # (future, task, args), the worker blocks on the queue while it's empty, a None stops it.
+        self.tasks = Queue()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+        if self.flush_interval > 0:
+            threading.Thread(target=self.flusher, daemon=True).start()
+
+        # the pending changes are written even if the server isn't stopped with shutdown().
+        atexit.register(self.flush)
 
         utils.server_print("Database", "Database worker is running")
 
-    def worker(self):
+    def worker(self) -> None:
         """
-        The worker function that will handle all the db jobs
-        :return:
+        Run the submitted tasks one by one, sleeps on the queue while there are none.
+        The results of the changes are held in the batch until the batch is synced, the other results (reads,
+        changes that didn't change anything) are set right away.
         """
-        while not self.shutdown_event.is_set():
-            try:
-                # get a task from the queue
-                obj = self.task_queue.pop(0)
+        # (future, result, collections) of the changes waiting for the sync.
+        batch = []
+        deadline = 0
 
+        while True:
+            if not batch:
+                item = self.tasks.get()
+            else:
                 try:
-                    # execute the task and store the result
-                    result = obj[0](*obj[2])
+                    # the tasks queued after the window are still part of the batch, up to max_batch.
+                    item = self.tasks.get(timeout=max(0, deadline - time.monotonic()))
+                except Empty:
+                    self.commit(batch)
+                    batch = []
+                    continue
 
-                    if obj[1]:
-                        # push the result to the result queue
-                        obj[1].put(result)
+            if item is None:
+                self.commit(batch)
+                return
 
-                except Exception as e:
-                    utils.server_print("Database", f"Error processing db task: {e}")
-            finally:
+            future, task, args = item
+
+            # the caller cancelled the task before it started.
+            if not future.set_running_or_notify_cancel():
                 continue
 
-    def submit_read(self, collection: str) -> str or None:
+            self.journaled = set()
+
+            try:
+                result = task(*args)
+            except Exception as e:
+                utils.server_print("Database", f"Error processing db task: {e}")
+                future.set_exception(e)
+                continue
+
+            if not self.journaled:
+                future.set_result(result)
+                continue
+
+            if not batch:
+                deadline = time.monotonic() + self.commit_window
+
+            batch.append((future, result, self.journaled))
+
+            if len(batch) >= self.max_batch:
+                self.commit(batch)
+                batch = []
+
+    def commit(self, batch: list) -> None:
+        """
+        Sync the journal lines of a batch of changes and set their results, one write and one sync per journal.
+        A change whose journal couldn't be written gets an OSError, the changes of the other journals succeed.
+        The failed change isn't undone, it stays in memory and its line is written with the next batch, so the
+        OSError means the change isn't durable yet, not that it's gone.
+        :param batch: (future, result, the collections of the change) of the changes.
+        """
+        if not batch:
+            return
+
+        with self.journal_lock:
+            failed = self.write_pending()
+
+        for future, result, collections in batch:
+            if collections & failed:
+                future.set_exception(OSError("The change couldn't be written to the journal yet, it's written with the next changes."))
+            else:
+                future.set_result(result)
+
+    def submit(self, task, *args) -> Future:
+        """
+        Run a task on the worker, after the tasks submitted before it.
+        :param task: the function to run.
+        :param args: the arguments of the function.
+        :return: the future of the result of the task.
         """
-        Submit a read command to the worker queue.
+        if self.closed:
+            raise RuntimeError("Database is shut down.")
+
+        future = Future()
+        self.tasks.put((future, task, args))
+
+        return future
+
+    def read_future(self, collection: str) -> Future:
+        """
+        Read a collection without blocking, a resident collection is returned as a completed future.
         :param collection: the collection to work on.
+        :return: the future of the data of the collection.
+        """
+        with self.lock:
+            if collection in self.collections:
+                future = Future()
+                future.set_result(self.collections[collection])
+                return future
+
+        return self.submit(self.read, self.profile, collection)
+
+    def update_future(self, collection: str, data: dict) -> Future:
+        """
+        Update a collection without blocking.
+        :param collection: the collection to work on.
+        :param data: the new data of the collection.
+        :return: the future of the success of the update.
+        """
+        return self.submit(self.update, self.profile, collection, data)
+
+    def submit_read(self, collection: str, timeout: float = TIMEOUT) -> str or None:
+        """
+        Read a collection, the first read loads it on the worker, then it's served from memory.
+        :param collection: the collection to work on.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
         :return: the data from the collection.
         """
-        result_queue = Queue()
+        # a resident collection is served right away, only the first read of a collection waits for its file.
+        with self.lock:
+            if collection in self.collections:
+                return self.collections[collection]
 
-        self.task_queue.append((self.read, result_queue, [self.profile, collection]))
+        return self.submit(self.read, self.profile, collection).result(timeout)
 
-        while result_queue.empty():
-            continue
+    def read(self, profile, collection: str) -> str or None:
+        """
+        Get a collection, from memory once it was loaded.
+        :param profile: The profile of the database.
+        :param collection: The collection to read.
+        :return: the data of the collection, it's the data in memory so it's shared with the other readers.
+        """
+        with self.lock:
+            if collection in self.collections:
+                return self.collections[collection]
 
-        return result_queue.get()
+        data = self.load(profile, collection)
 
-    @staticmethod
-    def read(profile, collection: str) -> str or None:
+        with self.lock:
+            # a missing or broken file isn't kept, so it's read again once fixed.
+            if data is not None:
+                data = self.collections.setdefault(collection, data)
+
+        return data
+
+    def load(self, profile, collection: str) -> str or None:
+        """
+        Read a collection from its file, and replay its journal over it.
+        """
         try:
-            with open(os.getcwd() + f"\\Database\\{profile}\\{collection}.json", "r") as f:
+            with open(self.path(profile, collection), "r") as f:
                 data = json.load(f)
 
-                return data
+            start_time = time.monotonic()
+            replayed = self.replay(profile, collection, data)
+
+            if replayed:
+                utils.server_print("Database", f"Replayed {replayed} changes of {collection} in {(time.monotonic() - start_time) * 1000:.0f} ms.")
+
+            return data
         except FileNotFoundError:
             print(f"File not found: {collection}.json")
             return None
@@ -86,36 +276,493 @@ class Database:
             print(f"Error processing db task: {e}")
             return None
 
-    def submit_update(self, collection: str, data: dict) -> bool:
+    @staticmethod
+    def path(profile: str, collection: str) -> str:
         """
-        Submit an update command to the worker queue.
-        :param collection: the collection to work on.
-        :param data: the new data to be writen the collection.
-        :return: The success of the update command.
+        :return: the file of the collection.
         """
-        result_queue = Queue()
+        return os.path.join(os.getcwd(), "Database", profile, f"{collection}.json")
 
-        self.task_queue.append((self.update, result_queue, [self.profile, collection, data]))
+    @staticmethod
+    def journal_path(profile: str, collection: str) -> str:
+        """
+        :return: the journal file of the collection, the journal of a compaction in progress has a .1 suffix.
+        """
+        return os.path.join(os.getcwd(), "Database", profile, f"{collection}.journal")
 
-        while result_queue.empty():
-            continue
+    def replay(self, profile: str, collection: str, data: dict) -> int:
+        """
+        Apply the journal of a collection to its snapshot, the journal of an interrupted compaction first.
+        Replaying a line that is already in the snapshot sets the same record again, so it's harmless.
+        Only the final line may be cut by a crash mid-append (it's unreadable or it misses its newline), it was never
+        acknowledged, so it's truncated and the next lines aren't appended to it. An unreadable line before it is
+        skipped, the acknowledged lines after it are still replayed.
+        :param profile: The profile of the database.
+        :param collection: The collection of the journal.
+        :param data: the snapshot of the collection, changed in place.
+        :return: the amount of replayed changes.
+        """
+        path = self.journal_path(profile, collection)
+        replayed = 0
+        size = 0
 
-        return result_queue.get()
+        for journal in (path + ".1", path):
+            try:
+                f = open(journal, "rb+")
+            except FileNotFoundError:
+                continue
 
-    @staticmethod
-    def update(profile: str, collection: str, data: dict) -> bool:
+            with f:
+                end = os.fstat(f.fileno()).st_size
+                offset = 0
+
+                for line in f:
+                    start, offset = offset, offset + len(line)
+
+                    try:
+                        entry = json.loads(line)
+                        key, record = entry["Key"], entry["Record"]
+                    except (ValueError, KeyError, TypeError):
+                        entry = None
+
+                    if offset == end and (entry is None or not line.endswith(b"\n")):
+                        utils.server_print("Database", f"Journal {journal} was cut at {start} bytes, truncating it.")
+                        f.truncate(start)
+                        offset = start
+                        break
+
+                    if entry is None:
+                        # the blank lines separate the lines of a write that couldn't be truncated (write_pending).
+                        if line.strip():
+                            utils.server_print("Database", f"Skipping an unreadable line of {journal} at {start} bytes.")
+                        continue
+
+                    data[key] = record
+                    replayed += 1
+
+                size += offset
+
+        with self.journal_lock:
+            self.journal_sizes[collection] = size
+
+        return replayed
+
+    def submit_update(self, collection: str, data: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Update a collection on the worker, in order with the other tasks, the changed collections are written
+        in the background.
+        :param collection: the collection to work on.
+        :param data: the new data to be writen the collection.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
+        :return: The success of the update command.
+        """
+        return self.update_future(collection, data).result(timeout)
+
+    def update(self, profile: str, collection: str, data: dict) -> bool:
         """
-        Update the collection with the new data.
+        Replace the collection with the new data, in memory, the journal doesn't cover it, so the collection is
+        compacted by the next flush.
         :param profile: The profile of the database.
         :param collection: The collection to work on.
         :param data: The new data to be writen the collection.
         :return: The success of the update command.
         """
+        with self.lock:
+            self.collections[collection] = data
+            self.dirty.add(collection)
+
+        return True
+
+    # -- Records --
+
+    def get(self, collection: str, key: str, timeout: float = TIMEOUT) -> dict or None:
+        """
+        Get one record of a collection, served from memory.
+        :param collection: the collection of the record.
+        :param key: the key of the record (the username of a user).
+        :param timeout: the time in seconds to wait for the first load of the collection.
+        :return: a copy of the record, None if there's no such record.
+        """
+        data = self.submit_read(collection, timeout)
+
+        with self.lock:
+            if data is None or key not in data:
+                return None
+
+            return copy.deepcopy(data[key])
+
+    def insert(self, collection: str, key: str, record: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Add a new record to a collection.
+        :param collection: the collection of the record.
+        :param key: the unique key of the record.
+        :param record: the record.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
+        :return: False if the key is already taken.
+        """
+        return self.submit(self.insert_record, collection, key, record).result(timeout)
+
+    def patch(self, collection: str, key: str, fields: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Set fields of one record, the other fields stay.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param fields: field: its new value.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
+        :return: False if there's no such record.
+        """
+        return self.submit(self.modify, collection, key, set_fields, fields).result(timeout)
+
+    def increment(self, collection: str, key: str, amounts: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Add to number fields of one record, atomically (concurrent increments don't lose each other).
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param amounts: field: the amount to add to it (negative to subtract), a missing field starts from 0.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
+        :return: False if there's no such record.
+        """
+        return self.increment_future(collection, key, amounts).result(timeout)
+
+    def increment_future(self, collection: str, key: str, amounts: dict) -> Future:
+        """
+        Add to number fields of one record without blocking, so several increments share a commit.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param amounts: field: the amount to add to it.
+        :return: the future of the success of the increment, False if there's no such record.
+        """
+        return self.submit(self.modify, collection, key, add_amounts, amounts)
+
+    def append(self, collection: str, key: str, field: str, value, timeout: float = TIMEOUT) -> bool:
+        """
+        Add a value to a list field of one record, unless it's already in the list.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param field: the list field.
+        :param value: the value to add.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
+        :return: False if there's no such record or the value is already in the list.
+        """
+        return self.submit(self.modify, collection, key, append_value, field, value).result(timeout)
+
+    def remove(self, collection: str, key: str, field: str, value, timeout: float = TIMEOUT) -> bool:
+        """
+        Remove a value from a list field of one record.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param field: the list field.
+        :param value: the value to remove.
+        :param timeout: the time in seconds to wait for the worker, raises a TimeoutError after it.
+        :return: False if there's no such record or the value isn't in the list, so of two concurrent removals
+        only one succeeds.
+        """
+        return self.submit(self.modify, collection, key, remove_value, field, value).result(timeout)
+
+    def insert_record(self, collection: str, key: str, record: dict) -> bool:
+        """
+        Add a new record, runs on the worker.
+        """
+        data = self.read(self.profile, collection)
+
+        if data is None:
+            return False
+
+        with self.lock:
+            if key in data:
+                return False
+
+            data[key] = record
+            self.journal(collection, key, record)
+
+        return True
+
+    def modify(self, collection: str, key: str, change, *args) -> bool:
+        """
+        Change one record, runs on the worker so the changes of a record never interleave.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param change: change(record, *args) -> bool, changes the record in place, False if it didn't change it.
+        :param args: the arguments of the change.
+        :return: the result of the change, False if there's no such record.
+        """
+        data = self.read(self.profile, collection)
+
+        if data is None:
+            return False
+
+        # the lock keeps the readers of the record (get) from seeing half of the change.
+        with self.lock:
+            record = data.get(key)
+
+            if record is None or not change(record, *args):
+                return False
+
+            self.journal(collection, key, record)
+
+        return True
+
+    # -- Journal --
+
+    def journal(self, collection: str, key: str, record: dict) -> None:
+        """
+        Add the new record to the pending lines of the journal, called with the lock held so the record is whole,
+        the worker writes the lines with the batch of the change.
+        """
+        line = json.dumps({"Key": key, "Record": record}) + "\n"
+
+        with self.journal_lock:
+            self.pending.setdefault(collection, []).append(line)
+            self.journaled.add(collection)
+
+    def write_journal(self) -> bool:
+        """
+        Write and sync the pending lines of all the journals, one sync per journal for all its lines.
+        :return: False if a journal couldn't be written.
+        """
+        with self.journal_lock:
+            return not self.write_pending()
+
+    def write_pending(self) -> set:
+        """
+        Write and sync the pending lines, called with the journal lock held.
+        A failed write is truncated back to the size of the journal before it, so a partly written line isn't
+        followed by the lines of the next write.
+        :return: the collections whose journal couldn't be written, their lines are kept for the next write.
+        """
+        pending, self.pending = self.pending, {}
+        failed = set()
+
+        for collection, lines in pending.items():
+            text = "".join(lines).encode()
+            path = self.journal_path(self.profile, collection)
+            size = None
+
+            try:
+                f = self.journals.get(collection)
+
+                if f is None:
+                    f = self.journals[collection] = open(path, "ab")
+
+                # the buffer of the journal is empty, every write is flushed or its file is closed.
+                size = os.fstat(f.fileno()).st_size
+
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError as e:
+                utils.server_print("Database", f"Error writing the journal of {collection}: {e}")
+                self.pending[collection] = self.discard_write(collection, path, size) + lines + self.pending.get(collection, [])
+                failed.add(collection)
+                continue
+
+            self.syncs += 1
+            self.journal_sizes[collection] = self.journal_sizes.get(collection, 0) + len(text)
+
+        return failed
+
+    def discard_write(self, collection: str, path: str, size: int or None) -> list:
+        """
+        Close the journal of a failed write, and truncate the journal to its size before the write.
+        :param collection: the collection of the journal.
+        :param path: the journal file.
+        :param size: the size of the journal before the write, None if it wasn't opened.
+        :return: the lines to write before the lines of the failed write, a blank line if the journal may still
+        end with a part of a line.
+        """
+        f = self.journals.pop(collection, None)
+
+        if f is not None:
+            # closing flushes what's left of the buffer, it's truncated with the rest of the write.
+            try:
+                f.close()
+            except OSError:
+                pass
+
+        if size is None:
+            return []
+
         try:
-            with open(os.getcwd() + f"\\Database\\{profile}\\{collection}.json", "w") as f:
-                f.write(json.dumps(data, indent=4))
+            os.truncate(path, size)
+        except OSError as e:
+            utils.server_print("Database", f"Error truncating the journal of {collection}: {e}")
+            return ["\n"]
+
+        return []
+
+    def flusher(self) -> None:
+        """
+        Flush every flush_interval seconds.
+        """
+        while not self.flusher_stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write the pending journal lines, and compact the collections replaced as a whole and the collections
+        whose journal grew over COMPACT_SIZE.
+        :return: the amount of compacted collections.
+        """
+        self.write_journal()
+
+        with self.flush_lock:
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
 
-            return True
+            with self.journal_lock:
+                dirty |= {collection for collection, size in self.journal_sizes.items() if size >= COMPACT_SIZE}
+
+            compacted = 0
+
+            for collection in dirty:
+                if self.compact(collection):
+                    compacted += 1
+                else:
+                    # compacted again by the next flush.
+                    with self.lock:
+                        self.dirty.add(collection)
+
+            return compacted
+
+    def compact(self, collection: str) -> bool:
+        """
+        Write a fresh snapshot of a collection and remove the journal it covers.
+        The journal is moved aside (.1) before the snapshot is serialized, the changes made meanwhile go to a new
+        journal, so a crash at any point leaves a snapshot and journals that replay to the latest state.
+        :param collection: the collection to compact.
+        :return: the success of the compaction, a failed compaction keeps its journal for the next one.
+        """
+        path = self.journal_path(self.profile, collection)
+
+        with self.journal_lock:
+            self.write_pending()
+
+            f = self.journals.pop(collection, None)
+            if f is not None:
+                f.close()
+
+            try:
+                if os.path.exists(path + ".1"):
+                    # the journal of a failed compaction isn't in any snapshot yet, the new lines follow it.
+                    with open(path, "rb") as journal, open(path + ".1", "ab") as moved:
+                        moved.write(journal.read())
+                        moved.flush()
+                        os.fsync(moved.fileno())
+
+                    os.remove(path)
+                else:
+                    os.replace(path, path + ".1")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                utils.server_print("Database", f"Error moving the journal of {collection}: {e}")
+                return False
+
+            self.journal_sizes[collection] = 0
+
+        if not self.write(collection):
+            return False
+
+        try:
+            os.remove(path + ".1")
+        except FileNotFoundError:
+            pass
+
+        return True
+
+    def write(self, collection: str) -> bool:
+        """
+        Write a collection to its file, through a synced temporary file and a rename, so a crash mid-write leaves
+        the old file.
+        :param collection: the collection to write.
+        :return: the success of the write.
+        """
+        start_time = time.monotonic()
+
+        try:
+            text = self.serialize(collection)
+            path = self.path(self.profile, collection)
+
+            with open(path + ".tmp", "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(path + ".tmp", path)
         except Exception as e:
             utils.server_print("Database", f"Error updating db collection: {e}")
             return False
+
+        utils.server_print("Database", f"Collection {collection} written in {(time.monotonic() - start_time) * 1000:.0f} ms.")
+
+        return True
+
+    def serialize(self, collection: str) -> str:
+        """
+        Serialize a collection while the handlers may change it, without holding the lock (it takes seconds for
+        a big collection).
+        The readers change the shared data before they submit it, so a dump may see a dict change size,
+        the dump is tried again, and a record changed during the dump is in the new journal anyway.
+        """
+        while True:
+            with self.lock:
+                data = self.collections[collection]
+
+            try:
+                # compact, the indentation made the dump of a big collection several times slower.
+                return json.dumps(data)
+            except RuntimeError:
+                continue
+
+    def shutdown(self) -> None:
+        """
+        Stop the flusher and the worker and flush, the tasks already submitted still run.
+        """
+        self.flusher_stopped.set()
+
+        if not self.closed:
+            self.closed = True
+            self.tasks.put(None)
+
+        # the updates that were queued before the shutdown are part of the flush.
+        self.thread.join(TIMEOUT)
+        self.flush()
+
+        with self.journal_lock:
+            for f in self.journals.values():
+                f.close()
+
+            self.journals.clear()
+
+        # the exit flush holds the database (and its collections) while it's registered.
+        atexit.unregister(self.flush)
+
+
+# -- Record changes, run by Database.modify on the worker --
+
+def set_fields(record: dict, fields: dict) -> bool:
+    record.update(fields)
+    return True
+
+
+def add_amounts(record: dict, amounts: dict) -> bool:
+    for field, amount in amounts.items():
+        record[field] = record.get(field, 0) + amount
+
+    return True
+
+
+def append_value(record: dict, field: str, value) -> bool:
+    if value in record[field]:
+        return False
+
+    record[field].append(value)
+    return True
+
+
+def remove_value(record: dict, field: str, value) -> bool:
+    if value not in record[field]:
+        return False
+
+    record[field].remove(value)
+    return True
@@ -0,0 +1,71 @@
+"""
+Migrate the json collections (Users.json) to the SQLite database of the same profile.
+A collection is loaded the way the json database loads it, with its journal, so the changes that weren't compacted
+yet are migrated too, and it's written in one transaction, so a failed migration leaves the table as it was.
+Run from the directory the server runs in, with the server stopped: python Database/Migrate.py --database 0
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from Server.Database.Database import Database
+from Server.Database.SqliteDatabase import TABLES, SqliteDatabase
+
+
+def migrate(profile: int, replace: bool = False) -> bool:
+    """
+    Copy every collection of TABLES from the json files to the SQLite tables.
+    :param profile: database profile id, 0 - tests, 1 - official.
+    :param replace: replace the tables that already have records, they're skipped otherwise.
+    :return: True if all the collections were migrated.
+    """
+    source = Database(profile, flush_interval=0)
+    target = SqliteDatabase(profile)
+    success = True
+
+    try:
+        for collection in TABLES:
+            data = source.submit_read(collection)
+
+            if data is None:
+                print(f"{collection}: no json collection to migrate.")
+                success = False
+                continue
+
+            existing = target.count(collection)
+
+            if existing and not replace:
+                print(f"{collection}: the table already has {existing} records, skipped (--replace to replace them).")
+                success = False
+                continue
+
+            start_time = time.monotonic()
+
+            try:
+                target.submit_update(collection, data)
+            except ValueError as e:
+                print(f"{collection}: {e} Nothing was migrated.")
+                success = False
+                continue
+
+            migrated = target.count(collection)
+            print(f"{collection}: migrated {migrated} of {len(data)} records in {time.monotonic() - start_time:.1f} seconds.")
+
+            success = success and migrated == len(data)
+    finally:
+        target.shutdown()
+        source.shutdown()
+
+    return success
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", type=int, default=0, help="The database status.")
+    parser.add_argument("--replace", action="store_true", help="Replace the tables that already have records.")
+    args = parser.parse_args()
+
+    sys.exit(0 if migrate(args.database, args.replace) else 1)
@@ -0,0 +1,407 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import Empty, Queue
+
+import Server.utils as utils
+from Server.Database.Database import FLUSH_INTERVAL, TIMEOUT
+
+# the connections of the pool, in WAL mode the reads of all of them run at once, the writes one at a time.
+POOL_SIZE = 8
+
+# collection: (its key column, column: its type), one table per collection.
+TABLES = {
+    "Users": ("username", {
+        "username": "TEXT NOT NULL PRIMARY KEY",
+        "password": "TEXT NOT NULL",
+        "last_login": "TEXT",
+        "last_login_address": "TEXT",
+        "friends": "TEXT NOT NULL DEFAULT '[]'",
+        "friend_requests": "TEXT NOT NULL DEFAULT '[]'",
+        "lifetime": "REAL NOT NULL DEFAULT 0",
+        "account_level": "INTEGER NOT NULL DEFAULT 1",
+        "account_experience": "REAL NOT NULL DEFAULT 0",
+        "playtime": "REAL NOT NULL DEFAULT 0",
+        "games_played": "INTEGER NOT NULL DEFAULT 0",
+        "games_won": "INTEGER NOT NULL DEFAULT 0",
+    }),
+}
+
+# the columns that hold lists, stored as JSON text.
+JSON_COLUMNS = {"last_login_address", "friends", "friend_requests"}
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        """
+        Connections to one database file shared by the handler threads, a thread takes a connection for one
+        operation and gives it back. The connections are opened on demand, up to size.
+        :param path: the database file.
+        :param size: the most connections open at once.
+        """
+        self.path = path
+        self.size = size
+
+        # the connections that aren't in use.
+        self.idle = Queue()
+
+        # all the open connections, guarded by the lock.
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def open(self) -> sqlite3.Connection:
+        """
+        :return: a new connection in autocommit mode, every statement is its own transaction.
+        """
+        connection = sqlite3.connect(self.path, timeout=TIMEOUT, isolation_level=None, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+
+        # the readers don't wait for the writer, and a commit appends to the WAL instead of rewriting pages.
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        # the checkpoints are run by the flusher, not by the commit that fills the WAL.
+        connection.execute("PRAGMA wal_autocheckpoint=0")
+
+        return connection
+
+    @contextmanager
+    def connection(self, timeout: float = TIMEOUT):
+        """
+        Take a connection for the with block, raises a TimeoutError if none was free for the timeout.
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except Empty:
+            connection = None
+
+            with self.lock:
+                if len(self.connections) < self.size:
+                    connection = self.open()
+                    self.connections.append(connection)
+
+            if connection is None:
+                try:
+                    connection = self.idle.get(timeout=timeout)
+                except Empty:
+                    raise TimeoutError("No database connection was free.") from None
+
+        try:
+            yield connection
+        finally:
+            self.idle.put(connection)
+
+    def close(self) -> None:
+        """
+        Close all the connections.
+        """
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+
+            self.connections.clear()
+
+
+class SqliteDatabase:
+    def __init__(self, profile: int, pool_size: int = POOL_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        """
+        The database on SQLite, with the record operations of Database, so the server and the methods use either.
+        One file per profile with a table per collection (TABLES), the key of a collection is the primary key
+        of its table, the username of a user.
+        Every operation is one statement, so it's atomic without a worker: an increment adds in the statement,
+        an append checks the list in the statement, and of two concurrent removals only one removes.
+        synchronous=NORMAL in WAL mode: a commit survives a crash of the server, a power loss may lose the last
+        commits (not the file), like the batched journal of the json database.
+        The WAL is checkpointed into the database file in the background, every flush_interval seconds.
+        :param profile: database profile id, 0 - tests, 1 - official.
+        :param pool_size: the most connections open at once.
+        :param flush_interval: the time in seconds between the checkpoints, 0 to checkpoint only on flush() and
+        shutdown().
+        """
+        # set the default profile to be 0 in case of unrecognized profile.
+        self.profile = "Tests" if profile not in [0, 1] else "Tests" if profile == 0 else "Official"
+
+        self.pool = ConnectionPool(self.path(self.profile), pool_size)
+        self.closed = False
+
+        # SQLite runs one writer at a time and a writer that finds the file locked sleeps and polls (up to 100ms),
+        # so the writers wait for each other here, and the readers go on.
+        self.write_lock = threading.Lock()
+
+        with self.pool.connection() as connection:
+            for collection, (key, columns) in TABLES.items():
+                definition = ", ".join(f"{column} {kind}" for column, kind in columns.items())
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {collection} ({definition}) WITHOUT ROWID")
+
+        self.flush_interval = flush_interval
+        self.flusher_stopped = threading.Event()
+
+        if self.flush_interval > 0:
+            threading.Thread(target=self.flusher, daemon=True).start()
+
+        utils.server_print("Database", f"SQLite database {self.path(self.profile)} is open")
+
+    @staticmethod
+    def path(profile: str) -> str:
+        """
+        :return: the database file of the profile.
+        """
+        return os.path.join(os.getcwd(), "Database", profile, "Database.sqlite3")
+
+    def execute(self, statement: str, parameters: tuple, timeout: float = TIMEOUT, write: bool = False) -> tuple[list, int]:
+        """
+        Run one statement on a connection of the pool.
+        :param write: the statement changes the database, it waits for the other writes.
+        :return: the rows of the statement, and the amount of rows it changed.
+        """
+        if self.closed:
+            raise RuntimeError("Database is shut down.")
+
+        with self.pool.connection(timeout) as connection:
+            if not write:
+                cursor = connection.execute(statement, parameters)
+                return cursor.fetchall(), cursor.rowcount
+
+            if not self.write_lock.acquire(timeout=timeout):
+                raise TimeoutError("The database was locked by other writes.")
+
+            try:
+                cursor = connection.execute(statement, parameters)
+                return cursor.fetchall(), cursor.rowcount
+            finally:
+                self.write_lock.release()
+
+    # -- Records --
+
+    def get(self, collection: str, key: str, timeout: float = TIMEOUT) -> dict or None:
+        """
+        Get one record of a collection.
+        :param collection: the collection of the record.
+        :param key: the key of the record (the username of a user).
+        :param timeout: the time in seconds to wait for a connection.
+        :return: the record, None if there's no such record.
+        """
+        key_column, columns = TABLES[collection]
+        rows, count = self.execute(f"SELECT * FROM {collection} WHERE {key_column} = ?", (key,), timeout)
+
+        return self.to_record(rows[0]) if rows else None
+
+    def insert(self, collection: str, key: str, record: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Add a new record to a collection.
+        :param collection: the collection of the record.
+        :param key: the unique key of the record.
+        :param record: the record.
+        :param timeout: the time in seconds to wait for a connection.
+        :return: False if the key is already taken.
+        """
+        key_column, columns = TABLES[collection]
+        row = self.to_row(collection, {**record, key_column: key})
+
+        try:
+            self.execute(f"INSERT INTO {collection} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                         tuple(row.values()), timeout, write=True)
+        except sqlite3.IntegrityError:
+            return False
+
+        return True
+
+    def patch(self, collection: str, key: str, fields: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Set fields of one record, the other fields stay.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param fields: field: its new value.
+        :param timeout: the time in seconds to wait for a connection.
+        :return: False if there's no such record.
+        """
+        key_column, columns = TABLES[collection]
+        row = self.to_row(collection, fields)
+        assignments = ", ".join(f"{column} = ?" for column in row)
+
+        return self.execute(f"UPDATE {collection} SET {assignments} WHERE {key_column} = ?",
+                            (*row.values(), key), timeout, write=True)[1] > 0
+
+    def increment(self, collection: str, key: str, amounts: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Add to number fields of one record, atomically (concurrent increments don't lose each other).
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param amounts: field: the amount to add to it (negative to subtract).
+        :param timeout: the time in seconds to wait for a connection.
+        :return: False if there's no such record.
+        """
+        key_column, columns = TABLES[collection]
+        self.check_columns(collection, amounts, numbers=True)
+        assignments = ", ".join(f"{column} = {column} + ?" for column in amounts)
+
+        return self.execute(f"UPDATE {collection} SET {assignments} WHERE {key_column} = ?",
+                            (*amounts.values(), key), timeout, write=True)[1] > 0
+
+    def increment_future(self, collection: str, key: str, amounts: dict) -> Future:
+        """
+        Add to number fields of one record, like Database.increment_future, the statement is its own commit so
+        it runs right away.
+        :return: the completed future of the success of the increment.
+        """
+        future = Future()
+
+        try:
+            future.set_result(self.increment(collection, key, amounts))
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
+
+    def append(self, collection: str, key: str, field: str, value, timeout: float = TIMEOUT) -> bool:
+        """
+        Add a value to a list field of one record, unless it's already in the list.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param field: the list field.
+        :param value: the value to add.
+        :param timeout: the time in seconds to wait for a connection.
+        :return: False if there's no such record or the value is already in the list.
+        """
+        key_column, columns = TABLES[collection]
+        self.check_columns(collection, [field], lists=True)
+
+        return self.execute(f"UPDATE {collection} SET {field} = json_insert({field}, '$[#]', json(?)) "
+                            f"WHERE {key_column} = ? AND NOT EXISTS (SELECT 1 FROM json_each({field}) WHERE value = ?)",
+                            (json.dumps(value), key, value), timeout, write=True)[1] > 0
+
+    def remove(self, collection: str, key: str, field: str, value, timeout: float = TIMEOUT) -> bool:
+        """
+        Remove a value from a list field of one record.
+        :param collection: the collection of the record.
+        :param key: the key of the record.
+        :param field: the list field.
+        :param value: the value to remove.
+        :param timeout: the time in seconds to wait for a connection.
+        :return: False if there's no such record or the value isn't in the list, so of two concurrent removals
+        only one succeeds.
+        """
+        key_column, columns = TABLES[collection]
+        self.check_columns(collection, [field], lists=True)
+
+        return self.execute(f"UPDATE {collection} SET {field} = json_remove({field}, "
+                            f"(SELECT fullkey FROM json_each({field}) WHERE value = ? LIMIT 1)) "
+                            f"WHERE {key_column} = ? AND EXISTS (SELECT 1 FROM json_each({field}) WHERE value = ?)",
+                            (value, key, value), timeout, write=True)[1] > 0
+
+    # -- Collections --
+
+    def submit_read(self, collection: str, timeout: float = TIMEOUT) -> dict:
+        """
+        Read a whole collection, a copy, unlike the json database the changes to it aren't shared.
+        :param collection: the collection to read.
+        :param timeout: the time in seconds to wait for a connection.
+        :return: key: record, of all the records.
+        """
+        key_column, columns = TABLES[collection]
+
+        return {row[key_column]: self.to_record(row) for row in self.execute(f"SELECT * FROM {collection}", (), timeout)[0]}
+
+    def count(self, collection: str, timeout: float = TIMEOUT) -> int:
+        """
+        :return: the amount of records in a collection.
+        """
+        rows, count = self.execute(f"SELECT COUNT(*) FROM {collection}", (), timeout)
+
+        return rows[0][0]
+
+    def submit_update(self, collection: str, data: dict, timeout: float = TIMEOUT) -> bool:
+        """
+        Replace a whole collection, in one transaction.
+        :param collection: the collection to replace.
+        :param data: key: record, the new records.
+        :param timeout: the time in seconds to wait for a connection.
+        :return: The success of the update command.
+        """
+        key_column, columns = TABLES[collection]
+        rows = [self.to_row(collection, {**record, key_column: key}) for key, record in data.items()]
+
+        with self.pool.connection(timeout) as connection, self.write_lock:
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                connection.execute(f"DELETE FROM {collection}")
+
+                for row in rows:
+                    connection.execute(f"INSERT INTO {collection} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                                       tuple(row.values()))
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+
+        return True
+
+    # -- Rows --
+
+    @staticmethod
+    def check_columns(collection: str, fields, numbers: bool = False, lists: bool = False) -> None:
+        """
+        Raise a ValueError for a field that isn't a column of the table, the columns are written into the
+        statements, so only the known ones are.
+        """
+        key_column, columns = TABLES[collection]
+
+        for field in fields:
+            if field not in columns or (numbers and field in JSON_COLUMNS) or (lists and field not in JSON_COLUMNS):
+                raise ValueError(f"Invalid field {field} of {collection}.")
+
+    def to_row(self, collection: str, record: dict) -> dict:
+        """
+        :return: column: its value, the lists as JSON text.
+        """
+        self.check_columns(collection, record)
+
+        return {field: json.dumps(value) if field in JSON_COLUMNS else value for field, value in record.items()}
+
+    @staticmethod
+    def to_record(row: sqlite3.Row) -> dict:
+        """
+        :return: the record of a row, the lists back from JSON text.
+        """
+        return {column: json.loads(row[column]) if column in JSON_COLUMNS and row[column] is not None else row[column]
+                for column in row.keys()}
+
+    def flusher(self) -> None:
+        """
+        Checkpoint every flush_interval seconds.
+        """
+        while not self.flusher_stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                utils.server_print("Database", f"Error checkpointing the database: {e}")
+
+    def flush(self) -> int:
+        """
+        Checkpoint the WAL into the database file, the readers and writers go on meanwhile.
+        :return: the amount of checkpointed pages.
+        """
+        with self.pool.connection() as connection:
+            busy, pages, checkpointed = connection.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+
+        return checkpointed
+
+    def shutdown(self) -> None:
+        """
+        Checkpoint the whole WAL and close the connections.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        self.flusher_stopped.set()
+
+        with self.pool.connection() as connection:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        self.pool.close()
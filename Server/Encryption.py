@@ -0,0 +1,167 @@
+"""
+The encryption of the messages after the key exchange.
+"""
+import struct
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.backends import default_backend
+
+# the cipher of clients that don't negotiate one.
+LEGACY_CIPHER = "aes-256-cfb"
+
+# the cipher of connections on the tls transport, tls already encrypts them.
+TLS_CIPHER = "tls"
+
+# the supported aead ciphers, in order of preference.
+CIPHERS = {
+    "aes-256-gcm": AESGCM,
+    "chacha20-poly1305": ChaCha20Poly1305,
+}
+
+# the counter part of the 12 bytes nonce.
+COUNTER = struct.Struct("!Q")
+
+# the size of the aead tag appended to every message.
+TAG_SIZE = 16
+
+
+class LegacyChannel:
+    def __init__(self, key: bytes, nonce: bytes):
+        """
+        AES-CFB with a new encryptor for every message, all the messages start from the same nonce.
+        Only kept for clients that don't negotiate a cipher.
+        :param key: the aes key from the key exchange.
+        :param nonce: the nonce from the key exchange.
+        """
+        self.name = LEGACY_CIPHER
+
+        # cfb has no tag, the messages carry an md5 checksum instead.
+        self.authenticated = False
+        self.overhead = 0
+
+        self.key = key
+        self.nonce = nonce
+        self.cipher = Cipher(algorithms.AES(key), modes.CFB(nonce), backend=default_backend())
+
+    def encrypt(self, data: bytes, associated_data: bytes = None) -> bytes:
+        """
+        Encrypt the data using the aes encryptor.
+        :param data: the data to encrypt.
+        :param associated_data: ignored, cfb can't authenticate it.
+        :return: the encrypted data.
+        """
+        # create the aes encryptor.
+        aes_encryptor = self.cipher.encryptor()
+
+        # encrypt the data using the aes encryptor.
+        return aes_encryptor.update(data) + aes_encryptor.finalize()
+
+    def decrypt(self, data: bytes, associated_data: bytes = None) -> bytes:
+        """
+        Decrypt the data using the aes decryptor.
+        :param data: the data to decrypt.
+        :param associated_data: ignored, cfb can't authenticate it.
+        :return: the decrypted data.
+        """
+        # create the aes decryptor.
+        aes_decryptor = self.cipher.decryptor()
+
+        # decrypt the data using the aes decryptor.
+        return aes_decryptor.update(data) + aes_decryptor.finalize()
+
+
+class SecureChannel:
+    def __init__(self, name: str, key: bytes, nonce: bytes, is_server: bool):
+        """
+        An aead channel that keeps its key schedule for the whole connection.
+        Every message uses a new nonce, 4 bytes of the exchanged nonce (one half for each direction) and a counter.
+        The receiver expects the next counter, so a replayed, dropped or reordered message fails to decrypt.
+        :param name: the name of the cipher (see CIPHERS).
+        :param key: the 32 bytes key from the key exchange.
+        :param nonce: the nonce from the key exchange.
+        :param is_server: True on the server side, decides which half of the nonce is used for sending.
+        """
+        self.name = name
+        self.aead = CIPHERS[name](key)
+
+        # the tag authenticates the message, no checksum is needed.
+        self.authenticated = True
+        self.overhead = TAG_SIZE
+
+        # the first bit separates the directions even if both halves of the nonce are the same.
+        server_prefix = bytes([nonce[0] & 0x7f]) + nonce[1:4]
+        client_prefix = bytes([nonce[4] | 0x80]) + nonce[5:8]
+
+        self.send_prefix = server_prefix if is_server else client_prefix
+        self.receive_prefix = client_prefix if is_server else server_prefix
+
+        self.send_counter = 0
+        self.receive_counter = 0
+
+    def encrypt(self, data: bytes, associated_data: bytes = None) -> bytes:
+        """
+        Encrypt and authenticate the data with the next sending nonce.
+        The messages must be sent in the same order they were encrypted.
+        :param data: the data to encrypt.
+        :param associated_data: data that is authenticated but not encrypted (the frame header).
+        :return: the encrypted data and the tag.
+        """
+        nonce = self.send_prefix + COUNTER.pack(self.send_counter)
+        self.send_counter += 1
+
+        return self.aead.encrypt(nonce, data, associated_data)
+
+    def decrypt(self, data: bytes, associated_data: bytes = None) -> bytes:
+        """
+        Decrypt and verify the data with the next receiving nonce.
+        :param data: the encrypted data and the tag.
+        :param associated_data: the data that was authenticated with the message (the frame header).
+        :return: the decrypted data, raise InvalidTag if the data or the associated data was changed.
+        """
+        nonce = self.receive_prefix + COUNTER.pack(self.receive_counter)
+        self.receive_counter += 1
+
+        return self.aead.decrypt(nonce, data, associated_data)
+
+
+class PlainChannel:
+    def __init__(self):
+        """
+        The channel of a tls connection, the messages are sent as they are since tls encrypts
+        and authenticates the whole connection.
+        """
+        self.name = TLS_CIPHER
+
+        # tls authenticates the records, no checksum is needed.
+        self.authenticated = True
+        self.overhead = 0
+
+        self.key = None
+        self.nonce = None
+
+    def encrypt(self, data: bytes, associated_data: bytes = None) -> bytes:
+        return data
+
+    def decrypt(self, data: bytes, associated_data: bytes = None) -> bytes:
+        """
+        :param data: the message, may be a view of the receive buffer.
+        :return: a copy of the message.
+        """
+        return bytes(data)
+
+
+def choose_cipher(offered: list) -> str:
+    """
+    Choose the cipher for the connection from the ciphers the client offered.
+    :param offered: the cipher names from the client hello.
+    :return: the first supported cipher the client offered, otherwise the legacy cipher.
+    """
+    if type(offered) is not list:
+        return LEGACY_CIPHER
+
+    for name in offered:
+        if name in CIPHERS:
+            return name
+
+    return LEGACY_CIPHER
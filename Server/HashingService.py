@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import Hashing
+from Metrics import Metrics
+
+# the niceness the hashing processes add, the game traffic goes first when the cores are busy.
+NICENESS = 5
+
+
+def lower_priority() -> None:
+    """
+    Lower the scheduling priority of a hashing process, runs in the process when it starts.
+    """
+    # windows has no nice.
+    if hasattr(os, "nice"):
+        os.nice(NICENESS)
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing service has no free slot, the request should be rejected right away (503).
+    """
+    pass
+
+
+class HashingService:
+    def __init__(self, metrics: Metrics, workers: int = None, max_pending: int = None):
+        """
+        Run the bcrypt hashing on a pool of processes, so a burst of logins uses the cores instead of the handler
+        threads (bcrypt is cpu bound, on threads it would also compete with the game for the gil).
+        The hashes waiting or running are bounded, a hash over the bound is rejected instead of queued,
+        so a flood of logins can't build a queue that every other login waits behind.
+        :param metrics: the server metrics, the service adds the hashing_pending gauge and the hashing timings.
+        :param workers: the amount of hashing processes, the amount of cores by default.
+        :param max_pending: the amount of hashes that may wait or run at the same time, 4 per worker by default.
+        """
+        self.metrics = metrics
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+
+        # spawn the processes instead of forking the threads of the server.
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=lower_priority)
+
+    def submit(self, function, *args) -> Future:
+        """
+        Run a hashing function on the pool without waiting for it.
+        :param function: a function of the Hashing module.
+        :return: the future of the result.
+        """
+        if not self.slots.acquire(blocking=False):
+            self.metrics.increment("hashing_rejected")
+            raise HashingBusy(f"All the {self.max_pending} hashing slots are taken.")
+
+        self.metrics.add("hashing_pending", 1)
+        submitted_time = time.monotonic()
+
+        try:
+            future = self.executor.submit(function, *args)
+        except Exception:
+            self.metrics.add("hashing_pending", -1)
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self.done(submitted_time))
+
+        return future
+
+    def done(self, submitted_time: float) -> None:
+        """
+        Free the slot of a finished hash.
+        :param submitted_time: the time (time.monotonic) the hash was submitted.
+        """
+        self.metrics.add("hashing_pending", -1)
+        self.metrics.observe("hashing_latency", time.monotonic() - submitted_time)
+        self.slots.release()
+
+    def hash_password(self, password: str) -> bytes:
+        """
+        Hash the password on the pool, blocks the calling thread (not the gil) until it's hashed.
+        :param password: the password to hash.
+        :return: the hashed password, raise HashingBusy if the service is saturated.
+        """
+        return self.submit(Hashing.hash_password, password).result()
+
+    def check_password(self, hashed_password: bytes, password: str) -> bool:
+        """
+        Check the password on the pool, blocks the calling thread (not the gil) until it's checked.
+        :param hashed_password: the actual password.
+        :param password: the password to check.
+        :return: true if the real password match the password, raise HashingBusy if the service is saturated.
+        """
+        return self.submit(Hashing.check_password, hashed_password, password).result()
+
+    def shutdown(self) -> None:
+        """
+        Stop the hashing processes, the waiting hashes are cancelled.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import utils
+from Metrics import Metrics
+from Sessions import SessionRegistry
+
+# the time in seconds a connection may be silent before it's pinged, also the time between the sweeps.
+HEARTBEAT_INTERVAL = 15
+
+# the time in seconds a connection that answers pings may be silent before it's reaped.
+HEARTBEAT_TIMEOUT = 45
+
+
+class Reaper:
+    def __init__(self, sessions: SessionRegistry, metrics: Metrics, interval: float = HEARTBEAT_INTERVAL,
+                 timeout: float = HEARTBEAT_TIMEOUT):
+        """
+        Ping the silent connections and close the dead ones, one thread for all the connections.
+        Only the clients that negotiated the heartbeat are pinged and reaped, a legacy client can't answer a ping,
+        so it's left to the tcp keepalive (see Transport.set_keepalive).
+        A reaped connection is aborted, so its handler sees the connection closed and disconnects the client
+        (the session, the lobby and the logout) like any other disconnect.
+        :param sessions: the connected clients.
+        :param metrics: the server metrics.
+        :param interval: the time in seconds a connection may be silent before it's pinged, 0 to disable the heartbeat.
+        :param timeout: the time in seconds a connection may be silent before it's reaped, more than the interval.
+        """
+        self.sessions = sessions
+        self.metrics = metrics
+        self.interval = interval
+        self.timeout = timeout
+
+    def start(self) -> None:
+        """
+        Start the sweeps, nothing to do if the heartbeat is disabled.
+        """
+        if self.interval > 0:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self) -> None:
+        """
+        Sweep the connections every interval seconds.
+        """
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                self.sweep()
+            except Exception as e:
+                utils.server_print("Error", f"Heartbeat sweep failed: {e}")
+
+    def sweep(self) -> int:
+        """
+        Ping the connections that were silent for the interval, and abort the ones silent for the timeout.
+        :return: the amount of reaped connections.
+        """
+        now = time.monotonic()
+        reaped = 0
+
+        for client in self.sessions.clients():
+            if not client.heartbeat or not client.running:
+                continue
+
+            silent = now - client.last_seen
+
+            if silent > self.timeout:
+                reaped += 1
+                self.metrics.increment("connections_reaped")
+                utils.server_print("Heartbeat", f"Client {client.address} was silent for {silent:.0f} seconds, disconnecting.")
+                client.abort()
+
+            elif silent >= self.interval and client.ping_sent is None:
+                # one ping at a time, a lost pong doesn't pile up more pings.
+                self.metrics.increment("heartbeat_pings")
+                client.ping()
+
+        return reaped
@@ -2,23 +2,35 @@ import random
 import datetime
 import string
 import threading
+from concurrent.futures import Future
 
 import utils
 from ClientInterface import Client
+from Pipeline import SerialExecutor, run_future
+from ThreadPool import ThreadPool
 from Server.SudokuBoard import SudokuGenerator
 from Methods.LatestVersion import *
 from Database.Database import Database
 
+# the threads that run the mailboxes of all the lobbies, a lobby runs on one of them at a time.
+LOBBY_WORKERS = 8
+
+# the one lane of the serial executor of a lobby.
+MAILBOX = "mailbox"
+
 
 class Lobby:
-    def __init__(self, owner: Client, code: str, database: Database, max_time=60 * 15):
+    def __init__(self, owner: Client, code: str, database: Database, executor: ThreadPool, max_time=60 * 15):
         """
         The lobby data structure to store all the data and do some actions on it.
+        The lobby state is changed only on the mailbox of the lobby (see submit).
         :param owner: The owner of the lobby.
         :param code: The code of the lobby.
+        :param executor: the threads that run the mailboxes of the lobbies.
         :param max_time: The maximum time for the game in seconds.
         """
         self.database = database
+        self.mailbox = SerialExecutor(executor)
         self.board = SudokuGenerator()
         self.solution, self.puzzle = self.board.generate_puzzle("medium")
         self.puzzle_size = len(SudokuGenerator.get_empty_cells(self.puzzle))
@@ -61,6 +73,33 @@ class Lobby:
         self.leaderboard = []   # (username, score)
         self.winner = None
 
+        # ends the game when the time is up.
+        self.timer = None
+
+    # --- Mailbox ---
+
+    def submit(self, function, *args) -> Future:
+        """
+        Run a function on the mailbox of the lobby, after the functions submitted before it.
+        Everything that changes the lobby runs on the mailbox, one function at a time, so the lobby needs no lock,
+        and the mailboxes of different lobbies run at the same time.
+        :param function: the function to run, it shouldn't block (or wait for the mailbox).
+        :param args: the arguments of the function.
+        :return: the future of the result of the function.
+        """
+        future = Future()
+        self.mailbox.submit(MAILBOX, run_future, future, function, args)
+
+        return future
+
+    def call(self, function, *args):
+        """
+        Run a function on the mailbox of the lobby and wait for it, not from the mailbox itself.
+        An idle mailbox runs the function on the calling thread.
+        :return: the result of the function, raise the exception of the function.
+        """
+        return self.mailbox.call(MAILBOX, function, *args)
+
     def register_client(self, client: Client) -> (str, bool):
         """
         Add a client to the lobby. (Implementation of join lobby or create lobby)
@@ -86,6 +125,7 @@ class Lobby:
         if client in self.players:
             self.players.remove(client)
             client.set_data("lobby_info", None)
+            self.check_game_over()
             return "players", True
 
         if client in self.spectators:
@@ -93,13 +133,15 @@ class Lobby:
             client.set_data("lobby_info", None)
             return "spectators", True
 
+        return "", False
+
     def ban_client(self, client: Client) -> bool:
         """
         Ban a client from the lobby. (Implementation of ban user)
         :param client: Client to ban.
         :return: True if the client was banned, False otherwise.
         """
-        if self.remove_client(client):
+        if self.remove_client(client)[1]:
             self.bans.append(client)
             return True
 
@@ -129,22 +171,16 @@ class Lobby:
 
     # --- Game ---
 
-    def run_game(self):
+    def check_game_over(self) -> None:
         """
-        Run the game as long as the timelimit hasn't been reached, the players haven't finished the game and the players are still in the lobby / game (lobby exists).
+        End the game if a player finished the puzzle or no player is left, after every move and removal.
         """
-        while self.check_timer() > 0 and len(self.players) > 0 and self.winner is None:
-            # check if one player finished the puzzle
-            for player in self.players:
-                if len(self.players_data[player.get_data("username")]["moves"]) == self.puzzle_size:
-                    self.winner = player.get_data("username")
-                    break
-
-        self.end_game()
+        if self.game_started and (self.winner is not None or len(self.players) == 0):
+            self.end_game()
 
     def start_game(self) -> None:
         """
-        Start the game by init the game vars and run the game in a separate thread.
+        Start the game by init the game vars and start the timer of the game.
         """
         self.game_started = True
 
@@ -163,32 +199,53 @@ class Lobby:
 
         self.leaderboard = [(username, 0) for username in self.players_data.keys()]
 
-        # Run the game in a separate thread.
-        threading.Thread(target=self.run_game).start()
+        # the time limit ends the game on the mailbox, the game may end before (see check_game_over).
+        self.timer = threading.Timer(self.MAX_TIME, self.time_up)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def time_up(self) -> None:
+        """
+        End the game on the mailbox when its time is up, called by the timer, nobody waits for it so a failure is
+        logged.
+        """
+        def done(future):
+            if future.exception() is not None:
+                utils.server_print("Error", f"Game of lobby ({self.code}) didn't end: {future.exception()}")
+
+        self.submit(self.end_game).add_done_callback(done)
 
     def end_game(self):
         """
         End the game by sending all the clients that the game is over add update the new players exp to their profile in the db
         """
+        # the timer may fire after the game already ended.
+        if not self.game_started:
+            return
+
         utils.server_print("Lobby", f"Game ended in lobby ({self.code})")
         self.game_started = False
+        self.timer.cancel()
 
-        if self.winner is None:
+        # a game without players (they all became spectators) ends without a winner.
+        if self.winner is None and self.players_data:
             self.winner = max(self.players_data, key=lambda x: self.players_data[x]["score"])
 
         # winning reward
-        self.players_data[self.winner]["game_exp"] = self.players_data[self.winner]["game_exp"] + self.BASE_EXP
+        if self.winner is not None:
+            self.players_data[self.winner]["game_exp"] = self.players_data[self.winner]["game_exp"] + self.BASE_EXP
 
         for player in self.players:
             # update the player playtime
             self.players_data[player.get_data("username")]["playtime"] = self.MAX_TIME - ((self.ending_time - datetime.datetime.now()).seconds / 60)
 
-        for player in self.players + self.spectators:
-            player.push_notification("Game_Over", {"Winner": self.winner, "Leaderboard": self.leaderboard})
+        self.broadcast("Game_Over", {"Winner": self.winner, "Leaderboard": self.leaderboard})
 
-        # update the players exp in the db
-        for player in self.players:
-            account.update_playtime(player.get_data("username"), self.winner == player, self.players_data[player.get_data("username")]["playtime"], self.players_data[player.get_data("username")]["game_exp"], self.database)
+        # update the players exp in the db, all the players in one commit, the mailbox doesn't wait for the commit.
+        players = [(player.get_data("username"), self.winner == player.get_data("username"), self.players_data[player.get_data("username")]["playtime"], self.players_data[player.get_data("username")]["game_exp"]) for player in self.players]
+
+        for (username, *_), future in zip(players, account.update_playtimes(players, self.database)):
+            self.log_stats_failure(username, future)
 
     def player_move(self, client: Client, x: int, y: int, value: int) -> bool:
         """
@@ -212,12 +269,17 @@ class Lobby:
             self.players_data[username]["score"] = len(self.players_data[username]["moves"]) / self.puzzle_size * 100 - self.players_data[username]["mistakes"] / self.puzzle_size * 50
             return False
 
-        # get the delta time between the starting time and the move in seconds
-        move_time = (datetime.timedelta(seconds=self.MAX_TIME) - (self.ending_time - datetime.datetime.now())).seconds
+        # get the delta time between the starting time and the move in seconds, at least a second.
+        move_time = max((datetime.timedelta(seconds=self.MAX_TIME) - (self.ending_time - datetime.datetime.now())).seconds, 1)
 
-        self.players_data[username]["moves"] += (x, y)
+        self.players_data[username]["moves"].append((x, y))
         self.players_data[username]["game_exp"] += round(self.BASE_EXP / move_time)
         self.players_data[username]["score"] = len(self.players_data[username]["moves"]) / self.puzzle_size * 100 - (self.players_data[username]["mistakes"] / self.puzzle_size * 50)
+
+        # the player finished the puzzle, the game ends after the move is answered (see check_game_over).
+        if len(self.players_data[username]["moves"]) == self.puzzle_size:
+            self.winner = username
+
         return True
 
     def player_max_mistakes_reached(self, client: Client) -> None:
@@ -242,8 +304,24 @@ class Lobby:
 
         username = client.get_data("username")
         if username in self.players_data:
-            # update the player stats in the database
-            account.update_playtime(username, self.winner == client.get_data("username"), self.players_data[username]["playtime"], self.players_data[username]["game_exp"], self.database)
+            # update the player stats in the database, the mailbox doesn't wait for the commit.
+            future, = account.update_playtimes([(username, self.winner == username, self.players_data[username]["playtime"], self.players_data[username]["game_exp"])], self.database)
+            self.log_stats_failure(username, future)
+
+    @staticmethod
+    def log_stats_failure(username: str, future: Future) -> None:
+        """
+        Log the update of the stats of a player if it fails, once it's committed.
+        :param username: the username of the player.
+        :param future: the future of the update.
+        """
+        def done(future):
+            if future.exception() is not None:
+                utils.server_print("Error", f"Stats of {username} weren't saved: {future.exception()}")
+            elif not future.result():
+                utils.server_print("Error", f"Stats of {username} weren't saved, no such user.")
+
+        future.add_done_callback(done)
 
     def check_timer(self) -> int:
         """
@@ -257,8 +335,7 @@ class Lobby:
         get the updated leaderboard and send it to everyone on the lobby.
         """
         self.get_leaderboard()
-        for player in self.players + self.spectators:
-            player.push_notification("Leaderboard", {"Leaderboard": self.leaderboard})
+        self.broadcast("Leaderboard", {"Leaderboard": self.leaderboard})
 
     def get_leaderboard(self):
         """
@@ -276,9 +353,16 @@ class Lobby:
         :param client: The client that sent the message.
         :param message: The message to send.
         """
-        for player in self.players + self.spectators:
-            if player != client:
-                player.push_notification("Chat_Message", {"Username": client.get_data("username"), "Message": message, "Time": time})
+        self.broadcast("Chat_Message", {"Username": client.get_data("username"), "Message": message, "Time": time}, client)
+
+    def broadcast(self, update: str, data: dict = None, exclude: Client = None) -> None:
+        """
+        Send a push notification to everyone on the lobby, the message is serialized once.
+        :param update: the update type of the push notification.
+        :param data: the data of the push notification.
+        :param exclude: a client that shouldn't be notified.
+        """
+        Client.broadcast(self.players + self.spectators, update, data, exclude)
 
     def __repr__(self):
         return {
@@ -300,6 +384,9 @@ class LobbyManager:
         self.all_lobbies = {}
         self.database = database
 
+        # the mailboxes of all the lobbies run on these threads.
+        self.executor = ThreadPool(LOBBY_WORKERS)
+
     def create_lobby(self, owner: Client) -> Lobby:
         """
         Create a new lobby.
@@ -307,7 +394,7 @@ class LobbyManager:
         :return: The created lobby object.
         """
         utils.server_print("Lobby Manager", "Creating new lobby")
-        new_lobby = Lobby(owner, self.generate_code(), self.database)
+        new_lobby = Lobby(owner, self.generate_code(), self.database, self.executor)
 
         # add the new lobby to all the lobbies for auths.
         self.all_lobbies[new_lobby.code] = new_lobby
@@ -8,42 +8,38 @@ def get_friend_list(username: str, logged_users: dict, db_interface: Database) -
     """
     get a list of the unique key (usernames) of the friends.
     :param username: the user username.
-    :param logged_users: the dictionary of the logged users.
+    :param logged_users: the logged users, any container of usernames (the session registry of the server).
     :param db_interface: the database interface of the server.
     :return: a list of the unique key (usernames) of the friends.
     """
-    # read the database table.
-    users = db_interface.submit_read("Users")
+    # read the user record.
+    user = db_interface.get("Users", username)
 
     # check if the user exists
-    if username in users:
+    if user is not None:
         # [[friend with status], [friend requests]]
         return [
-            [get_friend_information(friend_name, db_interface, is_logged=(friend_name in logged_users), users=users) for friend_name in users[username]["friends"]],
-            [friend_name for friend_name in users[username]["friend_requests"]]
+            [get_friend_information(friend_name, db_interface, is_logged=(friend_name in logged_users)) for friend_name in user["friends"]],
+            [friend_name for friend_name in user["friend_requests"]]
         ]
 
     return None
 
 
-def get_friend_information(username: str, db_interface: Database, is_logged=None, users=None) -> None or dict:
+def get_friend_information(username: str, db_interface: Database, is_logged=None) -> None or dict:
     """
     get the public information of the friend of a user.
     :param username: the user username.
     :param db_interface: the database interface of the server.
     :param is_logged: the status of the friend.
-    :param users: the users database dictionary.
     :return: a dictionary of the friend information.
     """
 
-    # read the database table.
-    if users is None:
-        users = db_interface.submit_read("Users")
+    # read the friend record.
+    data = db_interface.get("Users", username)
 
     # check if the user exists
-    if username in users:
-        data = users[username]
-
+    if data is not None:
         send_data = {
             "username": username,
             "last_login": data["last_login"],
@@ -70,17 +66,16 @@ def add_friend(username: str, requested_username, db_interface: Database) -> boo
     :return: The success of sending the request.
     """
 
-    users = db_interface.submit_read("Users")
+    requested = db_interface.get("Users", requested_username)
 
-    if username not in users or requested_username not in users:
+    if requested is None or db_interface.get("Users", username) is None:
         return False
 
-    if username in users[requested_username]["friend_requests"] + users[requested_username]["friends"]:
+    if username in requested["friends"]:
         return False
 
-    users[requested_username]["friend_requests"].append(username)
-
-    return db_interface.submit_update("Users", users)
+    # fails if the request was already sent.
+    return db_interface.append("Users", requested_username, "friend_requests", username)
 
 
 def accept_friend(username: str, requested_username, db_interface: Database) -> bool:
@@ -92,19 +87,17 @@ def accept_friend(username: str, requested_username, db_interface: Database) ->
     :return: The success of the acceptance.
     """
 
-    users = db_interface.submit_read("Users")
-
-    if username not in users or requested_username not in users:
+    if db_interface.get("Users", username) is None:
         return False
 
-    if username not in users[requested_username]["friend_requests"]:
+    # the removal of the request is the check, a request is only accepted once.
+    if not db_interface.remove("Users", requested_username, "friend_requests", username):
         return False
 
-    users[requested_username]["friend_requests"].remove(username)
-    users[requested_username]["friends"].append(username)
-    users[username]["friends"].append(requested_username)
+    db_interface.append("Users", requested_username, "friends", username)
+    db_interface.append("Users", username, "friends", requested_username)
 
-    return db_interface.submit_update("Users", users)
+    return True
 
 
 def reject_friend(username: str, requested_username: str, db_interface: Database) -> bool:
@@ -116,14 +109,7 @@ def reject_friend(username: str, requested_username: str, db_interface: Database
     :return: The success of the rejection.
     """
 
-    users = db_interface.submit_read("Users")
-
-    if username not in users[requested_username]["friend_requests"]:
-        return False
-
-    users[requested_username]["friend_requests"].remove(username)
-
-    return db_interface.submit_update("Users", users)
+    return db_interface.remove("Users", requested_username, "friend_requests", username)
 
 
 def invite_friend(username: str, friend_username: str, lobby_code: str, db_interface: Database) -> bool:
@@ -3,26 +3,30 @@ All the user action system
 register, login, delete account, get information...
 """
 import datetime
+from concurrent.futures import Future
 
 import Server.Hashing as Hashing
 from Server.Database.Database import Database
 
 
-def register(address: tuple, username: str, password: str, db_interface: Database) -> bool:
+def register(address: tuple, username: str, password: str, db_interface: Database, password_hash: bytes = None) -> bool:
     """
     Register a new user to the database.
     :param address: The address of the user.
     :param username: The user username.
     :param password: The password of the user.
     :param db_interface: The database interface of the server.
+    :param password_hash: The bcrypt hash of the password if it was already hashed (by the hashing service).
     :return: The success of the registration.
     """
 
-    users = db_interface.submit_read("Users")
+    if password_hash is None:
+        password_hash = Hashing.hash_password(password)
 
-    hashed_password = Hashing.hash_password(password).hex()
+    hashed_password = password_hash.hex()
 
-    users[username] = {
+    # only the new record is added, the insert fails if the username was taken meanwhile.
+    return db_interface.insert("Users", username, {
         "username": username,
         "password": hashed_password,
         "last_login": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -35,9 +39,7 @@ def register(address: tuple, username: str, password: str, db_interface: Databas
         "playtime": 0,
         "games_played": 0,
         "games_won": 0,
-    }
-
-    return db_interface.submit_update("Users", users)
+    })
 
 
 def delete(username: str, password: str):
@@ -51,15 +53,10 @@ def update_login_data(address: tuple, username: str, db_interface: Database) ->
     :param db_interface: The database interface of the server.
     :return: The success of the update.
     """
-    users = db_interface.submit_read("Users")
-
-    if username not in users:
-        return False
-
-    users[username]["last_login"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    users[username]["last_login_address"] = address
-
-    return db_interface.submit_update("Users", users)
+    return db_interface.patch("Users", username, {
+        "last_login": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "last_login_address": address,
+    })
 
 def update_playtime(username: str, have_won: bool, playtime: str, account_exp: float, db_interface: Database):
     """
@@ -68,18 +65,30 @@ def update_playtime(username: str, have_won: bool, playtime: str, account_exp: f
     :param db_interface: The database interface of the server.
     :return: The success of the update.
     """
-    users = db_interface.submit_read("Users")
-
-    if username not in users:
-        return False
-
     # update the playtime of the user, playtime is presented in minutes.
-    users[username]["playtime"] += playtime
-    users[username]["account_experience"] += account_exp
-    users[username]["games_played"] += 1
-    users[username]["games_won"] += 1 if have_won else 0
+    return db_interface.increment("Users", username, game_amounts(have_won, playtime, account_exp))
 
-    return db_interface.submit_update("Users", users)
+def update_playtimes(players: list, db_interface: Database) -> list[Future]:
+    """
+    Update the playtime of all the players of a game without waiting, the updates are submitted together so they
+    share a commit.
+    :param players: (username, have_won, playtime, account_exp) of every player.
+    :param db_interface: The database interface of the server.
+    :return: the futures of the success of the update of every player, done once the update is committed.
+    """
+    return [db_interface.increment_future("Users", username, game_amounts(have_won, playtime, account_exp))
+            for username, have_won, playtime, account_exp in players]
+
+def game_amounts(have_won: bool, playtime: str, account_exp: float) -> dict:
+    """
+    :return: the amounts a game adds to the stats of a player.
+    """
+    return {
+        "playtime": playtime,
+        "account_experience": account_exp,
+        "games_played": 1,
+        "games_won": 1 if have_won else 0,
+    }
 
 def update_logout(username: str, db_interface: Database):
     """
@@ -87,15 +96,13 @@ def update_logout(username: str, db_interface: Database):
     :param username: The user username.
     :param db_interface: The database interface of the server.
     """
-    users = db_interface.submit_read("Users")
+    user = db_interface.get("Users", username)
 
-    if username not in users:
+    if user is None:
         return False
 
     # update the lifetime of the user, lifetime is presented in minutes.
-    users[username]["lifetime"] += round((datetime.datetime.now() - datetime.datetime.strptime(users[username]["last_login"], "%Y-%m-%d %H:%M:%S")).seconds / 60, 2)
-
-    return db_interface.submit_update("Users", users)
+    return db_interface.increment("Users", username, {"lifetime": round((datetime.datetime.now() - datetime.datetime.strptime(user["last_login"], "%Y-%m-%d %H:%M:%S")).seconds / 60, 2)})
 
 def get(username: str, db_interface: Database) -> dict or None:
     """
@@ -104,11 +111,4 @@ def get(username: str, db_interface: Database) -> dict or None:
     :param db_interface: the database interface of the server
     :return: the information of the user if exists, otherwise None.
     """
-    # read the database table.
-    users = db_interface.submit_read("Users")
-
-    # check if the user exists
-    if username in users:
-        return users[username]
-
-    return None
+    return db_interface.get("Users", username)
@@ -0,0 +1,76 @@
+import collections
+import threading
+
+
+class Metrics:
+    def __init__(self, samples: int = 1024):
+        """
+        Thread safe counters, gauges and timings of the server.
+        :param samples: the amount of recent observations each timing keeps for the percentiles.
+        """
+        self.lock = threading.Lock()
+        self.samples = samples
+
+        self.counters = {}
+        self.gauges = {}
+
+        # name -> (total count, recent observations)
+        self.timings = {}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """
+        Increment a counter, counters only grow.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add(self, name: str, amount: int) -> None:
+        """
+        Add to a gauge, a value that goes up and down (like the pending handshakes).
+        """
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Record the duration of one operation.
+        """
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = [0, collections.deque(maxlen=self.samples)]
+
+            timing = self.timings[name]
+            timing[0] += 1
+            timing[1].append(seconds)
+
+    def snapshot(self) -> dict:
+        """
+        :return: the current counters, gauges and the count, p50, p99 and max (in ms) of every timing.
+        """
+        with self.lock:
+            timings = {name: (count, sorted(recent)) for name, (count, recent) in self.timings.items()}
+
+            snapshot = {"Counters": dict(self.counters), "Gauges": dict(self.gauges), "Timings": {}}
+
+        for name, (count, recent) in timings.items():
+            snapshot["Timings"][name] = {
+                "Count": count,
+                "P50": recent[len(recent) // 2] * 1000,
+                "P99": recent[int(len(recent) * 0.99)] * 1000,
+                "Max": recent[-1] * 1000,
+            }
+
+        return snapshot
+
+    def report(self) -> str:
+        """
+        :return: the snapshot as one line for the server log.
+        """
+        snapshot = self.snapshot()
+
+        parts = [f"{name}={value}" for name, value in sorted(snapshot["Counters"].items())]
+        parts += [f"{name}={value}" for name, value in sorted(snapshot["Gauges"].items())]
+        parts += [f"{name}(n={timing['Count']} p50={timing['P50']:.1f}ms p99={timing['P99']:.1f}ms max={timing['Max']:.1f}ms)"
+                  for name, timing in sorted(snapshot["Timings"].items())]
+
+        return " ".join(parts)
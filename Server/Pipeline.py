@@ -0,0 +1,140 @@
+import collections
+import threading
+from concurrent.futures import Future
+
+import utils
+
+# the requests of one connection that may be read before the earlier ones were handled.
+MAX_IN_FLIGHT = 16
+
+
+class SerialExecutor:
+    def __init__(self, executor, on_done=None):
+        """
+        Run the requests of one connection on a shared executor, in lanes.
+        The tasks of a lane run one after another in the order they were submitted, so the moves of a player
+        keep their order, the tasks of different lanes run at the same time, so a slow friend list doesn't delay
+        the next move. Lanes belong to one connection, nothing is ordered across connections.
+        :param executor: the executor of the tasks, anything with submit(task, *args) (the ThreadPool or a
+        concurrent.futures executor).
+        :param on_done: called (on the executor thread) after every task, for the asyncio engine.
+        """
+        self.executor = executor
+        self.on_done = on_done
+
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+
+        # lane: the tasks waiting for the running task of the lane, a lane is in the dict while it runs.
+        self.lanes = {}
+
+        # the tasks submitted and not finished yet.
+        self.in_flight = 0
+
+    def submit(self, lane: str, task, *args) -> None:
+        """
+        Run the task after the earlier tasks of its lane, doesn't wait for it.
+        :param lane: the lane of the task.
+        :param task: the function to run.
+        :param args: the arguments of the function.
+        """
+        with self.lock:
+            self.in_flight += 1
+
+            # the lane is running, its runner will get to the task.
+            if lane in self.lanes:
+                self.lanes[lane].append((task, args))
+                return
+
+            self.lanes[lane] = collections.deque()
+
+        self.executor.submit(self.run, lane, task, args)
+
+    def call(self, lane: str, task, *args):
+        """
+        Run the task after the earlier tasks of its lane and wait for it.
+        An idle lane runs the task on the calling thread (no thread switch), a busy lane queues it for its runner.
+        :param lane: the lane of the task.
+        :param task: the function to run, it shouldn't call the executor itself.
+        :param args: the arguments of the function.
+        :return: the result of the task, raise the exception of the task.
+        """
+        future = None
+
+        with self.lock:
+            self.in_flight += 1
+
+            if lane in self.lanes:
+                future = Future()
+                self.lanes[lane].append((run_future, (future, task, args)))
+            else:
+                self.lanes[lane] = collections.deque()
+
+        if future is not None:
+            return future.result()
+
+        try:
+            return task(*args)
+        finally:
+            # the tasks queued meanwhile go on on the executor.
+            following = self.finish(lane)
+
+            if following is not None:
+                self.executor.submit(self.run, lane, *following)
+
+    def run(self, lane: str, task, args: tuple) -> None:
+        """
+        Run the task and then the tasks queued on the lane meanwhile, runs on the executor.
+        """
+        while task is not None:
+            try:
+                task(*args)
+            except Exception as e:
+                utils.server_print("Error", f"Pipelined task failed: {e}")
+
+            task, args = self.finish(lane) or (None, None)
+
+    def finish(self, lane: str) -> tuple or None:
+        """
+        Count a finished task of the lane.
+        :return: the next (task, args) of the lane, None if the lane stopped.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            self.finished.notify_all()
+
+            waiting = self.lanes[lane]
+
+            # a lane without waiting tasks stops, the next task of the lane gets a new runner.
+            if waiting:
+                following = waiting.popleft()
+            else:
+                following = None
+                del self.lanes[lane]
+
+        if self.on_done is not None:
+            self.on_done()
+
+        return following
+
+    def wait(self, max_in_flight: int = 1) -> None:
+        """
+        Block until less than max_in_flight tasks are in flight, by default until all of them finished.
+        :param max_in_flight: the amount of tasks in flight to wait for.
+        """
+        with self.lock:
+            while self.in_flight >= max_in_flight:
+                self.finished.wait()
+
+
+def run_future(future: Future, task, args: tuple) -> None:
+    """
+    Run a task and set its result (or exception) on its future.
+    """
+    if not future.set_running_or_notify_cancel():
+        return
+
+    try:
+        future.set_result(task(*args))
+    except Exception as e:
+        future.set_exception(e)
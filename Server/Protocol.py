@@ -0,0 +1,348 @@
+"""
+The wire protocol of the client-server communication (see CommsProtocol.md).
+"""
+import json
+import socket
+import ssl
+import struct
+import time
+
+# -- Negotiation --
+
+# the first bytes a framing aware client sends right after the key exchange.
+HELLO_MAGIC = b"\x00CSPROTO"
+
+# the length prefix of the hello body.
+HELLO_LENGTH = struct.Struct("!H")
+
+# version 0 is the legacy "-- End Request --" delimiter, used by clients that don't send a hello.
+LEGACY_VERSION = 0
+FRAMING_VERSION = 1
+
+# -- Framing --
+
+# payload length, message type, flags.
+HEADER = struct.Struct("!IBB")
+
+# message types.
+REQUEST = 1
+RESPONSE = 2
+PUSH_NOTIFICATION = 3
+
+# the heartbeat of connections that negotiated it, a ping is answered with a pong that carries the same payload.
+PING = 4
+PONG = 5
+
+# the payload of a ping and of its pong, the sequence number of the ping.
+PING_PAYLOAD = struct.Struct("!Q")
+
+# flags.
+FLAG_BINARY = 0x01
+FLAG_COMPRESSED = 0x02
+
+# the most buffers one scatter-gather write takes (IOV_MAX is 1024 on linux).
+MAX_WRITE_PARTS = 512
+
+# the legacy end of message delimiter.
+LEGACY_DELIMITER = b"-- End Request --"
+
+# -- Receiving --
+
+# the largest message a connection may send, so a client can't grow the server memory without a bound.
+MAX_MESSAGE_SIZE = 1024 * 1024
+
+# the initial size of a connection receive buffer.
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the other side doesn't follow the wire protocol.
+    """
+    pass
+
+
+def pack_frame(message_type: int, payload: bytes, flags: int = 0) -> bytes:
+    """
+    Create a frame from a payload, the frame is sent in one write.
+    :param message_type: the type of the message (REQUEST, RESPONSE, PUSH_NOTIFICATION).
+    :param payload: the (encrypted) payload of the message.
+    :param flags: the flags of the message.
+    :return: the header and the payload as one bytes object.
+    """
+    return HEADER.pack(len(payload), message_type, flags) + payload
+
+
+def seal_frame(channel, message_type: int, message: bytes, flags: int = 0) -> bytes:
+    """
+    Encrypt a message into a frame, the header is authenticated with the message.
+    :param channel: the encryption channel of the connection.
+    :param message_type: the type of the message.
+    :param message: the plain message.
+    :param flags: the flags of the message.
+    :return: the frame, ready to be sent in one write.
+    """
+    return b"".join(seal_frame_parts(channel, message_type, message, flags))
+
+
+def seal_frame_parts(channel, message_type: int, message: bytes, flags: int = 0) -> (bytes, bytes):
+    """
+    Encrypt a message into a frame without joining the header and the payload, for send_parts.
+    :return: the header and the encrypted payload.
+    """
+    header = HEADER.pack(len(message) + channel.overhead, message_type, flags)
+
+    return header, channel.encrypt(message, header)
+
+
+def send_parts(connection, parts: list) -> None:
+    """
+    Send the buffers in order, with scatter-gather writes (sendmsg) where the connection supports them,
+    so the buffers aren't copied into one bytes object first.
+    :param connection: the socket to write to.
+    :param parts: the buffers to send.
+    """
+    if not hasattr(connection, "sendmsg") or isinstance(connection, ssl.SSLSocket):
+        # windows sockets have no sendmsg, and tls sockets can't use it (the records are encrypted from one buffer).
+        connection.sendall(b"".join(parts))
+        return
+
+    index = 0
+    while index < len(parts):
+        sent = connection.sendmsg(parts[index:index + MAX_WRITE_PARTS])
+
+        # skip the buffers that were sent, a partly sent buffer is sent again from where it stopped.
+        while index < len(parts) and sent >= len(parts[index]):
+            sent -= len(parts[index])
+            index += 1
+
+        if sent:
+            parts[index] = memoryview(parts[index])[sent:]
+
+
+def open_frame(channel, message_type: int, flags: int, payload) -> bytes:
+    """
+    Decrypt the payload of a frame read by the receive buffer.
+    :param channel: the encryption channel of the connection.
+    :param message_type: the type of the message from the header.
+    :param flags: the flags from the header.
+    :param payload: the encrypted payload.
+    :return: the plain message.
+    """
+    return channel.decrypt(payload, HEADER.pack(len(payload), message_type, flags))
+
+
+def recv_exact(connection: socket.socket, size: int) -> bytearray:
+    """
+    Receive exactly size bytes from the connection.
+    :param connection: the socket to read from.
+    :param size: the amount of bytes to read.
+    :return: the received bytes.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+
+    while received < size:
+        count = connection.recv_into(view[received:])
+
+        if count == 0:
+            raise ConnectionResetError("Connection closed by the other side.")
+
+        received += count
+
+    return buffer
+
+
+class ReceiveBuffer:
+    def __init__(self, connection: socket.socket, capacity: int = DEFAULT_BUFFER_SIZE,
+                 max_message_size: int = MAX_MESSAGE_SIZE):
+        """
+        A preallocated receive buffer for one connection, filled with recv_into.
+        The messages are returned as memoryview slices of the buffer, so a message is only valid until the next read.
+        When the end of the buffer is reached the unread bytes wrap back to the start of the buffer.
+        :param connection: the socket to read from.
+        :param capacity: the initial size of the buffer.
+        :param max_message_size: the largest message the other side may send, bigger messages raise a ProtocolError.
+        """
+        self.connection = connection
+        self.max_message_size = max_message_size
+
+        # the buffer can only grow up to the biggest frame.
+        self.limit = max_message_size + HEADER.size
+
+        # the buffer is allocated on the first read, idle connections don't hold it.
+        self.capacity = min(capacity, self.limit)
+        self.buffer = bytearray()
+        self.view = memoryview(self.buffer)
+
+        # the unread bytes are buffer[start:end].
+        self.start = 0
+        self.end = 0
+
+        # the position the legacy delimiter search continues from.
+        self.scanned = 0
+
+    def unread(self) -> int:
+        """
+        :return: the amount of bytes that were received but not read yet.
+        """
+        return self.end - self.start
+
+    def make_room(self, size: int) -> None:
+        """
+        Make sure the buffer can hold size unread bytes after the start of the buffer.
+        :param size: the amount of bytes that should fit.
+        """
+        unread = self.unread()
+
+        if size > len(self.buffer):
+            # grow the buffer (bounded by the limit), the old memoryview is still valid for the last message.
+            buffer = bytearray(min(max(size, len(self.buffer) * 2, self.capacity), self.limit))
+            buffer[:unread] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        else:
+            # wrap the unread bytes back to the start of the buffer.
+            self.view[:unread] = self.view[self.start:self.end]
+
+        self.scanned -= self.start
+        self.start = 0
+        self.end = unread
+
+    def fill(self, size: int) -> None:
+        """
+        Receive until at least size unread bytes are in the buffer.
+        :param size: the amount of bytes needed.
+        """
+        if len(self.buffer) - self.start < size:
+            self.make_room(size)
+
+        while self.end - self.start < size:
+            count = self.connection.recv_into(self.view[self.end:])
+
+            if count == 0:
+                raise ConnectionResetError("Connection closed by the other side.")
+
+            self.end += count
+
+    def consume(self, size: int) -> memoryview:
+        """
+        Read size unread bytes from the buffer.
+        :param size: the amount of bytes to read.
+        :return: a view of the read bytes.
+        """
+        message = self.view[self.start:self.start + size]
+        self.start += size
+
+        if self.start == self.end:
+            # the buffer is empty, start over to avoid wrapping.
+            self.start = self.end = 0
+
+        return message
+
+    def read_frame(self) -> (int, int, memoryview):
+        """
+        Read one frame from the connection.
+        :return: the message type, the flags and the payload of the frame.
+        """
+        self.fill(HEADER.size)
+
+        length, message_type, flags = HEADER.unpack_from(self.buffer, self.start)
+
+        if length > self.max_message_size:
+            raise ProtocolError(f"Message of {length} bytes is over the limit of {self.max_message_size} bytes.")
+
+        self.fill(HEADER.size + length)
+        self.consume(HEADER.size)
+
+        return message_type, flags, self.consume(length)
+
+    def read_legacy_message(self) -> memoryview:
+        """
+        Read one message that ends with the legacy delimiter.
+        Unlike the old reader, the delimiter may arrive in the same chunk as the message.
+        :return: the message without the delimiter.
+        """
+        self.scanned = max(self.scanned, self.start)
+
+        while True:
+            end = self.buffer.find(LEGACY_DELIMITER, self.scanned, self.end)
+
+            if end != -1:
+                self.scanned = 0
+                message = self.consume(end - self.start)
+                self.consume(len(LEGACY_DELIMITER))
+                return message
+
+            # continue the search where a delimiter could start.
+            self.scanned = max(self.start, self.end - len(LEGACY_DELIMITER) + 1)
+
+            if self.unread() > self.max_message_size:
+                raise ProtocolError(f"Message is over the limit of {self.max_message_size} bytes.")
+
+            self.fill(self.unread() + 1)
+
+
+# -- Hello --
+
+def create_hello(capabilities: dict) -> bytes:
+    """
+    Create the hello message which is sent (plain) right after the key exchange.
+    :param capabilities: the protocol capabilities of the sender.
+    :return: the hello message.
+    """
+    body = json.dumps(capabilities).encode('utf-8')
+
+    return HELLO_MAGIC + HELLO_LENGTH.pack(len(body)) + body
+
+
+def read_hello(connection: socket.socket) -> dict:
+    """
+    Read a hello message from the connection.
+    :param connection: the socket to read from.
+    :return: the capabilities of the other side.
+    """
+    if recv_exact(connection, len(HELLO_MAGIC)) != HELLO_MAGIC:
+        raise ProtocolError("Invalid hello message.")
+
+    length, = HELLO_LENGTH.unpack(recv_exact(connection, HELLO_LENGTH.size))
+
+    return json.loads(recv_exact(connection, length))
+
+
+def peek_hello(connection: socket.socket) -> bool:
+    """
+    Wait for the first bytes of the client and check if they are a hello, without consuming them.
+    Legacy clients never send a hello, their first bytes are an encrypted request.
+    :param connection: the socket to peek on.
+    :return: True if the client sent a hello, otherwise False.
+    """
+    while True:
+        head = connection.recv(len(HELLO_MAGIC), socket.MSG_PEEK)
+
+        if head == b"":
+            raise ConnectionResetError("Connection closed by the other side.")
+
+        if not HELLO_MAGIC.startswith(head):
+            return False
+
+        if len(head) == len(HELLO_MAGIC):
+            return True
+
+        # only part of the magic arrived, wait for the rest.
+        time.sleep(0.01)
+
+
+def negotiate_version(capabilities: dict) -> int:
+    """
+    Choose the framing version from the client capabilities.
+    :param capabilities: the capabilities from the client hello.
+    :return: the highest version both sides support.
+    """
+    version = capabilities.get("Version", LEGACY_VERSION)
+
+    if type(version) is not int or version < LEGACY_VERSION:
+        return LEGACY_VERSION
+
+    return min(version, FRAMING_VERSION)
@@ -0,0 +1,200 @@
+import time
+
+import utils
+from Metrics import Metrics
+from Schemas import validator
+
+# the lanes of the requests of a connection (see Pipeline.py), the requests of a lane keep their order.
+LANE_ACCOUNT = "account"
+LANE_LOBBY = "lobby"
+LANE_FRIENDS = "friends"
+
+# a check (middleware) has the signature of a handler: check(client, request, rid, request_id) -> bool,
+# it returns True to let the request through, otherwise it already sent the error response.
+
+
+class Route:
+    __slots__ = ("command", "name", "handler", "checks", "lane", "timing_name", "rejected_name", "errors_name")
+
+    def __init__(self, command: str, handler, checks: tuple, lane: str):
+        """
+        A command and the handler serving it.
+        :param command: the normalized (lower case) command.
+        :param handler: handler(client, request, rid, request_id), called when all the checks passed.
+        :param checks: the checks the request goes through before the handler, in order.
+        :param lane: the lane of the requests of the command.
+        """
+        self.command = command
+        self.name = command.replace("_", " ").title()
+        self.handler = handler
+        self.checks = checks
+        self.lane = lane
+
+        # the metric names are built once, not on every request.
+        self.timing_name = f"command_{command}"
+        self.rejected_name = f"command_rejected_{command}"
+        self.errors_name = f"command_errors_{command}"
+
+
+class Router:
+    def __init__(self, metrics: Metrics, schemas: dict = None):
+        """
+        Map the commands of the requests to their handlers, a dict lookup no matter how many commands there are.
+        Every command is timed (command_<command>), and counts the requests its checks rejected
+        (command_rejected_<command>) and the requests its handler failed on (command_errors_<command>).
+        :param metrics: the server metrics.
+        :param schemas: command: the schema of its data (see Schemas.py), the data is validated after the checks.
+        """
+        self.metrics = metrics
+        self.schemas = schemas or {}
+
+        # command: route
+        self.routes = {}
+
+    def route(self, command: str, handler, *checks, lane: str = LANE_ACCOUNT) -> None:
+        """
+        Register the handler of a command.
+        :param command: the command, case insensitive.
+        :param handler: handler(client, request, rid, request_id).
+        :param checks: the checks (auth, lobby...) the request goes through first, in order.
+        :param lane: the lane of the requests of the command, they keep their order with the requests of the lane.
+        """
+        command = command.lower()
+
+        if command in self.routes:
+            raise ValueError(f"Command {command} is already routed.")
+
+        # the schema is compiled once, here. the data is validated after the checks, so a request that isn't
+        # authenticated is rejected for its token before anything about its data is answered.
+        if command in self.schemas:
+            checks = checks + (validator(self.schemas[command]),)
+
+        self.routes[command] = Route(command, handler, checks, lane)
+
+    def find(self, command: str) -> Route or None:
+        """
+        :param command: the command of a request, case insensitive.
+        :return: the route of the command, None if the command is unknown.
+        """
+        return self.routes.get(command.lower())
+
+    def dispatch(self, client, request: dict, request_id: int, route: Route = None) -> None:
+        """
+        Run the checks and the handler of the command of the request.
+        :param client: the client that sent the request.
+        :param request: the request.
+        :param request_id: the server side number of the request, for the log.
+        :param route: the route of the command if it was already found (see find).
+        """
+        rid = request["Id"]
+
+        if route is None:
+            route = self.find(request["Command"])
+
+        if route is None:
+            self.metrics.increment("commands_unknown")
+            utils.server_print("Handler Error", f"Request ({request_id}), Unknown command from {client.address}.")
+            client.send_response(rid, 404, "Not Found", {"Msg": "Unknown command."})
+            return
+
+        utils.server_print("Handler", f"Request ({request_id}), identified as {route.name} from {client.address}.")
+
+        start_time = time.monotonic()
+
+        try:
+            for check in route.checks:
+                if not check(client, request, rid, request_id):
+                    self.metrics.increment(route.rejected_name)
+                    return
+
+            route.handler(client, request, rid, request_id)
+        except Exception:
+            self.metrics.increment(route.errors_name)
+            raise
+        finally:
+            self.metrics.observe(route.timing_name, time.monotonic() - start_time)
+
+
+# -- Shared checks --
+
+def in_lobby(client, request: dict, rid, request_id: int) -> bool:
+    """
+    Check the client is in a lobby, the handler gets the lobby with client.get_data("lobby_info").
+    """
+    if client.get_data("lobby_info") is None:
+        utils.server_print("Handler Error", f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
+        client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
+        return False
+
+    return True
+
+
+def not_in_lobby(client, request: dict, rid, request_id: int) -> bool:
+    """
+    Check the client isn't in a lobby yet.
+    """
+    if client.get_data("lobby_info") is not None:
+        utils.server_print("Handler Error", f"Request ({request_id}), User {client.get_data('username')} already in lobby.")
+        client.send_response(rid, 409, "Conflict", {"Msg": "User already in lobby."})
+        return False
+
+    return True
+
+
+def lobby_owner(client, request: dict, rid, request_id: int) -> bool:
+    """
+    Check the client owns its lobby, a lobby check (see on_lobby).
+    """
+    lobby = client.get_data("lobby_info")
+
+    if client is not lobby.owner:
+        utils.server_print("Handler Error",
+                           f"Request ({request_id}), User {client.get_data('username')} isn't the owner of lobby {lobby.code}.")
+        client.send_response(rid, 409, "Conflict", {"Msg": "User isn't the owner of lobby."})
+        return False
+
+    return True
+
+
+def lobby_player(client, request: dict, rid, request_id: int) -> bool:
+    """
+    Check the client is a player (not a spectator) of its lobby, a lobby check (see on_lobby).
+    """
+    if client not in client.get_data("lobby_info").players:
+        utils.server_print("Handler Error", f"Request ({request_id}), User {client.get_data('username')} isn't a player.")
+        client.send_response(rid, 409, "Conflict", {"Msg": "User isn't a player."})
+        return False
+
+    return True
+
+
+def on_lobby(handler, *checks):
+    """
+    Run a handler on the mailbox of the lobby of the client (see Lobby.submit), for the routes after in_lobby.
+    :param handler: handler(client, request, rid, request_id), it changes the lobby.
+    :param checks: the checks of the lobby state (lobby_owner, lobby_player), they run on the mailbox right before
+    the handler, so the requests queued before it (a kick, a leave) can't change the lobby in between.
+    :return: the handler for the router, it waits for the mailbox.
+    """
+    def run(client, request: dict, rid, request_id: int) -> None:
+        lobby = client.get_data("lobby_info")
+        lobby.call(run_in_lobby, lobby, handler, checks, client, request, rid, request_id)
+
+    return run
+
+
+def run_in_lobby(lobby, handler, checks: tuple, client, request: dict, rid, request_id: int) -> None:
+    """
+    Run a handler on the mailbox of the lobby, if the client is still in the lobby and the checks pass.
+    """
+    # the client may have left the lobby (or was kicked) while the request waited on the mailbox.
+    if client.get_data("lobby_info") is not lobby:
+        utils.server_print("Handler Error", f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
+        client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
+        return
+
+    for check in checks:
+        if not check(client, request, rid, request_id):
+            return
+
+    handler(client, request, rid, request_id)
@@ -0,0 +1,120 @@
+"""
+The schemas of the data of the requests, one per command, compiled once into validators.
+A schema maps the fields of the data to their spec:
+    a type (str, int...)         the field must be exactly of the type (a bool isn't an int).
+    a tuple (int, low, high)     an int from low to high (inclusive).
+    a dict                       a nested object, with its own schema.
+Every field of a schema is required, fields that aren't in the schema are ignored.
+"""
+import utils
+
+BOARD_SIZE = 9
+
+TYPE_NAMES = {str: "a string", int: "an integer", bool: "a boolean", list: "a list", dict: "an object"}
+
+# command: the schema of its data.
+SCHEMAS = {
+    "register": {"Username": str, "Password": str},
+    "login": {"Username": str, "Password": str},
+
+    "create_lobby": {},
+    "join_lobby": {"Code": str},
+    "leave_lobby": {},
+    "get_lobby": {"Code": str},
+    "become_lobby_spectator": {},
+    "become_lobby_player": {},
+    "make_lobby_spectator": {"Username": str},
+    "kick_user_lobby": {"Username": str},
+    "ban_user_lobby": {"Username": str},
+
+    "start_game": {},
+    "game_move": {"Move": {"row": (int, 0, BOARD_SIZE - 1),
+                           "column": (int, 0, BOARD_SIZE - 1),
+                           "value": (int, 1, BOARD_SIZE)}},
+    "chat_message": {"Message": str},
+
+    "add_friend": {"Username": str},
+    "accept_friend": {"Username": str},
+    "reject_friend": {"Username": str},
+    "get_friend_list": {},
+}
+
+
+def compile_spec(spec, path: str):
+    """
+    Compile the spec of one field.
+    :param spec: a type, a (type, low, high) tuple or a nested schema.
+    :param path: the name of the field in the messages, nested fields are joined with dots (Move.row).
+    :return: validate(value) -> the error message, None if the value is valid.
+    """
+    if type(spec) is dict:
+        return compile_schema(spec, path)
+
+    if type(spec) is tuple:
+        spec_type, low, high = spec
+        error = f"Invalid {path} attribute, expected {TYPE_NAMES[spec_type]} from {low} to {high}."
+
+        def validate(value):
+            if type(value) is not spec_type or not low <= value <= high:
+                return error
+
+            return None
+
+        return validate
+
+    error = f"Invalid {path} attribute, expected {TYPE_NAMES[spec]}."
+
+    def validate(value):
+        return error if type(value) is not spec else None
+
+    return validate
+
+
+def compile_schema(schema: dict, path: str = "Data"):
+    """
+    Compile a schema into a validator, the fields and their messages are prepared once.
+    :param schema: the schema (see the module docstring).
+    :param path: the name of the object in the messages.
+    :return: validate(data) -> the error message of the first invalid field, None if the data is valid.
+    """
+    prefix = "" if path == "Data" else path + "."
+    fields = tuple((name, f"Missing {prefix}{name} attribute.", compile_spec(spec, prefix + name))
+                   for name, spec in schema.items())
+    error = f"Invalid {path} attribute, expected {TYPE_NAMES[dict]}."
+
+    def validate(data):
+        if type(data) is not dict:
+            return error
+
+        for name, missing, validate_field in fields:
+            if name not in data:
+                return missing
+
+            field_error = validate_field(data[name])
+            if field_error is not None:
+                return field_error
+
+        return None
+
+    return validate
+
+
+def validator(schema: dict):
+    """
+    Build the router check of a schema, it answers an invalid request with 400 and the error.
+    :param schema: the schema of the data of the request.
+    :return: check(client, request, rid, request_id) -> bool.
+    """
+    validate = compile_schema(schema)
+
+    def check(client, request: dict, rid, request_id: int) -> bool:
+        error = validate(request["Data"])
+
+        if error is None:
+            return True
+
+        utils.server_print("Handler Error", f"Request ({request_id}), {error}")
+        client.send_response(rid, 400, "Bad Request", {"Msg": error})
+        return False
+
+    return check
@@ -1,29 +1,45 @@
 import argparse
 import datetime as dt
-import random
+import itertools
 import socket
-import string
 import os
+import signal
+import sys
+import threading
+import time
 
 import Methods.LatestVersion as api
-import Hashing
+import Compression
+import Encryption
+import Protocol
+import Transport
 import utils
 from ClientInterface import Client
-from Database.Database import Database
+from Database.Backends import COMMIT_WINDOW, JSON, MAX_BATCH, configured_backend, open_database
+from HashingService import HashingBusy, HashingService
+from Heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, Reaper
 from Lobby import Lobby, LobbyManager
+from Metrics import Metrics
+from Pipeline import MAX_IN_FLIGHT, SerialExecutor
+from Router import LANE_ACCOUNT, LANE_FRIENDS, LANE_LOBBY, Router, in_lobby, lobby_owner, lobby_player, not_in_lobby, on_lobby
+from Schemas import SCHEMAS
+from Sessions import SessionRegistry
 from ThreadPool import ThreadPool
+from Throttle import FailureThrottle
+from Writer import Writer
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
 
 class ServerSocket:
     """
     The server socket side, run the server socket and listen for incoming connections.
     """
 
-    def __init__(self, address, port, db_profile):
+    def __init__(self, address, port, db_profile, flush_deadline=0.005, metrics_interval=60,
+                 compression_threshold=Compression.DEFAULT_THRESHOLD, tls_context=None, hashing_workers=None,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT, db_backend=JSON,
+                 commit_window=COMMIT_WINDOW, max_batch=MAX_BATCH):
         # create or split the log file:
         with open(f"Logs/{dt.datetime.now().strftime('%d-%m-%Y')}.log", 'a') as log:
             log.write("=============== Initiating the server. ===============\n")
@@ -32,15 +48,13 @@ class ServerSocket:
             # *should be in config*, for now just a static var
             self.MAX_CLIENTS = 3
 
-            # all the clients that the server is handling.
-            self.clients = []
-
-            # all the clients that have already logged in
-            self.logged_clients = {}
+            # all the clients that the server is handling, and the sessions of the logged in ones.
+            self.sessions = SessionRegistry()
 
             # the database interface
             self.db_profile = db_profile
-            self.database = Database(db_profile)
+            self.db_backend = db_backend
+            self.database = open_database(db_profile, db_backend, commit_window, max_batch)
 
             # create a socket with tpc protocol.
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -55,16 +69,63 @@ class ServerSocket:
             # running variable for the main loop, variable is private.
             self.__running = False
 
-            # create a thread pool of client handling.
-            self.threadpool = ThreadPool(self.MAX_CLIENTS)
+            # the thread pools of the thread engine, created when it runs (see start_pools).
+            self.threadpool = None
+            self.handshake_pool = None
+            self.request_pool = None
+
+            # the key exchange of new connections, most of it is waiting for the client so it gets its own threads.
+            self.HANDSHAKE_WORKERS = 32
+
+            # the accepted connections that may wait for the handshake pool, the rest wait in the listen backlog.
+            self.MAX_PENDING_HANDSHAKES = 64
+            self.handshake_slots = threading.BoundedSemaphore(self.MAX_PENDING_HANDSHAKES)
+
+            # the time in seconds a client has for the whole key exchange.
+            self.HANDSHAKE_TIMEOUT = 10
+
+            # a pem of a 4096 bits rsa key is less than 1KB.
+            self.MAX_PUBLIC_KEY_SIZE = 8 * 1024
+
+            # the connections the kernel queues until they are accepted.
+            self.LISTEN_BACKLOG = 128
+
+            # the handshake and connection metrics, reported every metrics_interval seconds.
+            self.metrics = Metrics()
+            self.metrics_interval = metrics_interval
 
             self.lobby_manager = LobbyManager(self.database)
 
-            # all the tokens that have been generated.
-            self.tokens = []
+            # the time push notifications wait in the writer of the client to be sent together.
+            self.flush_deadline = flush_deadline
+
+            # the size in bytes from which messages are compressed (on connections that negotiated compression).
+            self.compression_threshold = compression_threshold
+
+            # the bcrypt hashing of register and login, on its own processes and bounded.
+            self.hashing = HashingService(self.metrics, hashing_workers)
 
-            # request counter - used for request identification
-            self.requests = 0
+            # the addresses with too many failed logins are answered without checking the password.
+            self.login_throttle = FailureThrottle()
+
+            # the tls context of the tls transport (see Transport.py), None for the rsa key exchange.
+            self.tls_context = tls_context
+
+            # the time in seconds between the removals of the expired sessions.
+            self.SESSIONS_EXPIRE_INTERVAL = 60
+
+            # pings the silent connections and aborts the dead ones, their handlers disconnect them.
+            self.reaper = Reaper(self.sessions, self.metrics, heartbeat_interval, heartbeat_timeout)
+
+            # request counter - used for request identification, next() on it is atomic.
+            self.requests = itertools.count()
+
+            # the requests of all the connections run on the request pool, in the lanes of their connection.
+            self.REQUEST_WORKERS = 32
+
+            # the handlers of the commands, the schemas of their data and the checks before them, timed per command.
+            self.router = Router(self.metrics, SCHEMAS)
+            self.register_routes()
 
             utils.server_print("Status", "ServerSocket initialized.")
         except Exception as e:
@@ -73,230 +134,310 @@ class ServerSocket:
     def server_iteration(self) -> None:
         """
         Each interaction of the server main loop,
-        this should only be accepting and handling connections.
+        this should only be accepting connections, the key exchange is done by the handshake pool.
         """
+        # wait for a free handshake slot, the connections that arrive meanwhile wait in the listen backlog.
+        self.handshake_slots.acquire()
+
         try:
             # accept client connection.
             client_socket, client_address = self.server_socket.accept()
-            utils.server_print("Connection", "Client " + str(client_address) + " connection request accepted.")
-
-            utils.server_print("Encryption", "Waiting for the client to send the public key.")
-
-            # -- Encryption --
-
-            # receive the client public key.
-            public_pem = b""
-            while True:
-                part = client_socket.recv(1024)
-                public_pem += part
-                if b"-----END PUBLIC KEY-----" in public_pem:
-                    break
+        except Exception as e:
+            self.handshake_slots.release()
+            utils.server_print("Error", str(e))
+            return
 
-            utils.server_print("Encryption", "Client public key received.")
+        utils.server_print("Connection", "Client " + str(client_address) + " connection request accepted.")
 
-            # load the public key.
-            client_public_key = serialization.load_pem_public_key(public_pem)
+        self.metrics.increment("connections_accepted")
+        self.metrics.add("handshakes_pending", 1)
 
-            utils.server_print("Encryption", "Client public key loaded.")
+        # the key exchange is done on the handshake pool, a slow client can't stall the accept loop.
+        self.handshake_pool.submit(self.handshake, client_socket, client_address, time.monotonic())
 
-            # create aes key
-            aes_key = os.urandom(32)
-            nonce = os.urandom(16)
+    def handshake(self, client_socket: socket.socket, client_address: tuple, accepted_time: float) -> None:
+        """
+        Exchange the keys with a new connection and start to handle the client.
+        Should be running on the handshake pool.
+        :param client_socket: the accepted connection.
+        :param client_address: the address of the client.
+        :param accepted_time: the time (time.monotonic) the connection was accepted.
+        """
+        self.metrics.add("handshakes_pending", -1)
 
-            utils.server_print("Encryption", "AES key generated.")
+        start_time = time.monotonic()
+        self.metrics.observe("handshake_wait", start_time - accepted_time)
 
-            # encrypt the aes key using the client public key.
-            encrypted_aes_key = client_public_key.encrypt(
-                aes_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+        try:
+            # a client that doesn't finish the key exchange in time is disconnected.
+            client_socket.settimeout(self.HANDSHAKE_TIMEOUT)
+            Transport.set_keepalive(client_socket)
+
+            if self.tls_context is not None:
+                Transport.set_no_delay(client_socket)
+                client_socket = self.tls_context.wrap_socket(client_socket, server_side=True)
+                channel = Encryption.PlainChannel()
+
+                if client_socket.session_reused:
+                    self.metrics.increment("tls_sessions_resumed")
+            else:
+                channel = self.exchange_keys(client_socket)
+
+            client_socket.settimeout(None)
+
+        except TimeoutError:
+            self.metrics.increment("handshakes_timed_out")
+            utils.server_print("Error", f"Client {client_address} key exchange timed out.")
+            client_socket.close()
+            return
 
-            utils.server_print("Encryption", "AES key encrypted.")
+        except Exception as e:
+            self.metrics.increment("handshakes_failed")
+            utils.server_print("Error", str(e))
+            client_socket.close()
+            return
 
-            # set the public key to the client.
-            client_socket.sendall(encrypted_aes_key)
+        finally:
+            self.handshake_slots.release()
 
-            # get confirmation from the client
-            confirmation = client_socket.recv(1024).decode('utf-8')
-            if confirmation != "AES key received":
-                raise Exception("Client didn't receive the AES key.")
+        self.metrics.observe("handshake_duration", time.monotonic() - start_time)
 
-            utils.server_print("Encryption", "AES key sent to the client.")
+        # create object for the client.
+        client = Client(client_address, client_socket, channel, Writer(self.flush_deadline))
+        client.compression_threshold = self.compression_threshold
+        client.heartbeat_interval = self.reaper.interval
+        client.metrics = self.metrics
 
-            utils.server_print("Encryption", "Sending nonce to the client.")
+        self.sessions.connect(client)
 
-            # encrypt the nonce using the client public key.
-            encrypted_nonce = client_public_key.encrypt(
-                nonce,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+        # start to handle the client on a different thread.
+        self.threadpool.submit(self.handle_client, client)
 
-            # send the nonce to the client
-            client_socket.sendall(encrypted_nonce)
+    def exchange_keys(self, client_socket: socket.socket) -> Encryption.LegacyChannel:
+        """
+        Exchange the aes key and the nonce with the client using the client public key.
+        :param client_socket: the connection of the client.
+        :return: the legacy channel from the key and nonce, the client may negotiate an aead cipher later.
+        """
+        utils.server_print("Encryption", "Waiting for the client to send the public key.")
 
-            # get confirmation from the client
-            confirmation = client_socket.recv(1024).decode('utf-8')
+        # receive the client public key.
+        public_pem = b""
+        while b"-----END PUBLIC KEY-----" not in public_pem:
+            part = client_socket.recv(1024)
 
-            if confirmation != "Nonce key received":
-                raise Exception("Client didn't receive the nonce.")
+            if part == b"":
+                raise ConnectionResetError("Connection closed by the other side.")
 
-            utils.server_print("Encryption", "Nonce sent to the client.")
+            public_pem += part
 
-            # create cipher object from the key and nonce.
+            if len(public_pem) > self.MAX_PUBLIC_KEY_SIZE:
+                raise Exception("Client public key is too long.")
 
-            cipher = Cipher(algorithms.AES(aes_key), modes.CFB(nonce), backend=default_backend())
+        utils.server_print("Encryption", "Client public key received.")
 
-            # -- End Encryption --
+        # load the public key.
+        client_public_key = serialization.load_pem_public_key(public_pem)
 
-            # create object for the client.
-            client = Client(client_address, client_socket, cipher)
+        utils.server_print("Encryption", "Client public key loaded.")
 
-            # start to handle the client on a different thread.
-            self.threadpool.submit(self.handle_client, client)
+        # create aes key
+        aes_key = os.urandom(32)
+        nonce = os.urandom(16)
 
-            self.clients.append(client)
-        except Exception as e:
-            utils.server_print("Error", str(e))
+        utils.server_print("Encryption", "AES key generated.")
 
-    def handle_client(self, client: Client) -> None:
-        """
-        Handle each client individually, wait for incoming requests and serve them.
-        Should be running on the different thread.
-        :param client: the client interface to handle.
-        """
-        utils.server_print("Handler", "Starting to handle " + str(client.address) + ".")
+        # encrypt the aes key using the client public key.
+        encrypted_aes_key = self.encrypt_with_public_key(client_public_key, aes_key)
 
-        while client.running:
-            try:
-                request = client.get_request()
-                request_id = self.requests
-                self.requests += 1
+        utils.server_print("Encryption", "AES key encrypted.")
 
-                rid = request["Id"]
+        # set the public key to the client.
+        client_socket.sendall(encrypted_aes_key)
 
-                utils.server_print("Handler", f"Request ({request_id}) received from " + str(client.address) + ".")
+        # get confirmation from the client
+        confirmation = client_socket.recv(1024).decode('utf-8')
+        if confirmation != "AES key received":
+            raise Exception("Client didn't receive the AES key.")
 
-                # route the command to the specific api path.
-                if request["Command"].lower() == "register":
-                    self.handle_register(client, request, rid, request_id)
+        utils.server_print("Encryption", "AES key sent to the client.")
 
-                elif request["Command"].lower() == "login":
-                    self.handle_login(client, request, rid, request_id)
+        utils.server_print("Encryption", "Sending nonce to the client.")
 
-                elif request["Command"].lower() == "create_lobby":
-                    self.handle_create_lobby(client, request, rid, request_id)
+        # encrypt the nonce using the client public key.
+        encrypted_nonce = self.encrypt_with_public_key(client_public_key, nonce)
 
-                elif request["Command"].lower() == "join_lobby":
-                    self.handle_join_lobby(client, request, rid, request_id)
+        # send the nonce to the client
+        client_socket.sendall(encrypted_nonce)
 
-                elif request["Command"].lower() == "leave_lobby":
-                    self.handle_leave_lobby(client, request, rid, request_id)
+        # get confirmation from the client, read exactly the confirmation since a hello may follow it.
+        confirmation = Protocol.recv_exact(client_socket, len("Nonce key received")).decode('utf-8')
 
-                elif request["Command"].lower() == "get_lobby":
-                    self.handle_get_lobby(client, request, rid, request_id)
+        if confirmation != "Nonce key received":
+            raise Exception("Client didn't receive the nonce.")
 
-                elif request["Command"].lower() == "become_lobby_spectator":
-                    self.handle_become_lobby_spectator(client, request, rid, request_id)
+        utils.server_print("Encryption", "Nonce sent to the client.")
 
-                elif request["Command"].lower() == "become_lobby_player":
-                    self.handle_become_lobby_player(client, request, rid, request_id)
+        # create the legacy channel from the key and nonce, the client may negotiate an aead cipher later.
+        return Encryption.LegacyChannel(aes_key, nonce)
 
-                elif request["Command"].lower() == "make_lobby_spectator":
-                    self.handle_make_lobby_spectator(client, request, rid, request_id)
+    @staticmethod
+    def encrypt_with_public_key(client_public_key, data: bytes) -> bytes:
+        """
+        Encrypt the key exchange data using the client public key.
+        :param client_public_key: the rsa public key the client sent.
+        :param data: the data to encrypt (the aes key or the nonce).
+        :return: the encrypted data.
+        """
+        return client_public_key.encrypt(
+            data,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
 
-                elif request["Command"].lower() == "kick_user_lobby":
-                    self.handle_kick_user_lobby(client, request, rid, request_id)
+    def handle_client(self, client: Client) -> None:
+        """
+        Handle each client individually, wait for incoming requests and serve them.
+        Should be running on the different thread.
+        :param client: the client interface to handle.
+        """
+        utils.server_print("Handler", "Starting to handle " + str(client.address) + ".")
 
-                elif request["Command"].lower() == "ban_user_lobby":
-                    self.handle_ban_user_lobby(client, request, rid, request_id)
+        try:
+            # agree on the framing before reading any request.
+            client.negotiate()
+        except Exception as e:
+            utils.server_print("Error", str(e))
+            self.disconnect_user(client)
+            return
 
-                elif request["Command"].lower() == "start_game":
-                    self.handle_start_game(client, request, rid, request_id)
+        # the requests are read ahead and handled on the request pool, in the lanes of their commands.
+        lanes = SerialExecutor(self.request_pool)
 
-                elif request["Command"].lower() == "game_move":
-                    self.handle_game_move(client, request, rid, request_id)
+        while client.running:
+            try:
+                request = client.get_request()
 
-                elif request["Command"].lower() == "chat_message":
-                    self.handle_chat_message(client, request, rid, request_id)
+                # a rejected request was already answered, a closed connection stopped the client.
+                if request is None:
+                    continue
 
-                elif request["Command"].lower() == "add_friend":
-                    self.handle_add_friend(client, request, rid, request_id)
+                route = self.router.find(request["Command"])
 
-                elif request["Command"].lower() == "accept_friend":
-                    self.handle_accept_friend(client, request, rid, request_id)
+                # too many requests in flight, stop reading until one is handled.
+                lanes.wait(MAX_IN_FLIGHT)
+                lanes.submit(route.lane if route is not None else LANE_ACCOUNT, self.handle_request, client, request, route)
+            except Exception as e:
+                utils.server_print("Error", str(e))
+                break
 
-                elif request["Command"].lower() == "reject_friend":
-                    self.handle_reject_friend(client, request, rid, request_id)
+        # the requests in flight finish before the logout.
+        lanes.wait()
+        self.disconnect_user(client)
 
-                elif request["Command"].lower() == "get_friend_list":
-                    self.handle_get_friend_list(client, request, rid, request_id)
+    def handle_request(self, client: Client, request: dict, route=None) -> None:
+        """
+        Route a request of the client to its command handler (see register_routes).
+        Shared by the thread and the asyncio engines, may block (bcrypt, the database and the puzzle generation).
+        :param client: the client that sent the request.
+        :param request: the request.
+        :param route: the route of the command if the reader already found it.
+        """
+        request_id = next(self.requests)
 
-                elif request["Command"].lower() == "invite_friend":
-                    pass
-                elif request["Command"].lower() == "accept_friend_invitation":
-                    pass
-                elif request["Command"].lower() == "reject_friend_invitation":
-                    pass
-                elif request["Command"].lower() == "get_friend_information":
-                    pass
+        try:
+            self.router.dispatch(client, request, request_id, route)
+        except Exception as e:
+            # the other requests of the connection may be in flight, so the connection stays.
+            utils.server_print("Error", f"Request ({request_id}), {e}")
+            client.send_response(request["Id"], 500, "Internal Server Error", {"Msg": "Error while handling the request."})
 
-            except Exception as e:
-                utils.server_print("Error", str(e))
-                self.disconnect_user(client)
-                break
+    def register_routes(self) -> None:
+        """
+        Route every command to its handler, after the checks it needs (in order).
+        The data of the requests is validated by the router, against the schemas of Schemas.py.
+        The requests of a lane keep their order, the account lane (register, login) is the default.
+        The handlers that change the lobby of the client run on the mailbox of the lobby (on_lobby), after the checks
+        of the lobby state (owner, player).
+        """
+        auth = self.authenticate
+
+        self.router.route("register", self.handle_register)
+        self.router.route("login", self.handle_login)
+
+        # -- lobby --
+        self.router.route("create_lobby", self.handle_create_lobby, auth, not_in_lobby, lane=LANE_LOBBY)
+        self.router.route("join_lobby", self.handle_join_lobby, auth, not_in_lobby, lane=LANE_LOBBY)
+        self.router.route("leave_lobby", on_lobby(self.handle_leave_lobby), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("get_lobby", self.handle_get_lobby, auth, lane=LANE_LOBBY)
+        self.router.route("become_lobby_spectator", on_lobby(self.handle_become_lobby_spectator), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("become_lobby_player", on_lobby(self.handle_become_lobby_player), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("make_lobby_spectator", on_lobby(self.handle_make_lobby_spectator, lobby_owner), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("kick_user_lobby", on_lobby(self.handle_kick_user_lobby, lobby_owner), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("ban_user_lobby", on_lobby(self.handle_ban_user_lobby, lobby_owner), auth, in_lobby, lane=LANE_LOBBY)
+
+        # -- game --
+        self.router.route("start_game", on_lobby(self.handle_start_game, lobby_owner), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("game_move", on_lobby(self.handle_game_move, lobby_player), auth, in_lobby, lane=LANE_LOBBY)
+        self.router.route("chat_message", on_lobby(self.handle_chat_message), auth, in_lobby, lane=LANE_LOBBY)
+
+        # -- friends --
+        self.router.route("add_friend", self.handle_add_friend, auth, lane=LANE_FRIENDS)
+        self.router.route("accept_friend", self.handle_accept_friend, auth, lane=LANE_FRIENDS)
+        self.router.route("reject_friend", self.handle_reject_friend, auth, lane=LANE_FRIENDS)
+        self.router.route("get_friend_list", self.handle_get_friend_list, auth, lane=LANE_FRIENDS)
+
+        # not implemented yet, accepted without a response.
+        for command in ("invite_friend", "accept_friend_invitation", "reject_friend_invitation",
+                        "get_friend_information"):
+            self.router.route(command, self.handle_not_implemented, lane=LANE_FRIENDS)
 
     # -- Server Command Handlers --
 
+    def handle_not_implemented(self, client: Client, request: dict, rid: int, request_id: int) -> None:
+        """
+        A known command without a handler yet, ignored.
+        """
+        pass
+
     def handle_register(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Register a new account, login into the new account, return an auth token for authentication next
         """
 
-        utils.server_print("Handler",
-                           f"Request ({request_id}) identified as Register from " + str(client.address) + ".")
         # register data should have username and password.
-        if "Username" not in request['Data'] or "Password" not in request['Data']:
-            utils.server_print("Handler Error", f"Request ({request_id}), no username or password provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "Missing Username or Password attribute."})
-            return
 
         # username should be unique
-        if request["Data"]["Username"] in self.database.submit_read("Users"):
+        if api.account.get(request["Data"]["Username"], self.database) is not None:
             utils.server_print("Handler Error", f"Request ({request_id}), Username already registered.")
             client.send_response(rid, 409, "Conflict", {"Msg": "Username must be unique."})
             return
 
         utils.server_print("Handler", f"Request ({request_id}), passed all checks.")
 
+        try:
+            password_hash = self.hashing.hash_password(request["Data"]["Password"])
+        except HashingBusy as e:
+            utils.server_print("Handler Error", f"Request ({request_id}), {e}")
+            client.send_response(rid, 503, "Service Unavailable", {"Msg": "Server is busy, try again later."})
+            return
+
         # register the user
         if not api.account.register(client.address, request["Data"]["Username"], request["Data"]["Password"],
-                                    self.database):
+                                    self.database, password_hash):
             utils.server_print("Handler Error", f"Request ({request_id}), Error while registering the user.")
             client.send_response(rid, 500, "Internal Server Error", {"Msg": "Error while registering the user."})
             return
 
-        # generate auth token
-        token = self.generate_auth_token()
-
-        # add the token to the used token list
-        self.tokens.append(token)
-
-        # update the token and username to client object
-        client.set_data("token", token)
+        # create the session, the token authenticates the next requests.
+        token = self.sessions.login(client, request["Data"]["Username"])
         client.set_data("username", request["Data"]["Username"])
 
-        self.logged_clients[request["Data"]["Username"]] = client
-
         # get user friend list
-        friends = api.friend.get_friend_list(request["Data"]["Username"], self.logged_clients, self.database)
+        friends = api.friend.get_friend_list(request["Data"]["Username"], self.sessions, self.database)
 
         client.send_response(rid, 201, "Created", {"Msg": "User registered.", "Token": token, "Friends": friends})
         utils.server_print("Server", f"Request ({request_id}), User " + request["Data"]["Username"] + " registered.")
@@ -306,37 +447,41 @@ class ServerSocket:
         Login to an account using username and password, return an auth token for authentication next.
         """
 
-        utils.server_print("Handler", f"Request ({request_id}), identified as Login from " + str(client.address) + ".")
         # login data should have username and password.
-        if "Username" not in request['Data'] or "Password" not in request['Data']:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username or password provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "Missing Username or Password attribute."})
+
+        # too many failed logins from the address, answered before any hashing.
+        if self.login_throttle.blocked(client.address[0]):
+            self.metrics.increment("logins_throttled")
+            utils.server_print("Handler Error", f"Request ({request_id}), Too many failed logins from {client.address[0]}.")
+            client.send_response(rid, 429, "Too Many Requests", {"Msg": "Too many failed logins, try again later."})
             return
 
         information = api.account.get(request["Data"]["Username"], self.database)
 
-        if information is None or not Hashing.check_password(bytes.fromhex(information["password"]),
-                                                             request["Data"]["Password"]):
+        try:
+            valid = information is not None and self.hashing.check_password(bytes.fromhex(information["password"]),
+                                                                             request["Data"]["Password"])
+        except HashingBusy as e:
+            utils.server_print("Handler Error", f"Request ({request_id}), {e}")
+            client.send_response(rid, 503, "Service Unavailable", {"Msg": "Server is busy, try again later."})
+            return
+
+        if not valid:
+            self.login_throttle.record_failure(client.address[0])
             utils.server_print("Handler Error", f"Request ({request_id}), Invalid credentials.")
             client.send_response(rid, 404, "Not Found", {"Msg": "Invalid Credentials."})
             return
 
-        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
+        self.login_throttle.reset(client.address[0])
 
-        # generate auth token
-        token = self.generate_auth_token()
-
-        # add the token to the used token list
-        self.tokens.append(token)
+        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
 
-        # update the token and username to client object
-        client.set_data("token", token)
+        # create the session, the token authenticates the next requests.
+        token = self.sessions.login(client, request["Data"]["Username"])
         client.set_data("username", request["Data"]["Username"])
 
-        self.logged_clients[request["Data"]["Username"]] = client
-
         # get user friend list
-        friends = api.friend.get_friend_list(request["Data"]["Username"], self.logged_clients, self.database)
+        friends = api.friend.get_friend_list(request["Data"]["Username"], self.sessions, self.database)
 
         client.send_response(rid, 200, "OK", {"Msg": "Logged in successfully.", "Token": token, "Friends": friends})
         utils.server_print("Server", f"Request ({request_id}), User " + request["Data"]["Username"] + " logged in successfully.")
@@ -347,22 +492,6 @@ class ServerSocket:
         Create a new lobby using auth token.
         """
 
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Create Lobby from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if client.get_data("lobby") is not None:
-            utils.server_print("Handler Error", f"Request ({request_id}), User {client.get_data('username')} already in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User already in lobby."})
-            return
-
-        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
-
         # create and use the lobby
         lobby = self.lobby_manager.create_lobby(client)
         client.set_data("lobby_info", lobby)
@@ -374,24 +503,6 @@ class ServerSocket:
         Join lobby using auth token, code.
         """
 
-        utils.server_print("Handler", "Request identified as Join Lobby from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if client.get_data("lobby_info") is not None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} already in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User already in lobby."})
-            return
-
-        if "Code" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No code provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No code provided."})
-
         if request["Data"]["Code"] not in self.lobby_manager.all_lobbies:
             utils.server_print("Handler Error", f"Request ({request_id}), Invalid code.")
             client.send_response(rid, 404, "Not Found", {"Msg": "Invalid code."})
@@ -400,7 +511,7 @@ class ServerSocket:
         utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
 
         lobby = self.lobby_manager.all_lobbies[request["Data"]["Code"]]
-        role, success = lobby.register_client(client)
+        role, success = lobby.call(lobby.register_client, client)
         if success:
             client.set_data("lobby_info", lobby)
             client.send_response(rid, 200, "OK",
@@ -411,38 +522,18 @@ class ServerSocket:
             if role != "players":
                 del data["Username"]
 
-            for c in lobby.players + lobby.spectators:
-                if c is not client:
-                    c.push_notification("User_Joined_Lobby", data)
+            lobby.broadcast("User_Joined_Lobby", data, client)
 
             utils.server_print("Server", f"Request ({request_id}), Client registered to lobby {lobby.code}.")
         else:
             client.send_response(rid, 409, "Conflict", {"Msg": "You're blocked from the lobby."})
             utils.server_print("Server", f"Request ({request_id}), Client is blocked from lobby {lobby.code}")
 
-    @staticmethod
-    def handle_leave_lobby(client: Client, request: dict, rid: int, request_id: int) -> None:
+    def handle_leave_lobby(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Leave the lobby using auth token, return the information on the lobby.
         """
 
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Leave Lobby from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if client.get_data("lobby_info") is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
-        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
-
         lobby = client.get_data("lobby_info")
         role, success = lobby.remove_client(client)
 
@@ -451,28 +542,13 @@ class ServerSocket:
                                f"Request ({request_id}), Client {client.get_data('username')} leaved the lobby {lobby.code}.")
             client.send_response(rid, 200, "OK", {"Msg": "Successfully leaving lobby."})
 
-            for c in lobby.players + lobby.spectators:
-                c.push_notification("User_Left_Lobby", {"Username": request["Data"]["Username"], "Role": role})
+            lobby.broadcast("User_Left_Lobby", {"Username": client.get_data("username"), "Role": role})
 
     def handle_get_lobby(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Get lobby information using code.
         """
 
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Get Lobby from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if "Code" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No code provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No code provided."})
-            return
-
         if request["Data"]["Code"] not in self.lobby_manager.all_lobbies:
             utils.server_print("Handler Error", f"Request ({request_id}), Invalid code.")
             client.send_response(rid, 404, "Not Found", {"Msg": "Invalid code."})
@@ -483,30 +559,15 @@ class ServerSocket:
         lobby = self.lobby_manager.all_lobbies[request["Data"]["Code"]]
         utils.server_print("Server",
                            f"Request ({request_id}), Client {client.get_data('username')} leaved the lobby {lobby.code}.")
-        client.send_response(rid, 200, "OK", {"Lobby_Info": lobby.__repr__()})
+        client.send_response(rid, 200, "OK", {"Lobby_Info": lobby.call(lobby.__repr__)})
 
-    @staticmethod
-    def handle_become_lobby_spectator(client: Client, request: dict, rid: int, request_id: int) -> None:
+    def handle_become_lobby_spectator(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Become a lobby spectator, for players.
         """
 
-        utils.server_print("Handler", "Request identified as Become Lobby Spectator from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
         lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
         # in case the user is not a player
         if client in lobby.spectators:
             utils.server_print("Handler Error",
@@ -523,32 +584,15 @@ class ServerSocket:
         utils.server_print("Server",
                            f"Request ({request_id}), Client {client.get_data('username')} became a spectator on lobby {lobby.code}.")
 
-        for c in lobby.players + lobby.spectators:
-            if c is not client:
-                c.push_notification("Become_Spectator", {"Username": client.get_data("username")})
+        lobby.broadcast("Become_Spectator", {"Username": client.get_data("username")}, client)
 
-    @staticmethod
-    def handle_become_lobby_player(client: Client, request: dict, rid: int, request_id: int) -> None:
+    def handle_become_lobby_player(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Become a lobby player, for spectators.
         """
 
-        utils.server_print("Handler", "Request identified as Become Lobby Player from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
         lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
         # in case the user is a player
         if client in lobby.players:
             utils.server_print("Handler Error",
@@ -559,6 +603,7 @@ class ServerSocket:
         if len(lobby.players) >= lobby.MAX_PLAYERS:
             utils.server_print("Handler Error", f"Request ({request_id}), The lobby {lobby.code} is full.")
             client.send_response(rid, 409, "Conflict", {"Msg": "The lobby is full."})
+            return
 
         utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
 
@@ -569,42 +614,15 @@ class ServerSocket:
         utils.server_print("Server",
                            f"Request ({request_id}), Client {client.get_data('username')} became a player on lobby {lobby.code}.")
 
-        for c in lobby.players + lobby.spectators:
-            if c is not client:
-                c.push_notification("Become_Player", {"Username": client.get_data("username")})
+        lobby.broadcast("Become_Player", {"Username": client.get_data("username")}, client)
 
     def handle_make_lobby_spectator(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Make a lobby spectator, for players.
         """
 
-        utils.server_print("Handler", "Request identified as Make Lobby Spectator from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
         lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} already in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User already in lobby."})
-            return
-
-        if client is not lobby.owner:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't the owner of lobby {lobby.code}.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't the owner of lobby."})
-            return
-
-        if "Username" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No username provided."})
-            return
-
         information = api.account.get(request["Data"]["Username"], self.database)
 
         if information is None:
@@ -612,7 +630,7 @@ class ServerSocket:
             client.send_response(rid, 404, "Not Found", {"Msg": "Invalid username."})
             return
 
-        requested_client = self.logged_clients[request["Data"]["Username"]]
+        requested_client = self.sessions.get_client(request["Data"]["Username"])
 
         # in case the user is not a player
         if requested_client not in lobby.players:
@@ -628,43 +646,15 @@ class ServerSocket:
 
         client.send_response(rid, 200, "Ok", {"Msg": "Successfully making a spectator."})
 
-        for c in lobby.players + lobby.spectators:
-            if c is not client:
-                c.push_notification("Become_Spectator", {"Username": request["Data"]["Username"]})
+        lobby.broadcast("Become_Spectator", {"Username": request["Data"]["Username"]}, client)
 
     def handle_kick_user_lobby(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Kick a player from a lobby, owner only.
         """
 
-        utils.server_print("Handler", f"Request ({request_id}), identified as Kick User From Lobby from " + str(
-            client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
         lobby: Lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
-        if client is not lobby.owner:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't the owner of lobby {lobby.code}.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't the owner of lobby."})
-            return
-
-        if "Username" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No username provided."})
-            return
-
         information = api.account.get(request["Data"]["Username"], self.database)
 
         if information is None:
@@ -672,12 +662,12 @@ class ServerSocket:
             client.send_response(rid, 404, "Not Found", {"Msg": "Invalid username."})
             return
 
-        lobby: Lobby = client.get_data("lobby")
         client_to_kick: Client = lobby.get_client(request["Data"]["Username"])
 
         if client_to_kick is None:
             utils.server_print("Handler Error", f"Request ({request_id}), User to kick isn't in lobby.")
-            client.send_response(rid, 404, "Not Found", "User to kick isn't in lobby.")
+            client.send_response(rid, 404, "Not Found", {"Msg": "User to kick isn't in lobby."})
+            return
 
         utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
 
@@ -687,43 +677,15 @@ class ServerSocket:
         client_to_kick.push_notification("Lobby_Kick", {"Msg": "You have been kicked from the lobby."})
         client.send_response(rid, 200, "OK", {"Msg": "User kicked."})
 
-        for c in lobby.players + lobby.spectators:
-            if c is not client:
-                c.push_notification("Use_Left_Lobby",
-                                    {"Username": client_to_kick.get_data("username"), "Role": "players"})
+        lobby.broadcast("Use_Left_Lobby", {"Username": client_to_kick.get_data("username"), "Role": "players"}, client)
 
     def handle_ban_user_lobby(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Ban a player from a lobby, owner only.
         """
-        utils.server_print("Handler", f"Request ({request_id}), identified as Ban User From Lobby from " + str(
-            client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
 
         lobby: Lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
-        if client is not lobby.owner:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't the owner of lobby {lobby.code}.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't the owner of lobby."})
-            return
-
-        if "Username" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No username provided."})
-            return
-
         information = api.account.get(request["Data"]["Username"], self.database)
 
         if information is None:
@@ -731,12 +693,12 @@ class ServerSocket:
             client.send_response(rid, 404, "Not Found", {"Msg": "Invalid username."})
             return
 
-        lobby: Lobby = client.get_data("lobby")
         client_to_ban: Client = lobby.get_client(request["Data"]["Username"])
 
         if client_to_ban is None:
             utils.server_print("Handler Error", f"Request ({request_id}), User to ban isn't in lobby.")
-            client.send_response(rid, 404, "Not Found", "User to ban isn't in lobby.")
+            client.send_response(rid, 404, "Not Found", {"Msg": "User to ban isn't in lobby."})
+            return
 
         utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
 
@@ -746,89 +708,35 @@ class ServerSocket:
         client_to_ban.push_notification("Lobby_Ban", {"Msg": "You have been Baned from the lobby."})
         client.send_response(rid, 200, "OK", {"Msg": "User Baned."})
 
-        for c in lobby.players + lobby.spectators:
-            if c is not client:
-                c.push_notification("Use_Left_Lobby",
-                                    {"Username": client_to_ban.get_data("username"), "Role": "players"})
+        lobby.broadcast("Use_Left_Lobby", {"Username": client_to_ban.get_data("username"), "Role": "players"}, client)
 
-    @staticmethod
-    def handle_start_game(client: Client, request: dict, rid: int, request_id: int) -> None:
+    def handle_start_game(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Start lobby game.
         """
-        utils.server_print("Handle",
-                           f"Request ({request_id}), identified as Start Game from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
 
         lobby: Lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
+        if not lobby.players:
+            utils.server_print("Handler Error", f"Request ({request_id}), The lobby {lobby.code} has no players.")
+            client.send_response(rid, 409, "Conflict", {"Msg": "The lobby has no players."})
             return
 
-        if client is not lobby.owner:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't the owner of lobby {lobby.code}.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't the owner of lobby."})
-            return
-
-        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
         lobby.start_game()
         utils.server_print("Lobby Manager", "Request ({request_id}), Game started on lobby " + lobby.code + ".")
 
         client.send_response(rid, 200, "OK", {"Msg": "Lobby game started.", "Board": lobby.puzzle, "Leaderboard": lobby.leaderboard, "Ending_Time": lobby.ending_time.strftime("%Y-%m-%d %H:%M:%S")})
 
-        for c in lobby.players + lobby.spectators:
-            if c is not client:
-                c.push_notification("Game_Started", {"Board": lobby.puzzle, "Leaderboard": lobby.leaderboard, "Ending_Time": lobby.ending_time.strftime("%Y-%m-%d %H:%M:%S")})
+        lobby.broadcast("Game_Started", {"Board": lobby.puzzle, "Leaderboard": lobby.leaderboard, "Ending_Time": lobby.ending_time.strftime("%Y-%m-%d %H:%M:%S")}, client)
 
         utils.server_print("Server", f"Request ({request_id}), Game started on lobby {lobby.code}.")
 
-    @staticmethod
-    def handle_game_move(client: Client, request: dict, rid: int, request_id: int) -> None:
+    def handle_game_move(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Handle game move.
         """
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Game Move from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
 
         lobby: Lobby = client.get_data("lobby_info")
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
-        if client not in lobby.players:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't a player.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't a player."})
-            return
-
-        if "Move" not in request["Data"] or type(request["Data"]["Move"]) is not dict:
-            utils.server_print("Handler Error", f"Request ({request_id}), Not move provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "Not move provided."})
-            return
-
-        if "row" not in request["Data"]["Move"] or "column" not in request["Data"]["Move"] or "value" not in request["Data"][
-            "Move"] or type(request["Data"]["Move"]["row"]) is not int or type(
-                request["Data"]["Move"]["column"]) is not int or type(request["Data"]["Move"]["value"]) is not int:
-            utils.server_print("Handler Error", f"Request ({request_id}), Invalid move provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "Invalid move provided."})
-            return
 
         if not lobby.game_started:
             utils.server_print("Handler Error", f"Request ({request_id}), Game not started or ended.")
@@ -848,38 +756,17 @@ class ServerSocket:
             client.send_response(rid, 400, "Bad Request", {"Msg": "Move rejected."})
 
         lobby.update_leaderboard()
+        lobby.check_game_over()
 
-    @staticmethod
-    def handle_chat_message(client: Client, request: dict, rid: int, request_id: int) -> None:
+    def handle_chat_message(self, client: Client, request: dict, rid: int, request_id: int) -> None:
         """
         Handle chat message.
         """
-        utils.server_print("Handle",
-                           f"Request ({request_id}), identified as Chat Message from " + str(client.address) + ".")
 
         now = dt.datetime.now()
 
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
         lobby: Lobby = client.get_data("lobby_info")
 
-        if lobby is None:
-            utils.server_print("Handler Error",
-                               f"Request ({request_id}), User {client.get_data('username')} isn't in lobby.")
-            client.send_response(rid, 409, "Conflict", {"Msg": "User isn't in lobby."})
-            return
-
-        if "Message" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No message provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No message provided."})
-            return
-
-        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
-
         lobby.send_message(client, request["Data"]["Message"], now.strftime("%H:%M:%S"))
         client.send_response(rid, 200, "OK", {"Msg": "Message sent."})
         utils.server_print("Server", f"Request ({request_id}), Message sent to lobby {lobby.code}.")
@@ -890,19 +777,6 @@ class ServerSocket:
         """
         Add a friend to the user.
         """
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Add Friend from " + str(client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if "Username" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No username provided."})
-            return
 
         information = api.account.get(request["Data"]["Username"], self.database)
 
@@ -916,8 +790,10 @@ class ServerSocket:
         api.friend.add_friend(client.get_data("username"), request["Data"]["Username"], self.database)
         client.send_response(rid, 200, "OK", {"Msg": "Friend request sent."})
 
-        if request["Data"]["Username"] in self.logged_clients:
-            self.logged_clients[request["Data"]["Username"]].push_notification("Friend_Request", {"Username": client.get_data("username")})
+        # the user may log out meanwhile, so get the client once.
+        friend = self.sessions.get_client(request["Data"]["Username"])
+        if friend is not None:
+            friend.push_notification("Friend_Request", {"Username": client.get_data("username")})
 
         utils.server_print("Server", f"Request ({request_id}), Friend Request Sent.")
 
@@ -925,20 +801,6 @@ class ServerSocket:
         """
         Accept a friend request.
         """
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Accept Friend Request from " + str(
-                               client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if "Username" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No username provided."})
-            return
 
         information = api.account.get(request["Data"]["Username"], self.database)
 
@@ -948,7 +810,7 @@ class ServerSocket:
             return
 
         # check if the user sent a request.
-        friend_list = api.friend.get_friend_list(client.get_data("username"), self.logged_clients, self.database)[1]
+        friend_list = api.friend.get_friend_list(client.get_data("username"), self.sessions, self.database)[1]
 
         if request["Data"]["Username"] not in friend_list:
             utils.server_print("Handler Error", f"Request ({request_id}), No Friend Request")
@@ -958,11 +820,12 @@ class ServerSocket:
         utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
 
         api.friend.accept_friend(request["Data"]["Username"], client.get_data("username"), self.database)
-        client.send_response(rid, 200, "OK", {"Msg": "Friend request accepted.", "Friend_Information": api.friend.get_friend_information(request["Data"]["Username"], self.database, (request["Data"]["Username"] in self.logged_clients))})
+        client.send_response(rid, 200, "OK", {"Msg": "Friend request accepted.", "Friend_Information": api.friend.get_friend_information(request["Data"]["Username"], self.database, (request["Data"]["Username"] in self.sessions))})
         print("sent response")
 
-        if request["Data"]["Username"] in self.logged_clients:
-            self.logged_clients[request["Data"]["Username"]].push_notification("Friend_Request_Accepted", {"Username": client.get_data("username"), "New_Friend_List": api.friend.get_friend_list(request["Data"]["Username"], self.logged_clients, self.database)})
+        friend = self.sessions.get_client(request["Data"]["Username"])
+        if friend is not None:
+            friend.push_notification("Friend_Request_Accepted", {"Username": client.get_data("username"), "New_Friend_List": api.friend.get_friend_list(request["Data"]["Username"], self.sessions, self.database)})
 
         utils.server_print("Server", f"Request ({request_id}), Friend Request Accepted.")
 
@@ -970,20 +833,6 @@ class ServerSocket:
         """
         Reject friend request.
         """
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Reject Friend Request from " + str(
-                               client.address) + ".")
-
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
-            utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        if "Username" not in request["Data"]:
-            utils.server_print("Handler Error", f"Request ({request_id}), No username provided.")
-            client.send_response(rid, 400, "Bad Request", {"Msg": "No username provided."})
-            return
 
         information = api.account.get(request["Data"]["Username"], self.database)
 
@@ -993,7 +842,7 @@ class ServerSocket:
             return
 
         # check if the user sent a request already.
-        friend_list = api.friend.get_friend_list(client.get_data("username"), self.logged_clients, self.database)[1]
+        friend_list = api.friend.get_friend_list(client.get_data("username"), self.sessions, self.database)[1]
 
         if request["Data"]["Username"] not in friend_list:
             utils.server_print("Handler Error", f"Request ({request_id}), No Friend Request")
@@ -1011,32 +860,41 @@ class ServerSocket:
         """
         Get the friend list of the user.
         """
-        utils.server_print("Handler",
-                           f"Request ({request_id}), identified as Get Friend List from " + str(client.address) + ".")
 
-        # check if the token exists
-        if "Token" not in request or request["Token"] != client.get_data("token"):
+        friend_list = api.friend.get_friend_list(client.get_data("username"), self.sessions, self.database)
+        client.send_response(rid, 200, "OK", {"Msg": "Friend list retrieved.", "Friend_List": friend_list})
+
+    # -- User authentication --
+
+    def authenticate(self, client: Client, request: dict, rid: int, request_id: int) -> bool:
+        """
+        Check the token of the request against the session of the client, answer the client if it's invalid.
+        :param client: the client that sent the request.
+        :param request: the request.
+        :return: True if the request is authenticated, otherwise the error response was already sent.
+        """
+        if "Token" not in request:
             utils.server_print("Handler Error", f"Request ({request_id}), No Token provided.")
             client.send_response(rid, 400, "Bad Request", {"Msg": "No Token provided."})
-            return
-
-        utils.server_print("Handler", f"Request ({request_id}), Request passed all checks.")
+            return False
 
-        friend_list = api.friend.get_friend_list(client.get_data("username"), self.logged_clients, self.database)
-        client.send_response(rid, 200, "OK", {"Msg": "Friend list retrieved.", "Friend_List": friend_list})
+        if self.sessions.authenticate(client, request["Token"]) is None:
+            utils.server_print("Handler Error", f"Request ({request_id}), Invalid or expired Token.")
+            client.send_response(rid, 401, "Unauthorized", {"Msg": "Invalid or expired Token, login again."})
+            return False
 
-    # -- User authentication token generator --
+        return True
 
-    def generate_auth_token(self):
+    def expire_sessions(self) -> None:
         """
-        generate an auth token to the user.
+        Remove the expired sessions every SESSIONS_EXPIRE_INTERVAL seconds.
         """
-        token = "".join([random.choice(string.hexdigits) for _ in range(32)])
+        while True:
+            time.sleep(self.SESSIONS_EXPIRE_INTERVAL)
+            expired = self.sessions.expire()
 
-        while token in self.tokens:
-            token = "".join([random.choice(string.hexdigits) for _ in range(32)])
-
-        return token
+            if expired:
+                utils.server_print("Server", f"{expired} sessions expired.")
 
     # -- User Logout --
 
@@ -1046,24 +904,32 @@ class ServerSocket:
         :param client: The client to disconnect.
         """
 
-        # remove client, client token from list
-        self.clients.remove(client)
-        if client.get_data("token") is not None:
-            self.tokens.remove(client.get_data("token"))
-            api.account.update_logout(client.get_data("username"), self.database)
+        # remove the client and its session.
+        session = self.sessions.disconnect(client)
+        if session is not None:
+            api.account.update_logout(session.username, self.database)
 
         lobby = client.get_data("lobby_info")
         if lobby is not None:
-            role, success = lobby.remove_client(client)
-
-            if success:
-                utils.server_print("Lobby Manager", f"Removing {client.get_data('username')} from lobby {lobby.code}.")
+            lobby.call(self.leave_lobby, client, lobby)
 
-                for c in lobby.players + lobby.spectators:
-                    c.push_notification("User_Left_Lobby", {"Username": client.get_data("username"), "Role": role})
+        # stop the writer once the queued messages were sent, and close the connection.
+        client.stop()
+        client.connection.close()
 
         utils.server_print("Server", f"Client {client.get_data('username')} disconnected.")
 
+    def leave_lobby(self, client: Client, lobby: Lobby) -> None:
+        """
+        Remove a disconnected client from its lobby, runs on the mailbox of the lobby.
+        """
+        role, success = lobby.remove_client(client)
+
+        if success:
+            utils.server_print("Lobby Manager", f"Removing {client.get_data('username')} from lobby {lobby.code}.")
+
+            lobby.broadcast("User_Left_Lobby", {"Username": client.get_data("username"), "Role": role})
+
     # -- Server running status --
 
     def start_socket(self) -> None:
@@ -1071,26 +937,56 @@ class ServerSocket:
         Start the server socket for incoming connections.
         """
         # start listening for incoming connection from clients.
-        self.server_socket.listen()
+        self.server_socket.listen(self.LISTEN_BACKLOG)
+
+        if self.metrics_interval > 0:
+            threading.Thread(target=self.report_metrics, daemon=True).start()
+
+        threading.Thread(target=self.expire_sessions, daemon=True).start()
+        self.reaper.start()
 
         # set the running variable to true and start the main loop.
         self.__running = True
 
         utils.server_print("Status",
-                           f"Server is running on {self.address}:{self.port} using {'Official' if self.db_profile == 1 else 'Test'} db.")
+                           f"Server is running on {self.address}:{self.port} using {'Official' if self.db_profile == 1 else 'Test'} {self.db_backend} db.")
 
         self.run()
 
+    def report_metrics(self) -> None:
+        """
+        Print the server metrics every metrics_interval seconds.
+        """
+        while True:
+            time.sleep(self.metrics_interval)
+            utils.server_print("Metrics", self.metrics.report())
+
+    def start_pools(self) -> None:
+        """
+        Create the thread pools of the thread engine: the client handling, the key exchange and the requests.
+        The asyncio engine has its own run, so it doesn't start their threads.
+        """
+        if self.threadpool is not None:
+            return
+
+        self.threadpool = ThreadPool(self.MAX_CLIENTS)
+        self.handshake_pool = ThreadPool(self.HANDSHAKE_WORKERS)
+        self.request_pool = ThreadPool(self.REQUEST_WORKERS)
+
     def run(self) -> None:
         """
         Main loop of the server socket.
         """
+        self.start_pools()
+
         while self.__running:
             self.server_iteration()
 
     def stop(self) -> None:
         self.__running = False
         self.server_socket.close()
+        self.hashing.shutdown()
+        self.database.shutdown()
         utils.server_print("Server", "Server closed.")
 
     def toggle_status(self) -> None:
@@ -1115,6 +1011,41 @@ if __name__ == '__main__':
     parser.add_argument("--host", type=str, default="127.0.0.1", help="The host address of the server.")
     parser.add_argument("--port", type=int, default=8080, help="The port of the server.")
     parser.add_argument("--database", type=int, default=0, help="The database status.")
+    parser.add_argument("--commit-window", type=float, default=COMMIT_WINDOW * 1000, help="The time in ms the database waits for more changes to sync them together, 0 to sync the queued changes right away.")
+    parser.add_argument("--commit-batch", type=int, default=MAX_BATCH, help="The most changes the database syncs together.")
+    parser.add_argument("--flush-deadline", type=float, default=5, help="The time in ms push notifications may wait to be sent together, 0 to send right away.")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads", help="Serve the connections with a thread pool or with one asyncio event loop.")
+    parser.add_argument("--workers", type=int, default=32, help="The amount of handler threads of the asyncio engine.")
+    parser.add_argument("--metrics-interval", type=float, default=60, help="The time in seconds between the metrics reports, 0 to disable them.")
+    parser.add_argument("--compression-threshold", type=int, default=Compression.DEFAULT_THRESHOLD, help="The size in bytes from which messages are compressed.")
+    parser.add_argument("--transport", choices=Transport.TRANSPORTS, default=Transport.CUSTOM, help="Secure the connections with the rsa key exchange or with tls.")
+    parser.add_argument("--certfile", type=str, default="cert.pem", help="The pem certificate of the tls transport.")
+    parser.add_argument("--keyfile", type=str, default="key.pem", help="The pem private key of the tls transport.")
+    parser.add_argument("--hashing-workers", type=int, default=None, help="The amount of bcrypt hashing processes, the amount of cores by default.")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL, help="The time in seconds a connection may be silent before it's pinged, 0 to disable the heartbeat.")
+    parser.add_argument("--heartbeat-timeout", type=float, default=HEARTBEAT_TIMEOUT, help="The time in seconds a connection may be silent before it's disconnected.")
     args = parser.parse_args()
-    server = ServerSocket(args.host, args.port, args.database)
+
+    # the storage of the database is server.database.type of project.json, for every profile.
+    db_backend = configured_backend()
+
+    tls_context = None
+    if args.transport == Transport.TLS:
+        tls_context = Transport.server_context(args.certfile, args.keyfile)
+
+    if args.engine == "asyncio":
+        from AsyncServer import AsyncServerSocket
+        server = AsyncServerSocket(args.host, args.port, args.database, args.flush_deadline / 1000, args.metrics_interval,
+                                   args.compression_threshold, args.workers, tls_context, args.hashing_workers,
+                                   args.heartbeat_interval, args.heartbeat_timeout, db_backend,
+                                   args.commit_window / 1000, args.commit_batch)
+    else:
+        server = ServerSocket(args.host, args.port, args.database, args.flush_deadline / 1000, args.metrics_interval,
+                              args.compression_threshold, tls_context, args.hashing_workers, args.heartbeat_interval,
+                              args.heartbeat_timeout, db_backend, args.commit_window / 1000,
+                              args.commit_batch)
+
+    # exit normally on a terminate signal too, so the database writes its changed collections (atexit).
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     server.start_socket()
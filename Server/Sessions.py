@@ -0,0 +1,177 @@
+import secrets
+import threading
+import time
+
+# the bytes of randomness of a token, sent as 32 hex characters.
+TOKEN_BYTES = 16
+
+# the time in seconds a session lives without any authenticated request.
+SESSION_TIMEOUT = 2 * 60 * 60
+
+
+class Session:
+    __slots__ = ("token", "username", "client", "expires")
+
+    def __init__(self, token: str, username: str, client, expires: float):
+        """
+        The login of one user on one connection.
+        :param token: the auth token of the session.
+        :param username: the username of the user.
+        :param client: the client interface of the connection.
+        :param expires: the time (time.monotonic) the session expires if it isn't used.
+        """
+        self.token = token
+        self.username = username
+        self.client = client
+        self.expires = expires
+
+
+class SessionRegistry:
+    def __init__(self, timeout: float = SESSION_TIMEOUT):
+        """
+        The connected clients and the sessions of the logged in users, indexed by token, by username and by
+        connection, so every lookup and removal is O(1). Thread safe, the handlers of all the clients use it.
+        A user has at most one session, logging in again (from any connection) replaces the old session.
+        :param timeout: the time in seconds a session lives without any authenticated request.
+        """
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+        # token: session
+        self.by_token = {}
+
+        # username: session
+        self.by_username = {}
+
+        # client: its session, None while the client isn't logged in.
+        self.by_client = {}
+
+    def connect(self, client) -> None:
+        """
+        Add a new connection, not logged in yet.
+        :param client: the client interface of the connection.
+        """
+        with self.lock:
+            self.by_client[client] = None
+
+    def login(self, client, username: str) -> str:
+        """
+        Create a session for the user on the connection.
+        :param client: the client interface of the connection.
+        :param username: the username the client logged in (or registered) with.
+        :return: the auth token of the new session.
+        """
+        with self.lock:
+            # the old session of the user and the old session of the connection are replaced.
+            self.remove(self.by_username.get(username))
+            self.remove(self.by_client.get(client))
+
+            token = secrets.token_hex(TOKEN_BYTES)
+            while token in self.by_token:
+                token = secrets.token_hex(TOKEN_BYTES)
+
+            session = Session(token, username, client, time.monotonic() + self.timeout)
+
+            self.by_token[token] = session
+            self.by_username[username] = session
+            self.by_client[client] = session
+
+            return token
+
+    def authenticate(self, client, token: str) -> Session or None:
+        """
+        Check the token of a request and extend its session.
+        :param client: the client interface the request came from.
+        :param token: the token of the request.
+        :return: the session, None if the token isn't of the connection or the session expired.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            session = self.by_token.get(token)
+
+            if session is None or session.client is not client:
+                return None
+
+            if session.expires < now:
+                self.remove(session)
+                return None
+
+            session.expires = now + self.timeout
+
+            return session
+
+    def get_client(self, username: str):
+        """
+        :param username: the username of the user.
+        :return: the client interface the user is logged in from, None if the user isn't logged in.
+        """
+        session = self.by_username.get(username)
+
+        return session.client if session is not None else None
+
+    def get_session(self, client) -> Session or None:
+        """
+        :param client: the client interface of the connection.
+        :return: the session of the connection, None if the client isn't logged in.
+        """
+        return self.by_client.get(client)
+
+    def clients(self) -> list:
+        """
+        :return: the connected clients, logged in or not, a copy that may be iterated without the lock.
+        """
+        with self.lock:
+            return list(self.by_client)
+
+    def disconnect(self, client) -> Session or None:
+        """
+        Remove the connection and its session.
+        :param client: the client interface of the connection.
+        :return: the session the connection had, None if the client wasn't logged in.
+        """
+        with self.lock:
+            session = self.by_client.pop(client, None)
+            self.remove(session)
+
+            return session
+
+    def expire(self) -> int:
+        """
+        Remove the sessions that weren't used for the timeout, their clients stay connected but logged out.
+        :return: the amount of removed sessions.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            expired = [session for session in self.by_token.values() if session.expires < now]
+
+            for session in expired:
+                self.remove(session)
+
+            return len(expired)
+
+    def remove(self, session: Session or None) -> None:
+        """
+        Remove a session from all the indexes, called with the lock held.
+        """
+        if session is None or self.by_token.get(session.token) is not session:
+            return
+
+        del self.by_token[session.token]
+        del self.by_username[session.username]
+
+        if session.client in self.by_client:
+            self.by_client[session.client] = None
+
+    def __contains__(self, username: str) -> bool:
+        """
+        :return: True if the user is logged in, so the registry can be used where a dict of logged users was.
+        """
+        return username in self.by_username
+
+    def __len__(self) -> int:
+        """
+        :return: the amount of sessions.
+        """
+        return len(self.by_token)
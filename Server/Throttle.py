@@ -0,0 +1,88 @@
+import collections
+import threading
+import time
+
+# the failed attempts an address may have in the window before it's throttled.
+MAX_FAILURES = 5
+
+# the time in seconds the failed attempts are remembered.
+WINDOW = 60
+
+# the amount of addresses from which the expired ones are cleaned up.
+CLEANUP_SIZE = 10000
+
+
+class FailureThrottle:
+    def __init__(self, max_failures: int = MAX_FAILURES, window: float = WINDOW):
+        """
+        Count the failed attempts (wrong passwords) of every address, an address with max_failures failures
+        in the last window seconds is throttled until its oldest failure expires.
+        Checked before the password is hashed, so a throttled address costs no bcrypt.
+        :param max_failures: the failed attempts an address may have in the window.
+        :param window: the time in seconds a failed attempt counts.
+        """
+        self.max_failures = max_failures
+        self.window = window
+
+        self.lock = threading.Lock()
+
+        # address: the times (time.monotonic) of its recent failures.
+        self.failures = {}
+
+    def blocked(self, address: str) -> bool:
+        """
+        :param address: the ip address of the client.
+        :return: True if the address has too many recent failures.
+        """
+        with self.lock:
+            failures = self.failures.get(address)
+
+            if failures is None:
+                return False
+
+            self.expire(failures, time.monotonic())
+
+            if not failures:
+                del self.failures[address]
+                return False
+
+            return len(failures) >= self.max_failures
+
+    def record_failure(self, address: str) -> None:
+        """
+        Count a failed attempt of the address.
+        :param address: the ip address of the client.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            if address not in self.failures and len(self.failures) >= CLEANUP_SIZE:
+                self.cleanup(now)
+
+            failures = self.failures.setdefault(address, collections.deque(maxlen=self.max_failures))
+            failures.append(now)
+
+    def reset(self, address: str) -> None:
+        """
+        Forget the failures of the address, after a successful attempt.
+        :param address: the ip address of the client.
+        """
+        with self.lock:
+            self.failures.pop(address, None)
+
+    def expire(self, failures: collections.deque, now: float) -> None:
+        """
+        Remove the failures that are older than the window, called with the lock held.
+        """
+        while failures and now - failures[0] > self.window:
+            failures.popleft()
+
+    def cleanup(self, now: float) -> None:
+        """
+        Remove the addresses without recent failures, called with the lock held.
+        """
+        for address in list(self.failures):
+            self.expire(self.failures[address], now)
+
+            if not self.failures[address]:
+                del self.failures[address]
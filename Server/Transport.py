@@ -0,0 +1,200 @@
+"""
+The tls transport, the standard replacement of the rsa key exchange (see CommsProtocol.md).
+The connection is encrypted by tls with an ecdhe key exchange, and the messages are sent on it as they are.
+A client that reconnects offers the session ticket of its last connection, so it resumes without the certificate
+and the signature, in one round trip.
+Run to create a self-signed certificate: python Server/Transport.py cert.pem key.pem [host ...]
+"""
+import datetime
+import ipaddress
+import socket
+import ssl
+import sys
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+# the rsa key exchange of the original protocol.
+CUSTOM = "custom"
+TLS = "tls"
+
+TRANSPORTS = (CUSTOM, TLS)
+
+# the tls 1.2 suites, only ecdhe ones (tls 1.3 always uses an ephemeral key exchange).
+TLS12_CIPHERS = "ECDHE+AESGCM:ECDHE+CHACHA20"
+
+# the hosts of a certificate created without any.
+DEFAULT_HOSTS = ("localhost", "127.0.0.1")
+
+CERTIFICATE_DAYS = 365
+
+# the session tickets the server sends on every handshake.
+SESSION_TICKETS = 1
+
+# the tcp keepalive of the connections, a dead peer is found after idle + interval * count seconds.
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+def server_context(certfile: str, keyfile: str) -> ssl.SSLContext:
+    """
+    Create the tls context of the server.
+    The session tickets are encrypted with a key of the context, so all the connections must use the same context.
+    :param certfile: the pem certificate (chain) of the server.
+    :param keyfile: the pem private key of the certificate.
+    :return: the server context.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.set_ciphers(TLS12_CIPHERS)
+    context.load_cert_chain(certfile, keyfile)
+
+    # session tickets are on by default, make sure nobody turned them off.
+    context.options &= ~ssl.OP_NO_TICKET
+
+    # the client keeps one session per server, one ticket is enough.
+    context.num_tickets = SESSION_TICKETS
+
+    return context
+
+
+def client_context(cafile: str = None) -> ssl.SSLContext:
+    """
+    Create the tls context of the client, it verifies the certificate and the host name of the server.
+    :param cafile: the certificate to trust (a self-signed server certificate), None for the system certificates.
+    :return: the client context.
+    """
+    context = ssl.create_default_context(cafile=cafile)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+
+    return context
+
+
+def set_no_delay(connection: socket.socket) -> None:
+    """
+    Send small writes right away on a connection that will be wrapped with tls.
+    The handshake, the session ticket and the first message are small writes one after the other,
+    with nagle the second one waits for the delayed ack of the first (about 40ms).
+    :param connection: the tcp connection.
+    """
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def set_keepalive(connection: socket.socket, idle: int = KEEPALIVE_IDLE, interval: int = KEEPALIVE_INTERVAL,
+                  count: int = KEEPALIVE_COUNT) -> None:
+    """
+    Let the kernel probe an idle connection, so a peer that is gone without closing the connection
+    (a crash, a lost network) fails the blocking read instead of holding it forever.
+    The heartbeat does this for clients that negotiate it, the keepalive covers the clients that can't (legacy).
+    :param connection: the tcp connection.
+    :param idle: the idle time in seconds before the first probe.
+    :param interval: the time in seconds between the probes.
+    :param count: the unanswered probes after which the connection is dropped.
+    """
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # the timing options aren't on every platform, the system defaults (hours) are used where they're missing.
+    for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, option):
+            connection.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class Connector:
+    def __init__(self, context: ssl.SSLContext):
+        """
+        Open tls connections and keep the last session of every server, so a reconnect resumes it.
+        A session can only be resumed with the context that created it, so keep one connector for the process.
+        :param context: the client context.
+        """
+        self.context = context
+
+        # address: the last session of the server.
+        self.sessions = {}
+
+    def connect(self, address: tuple, server_name: str = None, timeout: float = None) -> ssl.SSLSocket:
+        """
+        Connect to the server and complete the tls handshake, resuming the last session if there is one.
+        :param address: the (host, port) of the server.
+        :param server_name: the name the certificate must have, the host by default.
+        :param timeout: the time in seconds for the connection and the handshake, None to wait forever.
+        :return: the tls connection.
+        """
+        connection = socket.create_connection(address, timeout)
+        set_no_delay(connection)
+
+        try:
+            connection = self.context.wrap_socket(connection, server_hostname=server_name or address[0],
+                                                  session=self.sessions.get(address))
+        except Exception:
+            connection.close()
+            raise
+
+        connection.settimeout(None)
+
+        return connection
+
+    def save_session(self, connection: ssl.SSLSocket, address: tuple) -> None:
+        """
+        Keep the session of the connection for the next connect.
+        On tls 1.3 the ticket arrives after the handshake, so call it once something was read from the server.
+        :param connection: the tls connection.
+        :param address: the (host, port) of the server.
+        """
+        if connection.session is not None and connection.session.has_ticket:
+            self.sessions[address] = connection.session
+
+
+def create_certificate(certfile: str, keyfile: str, hosts: tuple = DEFAULT_HOSTS) -> None:
+    """
+    Create a self-signed certificate, for tests and for servers that give it to their clients to trust.
+    The key is ecdsa p-256, it's much faster to sign with than rsa.
+    :param certfile: the path of the pem certificate.
+    :param keyfile: the path of the pem private key.
+    :param hosts: the host names and ip addresses of the server.
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hosts[0])])
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    names = []
+    for host in hosts:
+        try:
+            names.append(x509.IPAddress(ipaddress.ip_address(host)))
+        except ValueError:
+            names.append(x509.DNSName(host))
+
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=CERTIFICATE_DAYS))
+        .add_extension(x509.SubjectAlternativeName(names), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+        .add_extension(x509.KeyUsage(digital_signature=True, key_cert_sign=True, content_commitment=False,
+                                     key_encipherment=False, data_encipherment=False, key_agreement=False,
+                                     crl_sign=False, encipher_only=False, decipher_only=False), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+
+    with open(keyfile, 'wb') as file:
+        file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                     serialization.NoEncryption()))
+
+    with open(certfile, 'wb') as file:
+        file.write(certificate.public_bytes(serialization.Encoding.PEM))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("Usage: python Server/Transport.py cert.pem key.pem [host ...]")
+        sys.exit(1)
+
+    create_certificate(sys.argv[1], sys.argv[2], tuple(sys.argv[3:]) or DEFAULT_HOSTS)
+    print(f"Created {sys.argv[1]} and {sys.argv[2]}.")
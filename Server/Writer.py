@@ -0,0 +1,190 @@
+import collections
+import threading
+import time
+
+import utils
+
+# push notifications that only carry the latest state, a queued one is replaced by a newer one.
+SUPERSEDED_UPDATES = {"Leaderboard"}
+
+# the amount of queued messages a client may have before it counts as over the limit.
+MAX_QUEUE = 256
+
+# the time in seconds a client may stay over the limit before it's disconnected.
+OVER_LIMIT_TIMEOUT = 5
+
+# the time in seconds a graceful close waits for the queued messages to be sent.
+DRAIN_TIMEOUT = 1
+
+
+class Writer:
+    def __init__(self, deadline: float = 0, max_queue: int = MAX_QUEUE, over_limit_timeout: float = OVER_LIMIT_TIMEOUT):
+        """
+        The writer of one connection, the only one that encrypts and sends to the client.
+        Any thread may queue a message without blocking, the writer thread sends the queue,
+        so a slow client only blocks its own writer.
+        Responses are sent right away, push notifications wait for the flush deadline and are sent together.
+        :param deadline: the time in seconds a push notification may wait to be sent with the next messages.
+        :param max_queue: the amount of queued messages over which the client is too slow.
+        :param over_limit_timeout: the time in seconds the client may stay over max_queue before it's disconnected,
+        a client that reaches 4 times max_queue is disconnected right away.
+        """
+        self.deadline = deadline
+        self.max_queue = max_queue
+        self.over_limit_timeout = over_limit_timeout
+        self.client = None
+
+        # (queued time, message type, update, message, flags)
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+
+        # a response is queued, send without waiting for the deadline.
+        self.urgent = False
+
+        # the time the queue went over max_queue, None while it's under.
+        self.over_limit_since = None
+        self.closed = False
+
+        # the writer took messages and didn't finish sending them yet.
+        self.sending = False
+
+    def start(self, client) -> None:
+        """
+        Start writing to the client.
+        :param client: the client interface of the connection.
+        """
+        self.client = client
+
+        # create the thread, ensures the thread exits when the main program exits.
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def put(self, message_type: int, message: bytes, flags: int = 0, urgent: bool = True, update: str = None) -> bool:
+        """
+        Queue a message to the client, never blocks on the connection.
+        :param message_type: the type of the message (RESPONSE or PUSH_NOTIFICATION).
+        :param message: the plain message.
+        :param flags: the flags of the frame.
+        :param urgent: send the queue now (responses), instead of waiting for the flush deadline.
+        :param update: the update type of a push notification, a newer one replaces a queued one (see SUPERSEDED_UPDATES).
+        :return: False if the writer is closed or the client was disconnected for being too slow.
+        """
+        now = time.monotonic()
+
+        with self.condition:
+            if self.closed:
+                return False
+
+            if update in SUPERSEDED_UPDATES:
+                # drop the stale update, the client only needs the newest one.
+                for entry in self.queue:
+                    if entry[2] == update:
+                        self.queue.remove(entry)
+                        break
+
+            self.queue.append((now, message_type, update, message, flags))
+            self.urgent = self.urgent or urgent
+
+            if len(self.queue) > self.max_queue:
+                if self.over_limit_since is None:
+                    self.over_limit_since = now
+
+                if len(self.queue) > self.max_queue * 4 or now - self.over_limit_since > self.over_limit_timeout:
+                    self.overflow()
+                    return False
+
+            self.notify()
+
+        return True
+
+    def notify(self) -> None:
+        """
+        Wake the writer, and a close waiting for the queue, called with the condition held.
+        """
+        self.condition.notify_all()
+
+    def take(self) -> (list, float):
+        """
+        Take the messages that should be sent now, called with the condition held.
+        :return: the messages (message type, message, flags) and the time to wait if nothing should be sent yet.
+        """
+        if not self.queue:
+            return [], None
+
+        if not self.urgent and self.deadline > 0:
+            remaining = self.queue[0][0] + self.deadline - time.monotonic()
+
+            if remaining > 0:
+                return [], remaining
+
+        messages = [(message_type, message, flags) for _, message_type, _, message, flags in self.queue]
+        self.queue.clear()
+        self.urgent = False
+        self.over_limit_since = None
+        self.sending = True
+
+        return messages, None
+
+    def sent(self) -> None:
+        """
+        The messages the writer took were sent, wake a close waiting for them.
+        """
+        with self.condition:
+            self.sending = False
+            self.condition.notify_all()
+
+    def worker(self) -> None:
+        """
+        Wait for queued messages and send them to the client.
+        """
+        while True:
+            with self.condition:
+                messages, wait = self.take()
+
+                while not messages and not self.closed:
+                    self.condition.wait(wait)
+                    messages, wait = self.take()
+
+                if self.closed:
+                    return
+
+            try:
+                for parts in self.client.seal_messages(messages):
+                    self.client.write(parts)
+
+                self.sent()
+
+            except Exception as e:
+                utils.server_print("Writer", f"Client {self.client.address} write failed: {e}")
+                self.close()
+                self.client.abort()
+                return
+
+    def overflow(self) -> None:
+        """
+        Disconnect a client that can't keep up with its messages, called with the condition held.
+        """
+        utils.server_print("Writer", f"Client {self.client.address} is too slow ({len(self.queue)} queued messages), disconnecting.")
+        self.closed = True
+        self.queue.clear()
+        self.notify()
+        self.client.abort()
+
+    def close(self, timeout: float = 0) -> None:
+        """
+        Stop the writer.
+        :param timeout: the time in seconds to wait for the queued messages to be sent (a graceful close, the last
+        response of a client may still be queued), the messages that weren't sent by then are dropped.
+        """
+        with self.condition:
+            if timeout > 0 and not self.closed:
+                self.urgent = True
+                self.notify()
+
+                end = time.monotonic() + timeout
+
+                while (self.queue or self.sending) and not self.closed and time.monotonic() < end:
+                    self.condition.wait(end - time.monotonic())
+
+            self.closed = True
+            self.queue.clear()
+            self.notify()
@@ -0,0 +1,224 @@
+"""
+The recovery of the json database journal: a final line cut by a crash, an unreadable line in the middle,
+a failed journal write (and a batch with another journal), an interrupted compaction (a .1 journal next to the journal) and a journal replayed over
+a snapshot that already has some of its changes.
+Every check runs in its own temporary directory.
+Run from the repository root: python Server/test_journal.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Server.Database.Database import Database
+
+
+def line(key: str, record: dict) -> bytes:
+    """
+    :return: a journal line, the way Database.journal writes it.
+    """
+    return (json.dumps({"Key": key, "Record": record}) + "\n").encode()
+
+
+def create_collection(snapshot: dict, journal: bytes = b"", moved: bytes = None) -> (str, str):
+    """
+    Write the Users collection of the tests profile in the current directory.
+    :param snapshot: the content of Users.json.
+    :param journal: the content of Users.journal.
+    :param moved: the content of Users.journal.1, None for no such file.
+    :return: the path of the snapshot and the path of the journal.
+    """
+    path = Database.path("Tests", "Users")
+    journal_path = Database.journal_path("Tests", "Users")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as f:
+        f.write(json.dumps(snapshot))
+
+    with open(journal_path, "wb") as f:
+        f.write(journal)
+
+    if moved is not None:
+        with open(journal_path + ".1", "wb") as f:
+            f.write(moved)
+
+    return path, journal_path
+
+
+def cut_final_line() -> None:
+    """
+    A crash mid-append leaves a cut last line, the lines before it are replayed and the cut line is truncated,
+    so the next line isn't appended to it.
+    """
+    valid = line("u0", {"n": 1}) + line("u0", {"n": 2})
+    _, journal_path = create_collection({"u0": {"n": 0}}, valid + b'{"Key": "u0", "Rec')
+
+    database = Database(0, flush_interval=0)
+    assert database.get("Users", "u0") == {"n": 2}
+    assert os.path.getsize(journal_path) == len(valid)
+
+    assert database.increment("Users", "u0", {"n": 1})
+    database.shutdown()
+
+    # the journal is small, so the shutdown didn't compact it and the restart replays it.
+    restarted = Database(0, flush_interval=0)
+    assert restarted.get("Users", "u0") == {"n": 3}
+    assert os.path.getsize(journal_path) > len(valid)
+
+    restarted.shutdown()
+
+
+def unreadable_line() -> None:
+    """
+    An unreadable line before the last one isn't a crash cut, it's skipped and the lines after it are replayed.
+    """
+    journal = line("u0", {"n": 1}) + b'{"Key": "u0", "Re\n' + b'{"Key": "u0"}\n' + line("u0", {"n": 2})
+    _, journal_path = create_collection({"u0": {"n": 0}}, journal)
+
+    database = Database(0, flush_interval=0)
+    assert database.get("Users", "u0") == {"n": 2}
+    assert os.path.getsize(journal_path) == len(journal)
+
+    database.shutdown()
+
+
+def failed_write() -> None:
+    """
+    A journal write that fails after a part of it was written is truncated, and its lines are written again with
+    the next write, so the journal has no partly written line in the middle.
+    """
+    _, journal_path = create_collection({"u0": {"n": 0}})
+    database = Database(0, flush_interval=0)
+    database.get("Users", "u0")
+
+    fsync = os.fsync
+
+    def failing_fsync(fd):
+        os.fsync = fsync
+        raise OSError("fsync failed")
+
+    os.fsync = failing_fsync
+
+    try:
+        database.increment("Users", "u0", {"n": 1})
+        raise AssertionError("The failed write wasn't reported.")
+    except OSError:
+        pass
+    finally:
+        os.fsync = fsync
+
+    assert os.path.getsize(journal_path) == 0
+
+    # the failed change is in memory, and it's written with the next one (at least once).
+    assert database.increment("Users", "u0", {"n": 1})
+    database.shutdown()
+
+    with open(journal_path, "rb") as f:
+        assert f.read() == line("u0", {"n": 1}) + line("u0", {"n": 2})
+
+    restarted = Database(0, flush_interval=0)
+    assert restarted.get("Users", "u0") == {"n": 2}
+    restarted.shutdown()
+
+
+def failed_journal_of_batch() -> None:
+    """
+    A batch with the changes of two collections, only the changes of the journal that couldn't be written fail.
+    """
+    create_collection({"u0": {"n": 0}})
+
+    with open(Database.path("Tests", "Games"), "w") as f:
+        f.write(json.dumps({"g0": {"n": 0}}))
+
+    database = Database(0, flush_interval=0, commit_window=0.2)
+    database.get("Users", "u0")
+    database.get("Games", "g0")
+
+    fsync = os.fsync
+
+    def failing_fsync(fd):
+        users_journal = database.journals.get("Users")
+
+        if users_journal is not None and fd == users_journal.fileno():
+            raise OSError("fsync failed")
+
+        fsync(fd)
+
+    os.fsync = failing_fsync
+
+    try:
+        users = database.increment_future("Users", "u0", {"n": 1})
+        games = database.increment_future("Games", "g0", {"n": 1})
+
+        assert games.result()
+        assert isinstance(users.exception(), OSError)
+    finally:
+        os.fsync = fsync
+
+    database.shutdown()
+
+
+def interrupted_compaction() -> None:
+    """
+    A crash after the journal was moved aside (.1) and before the snapshot was written, the lines of .1 are
+    replayed first and the lines of the new journal after them.
+    """
+    moved = line("u0", {"n": 1}) + line("u1", {"n": 5})
+    journal = line("u0", {"n": 2})
+    path, journal_path = create_collection({"u0": {"n": 0}, "u1": {"n": 0}}, journal, moved)
+
+    database = Database(0, flush_interval=0)
+    assert database.get("Users", "u0") == {"n": 2}
+    assert database.get("Users", "u1") == {"n": 5}
+
+    # the next compaction covers both journals and removes them.
+    assert database.compact("Users")
+    assert not os.path.exists(journal_path) and not os.path.exists(journal_path + ".1")
+
+    with open(path, "r") as f:
+        assert json.load(f) == {"u0": {"n": 2}, "u1": {"n": 5}}
+
+    database.shutdown()
+
+
+def replay_over_snapshot() -> None:
+    """
+    A crash after the snapshot was written and before the journal it covers was removed, replaying the lines the
+    snapshot already has sets the same records again, and the records the journal doesn't have are kept.
+    """
+    snapshot = {"u0": {"n": 2, "friends": ["u1"]}, "u1": {"n": 1, "friends": ["u0"]}, "u2": {"n": 7, "friends": []}}
+    moved = line("u0", {"n": 1, "friends": []}) + line("u0", {"n": 2, "friends": ["u1"]}) + line("u1", {"n": 1, "friends": ["u0"]})
+    create_collection(snapshot, line("u2", {"n": 8, "friends": []}), moved)
+
+    database = Database(0, flush_interval=0)
+    assert database.get("Users", "u0") == snapshot["u0"]
+    assert database.get("Users", "u1") == snapshot["u1"]
+    assert database.get("Users", "u2") == {"n": 8, "friends": []}
+    assert len(database.submit_read("Users")) == 3
+
+    database.shutdown()
+
+
+CHECKS = [cut_final_line, unreadable_line, failed_write, failed_journal_of_batch, interrupted_compaction,
+          replay_over_snapshot]
+
+
+def main():
+    cwd = os.getcwd()
+
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+
+            try:
+                check()
+            finally:
+                os.chdir(cwd)
+
+        print(f"{check.__name__}: ok")
+
+
+if __name__ == '__main__':
+    main()